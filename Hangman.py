@@ -1,40 +1,105 @@
 
 import asyncio
-import json
+import atexit
+import hashlib
+import hmac
+import os
 import random
-from datetime import date, datetime, timedelta
-from operator import itemgetter
+import signal
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta
 
 from hydrogram import Client, filters, idle
-from hydrogram.errors import FloodWait, MessageNotModified
+from hydrogram.errors import MessageNotModified
 from hydrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 
 from config import API_HASH, API_ID, BOT_TOKEN_HANGMAN, BOT_TOKEN_TEST
-from word_list import WORDS
+from callbacks import (
+    CATEGORY, CONFIG, CONFIRM_RESET, DAILY, DIFFICULTY, GUESS, HINT, LEADERBOARD, PLAY_AGAIN, SET_EMOJI,
+    SET_EMOJI_LEGACY, STATS, USED, decode_callback, encode_callback
+)
+from daily import DailyChallengeState
+from event_log import Aggregator, EventLog, GameOutcome
+from game_state import GameState
+from game_store import KeyedLocks, open_game_store
+from keyboards import KeyboardCache
+from leaderboards import TopK
+from metrics import Gauge, handler_seconds, instrument_client, monitor_loop_lag, serve as serve_metrics, summary as metrics_summary, timed
+from outbox import outbox
+from persistence import WriteBehindStore, flush_all_sync, run_io
+from player_cache import PlayerCache
+from profiler import collect as collect_profile, start as start_profiler
+from reaper import gather_bounded
+from storage import open_storage
+from traces import TraceRecorder
+from word_index import ALL_LETTERS_MASK, CATEGORIES, DIFFICULTIES, LETTER_BITS, WORD_TABLE, count_letters, letters_in, letters_mask, random_entry
   
 
-app = Client("hangman_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN_HANGMAN)
+# Set by shard.py in worker processes: updates arrive from the ingress process,
+# so a worker's client only sends.
+SHARD_INDEX = os.getenv("HANGMAN_SHARD_INDEX")
+
+if SHARD_INDEX is None:
+    app = Client("hangman_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN_HANGMAN)
+else:
+    app = Client(f"hangman_bot_shard{SHARD_INDEX}", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN_HANGMAN, no_updates=True)
+instrument_client(app)
+
+# Telegram user ids allowed to use /botstats.
+ADMINS = {int(user_id) for user_id in os.getenv("HANGMAN_ADMINS", "").replace(",", " ").split()}
+# Prometheus metrics are served on 127.0.0.1 when set; shard workers use the
+# following ports, one each.
+METRICS_PORT = int(os.getenv("HANGMAN_METRICS_PORT", "0"))
+if METRICS_PORT and SHARD_INDEX is not None:
+    METRICS_PORT += 1 + int(SHARD_INDEX)
+# Profiles taken with /profile or SIGUSR1 are written here.
+PROFILE_DIR = os.getenv("HANGMAN_PROFILE_DIR", "profiles")
+DEFAULT_PROFILE_SECONDS = 30
+MAX_PROFILE_SECONDS = 600
+# Incoming updates are recorded, anonymized, to this file when set (see
+# traces.py). In sharded mode the ingress process records them instead.
+TRACE_PATH = os.getenv("HANGMAN_TRACE")
+trace_recorder = TraceRecorder(TRACE_PATH) if TRACE_PATH and SHARD_INDEX is None else None
 
-games = {}
-player_stats = {}
 daily_challenges = {}
 leaderboard = {}
-game_activity = {}
+
+INACTIVE_GAME_TIMEOUT = 180
+MAX_CONCURRENT_DELETES = 8
+# Finished games are appended to segmented files under HANGMAN_EVENT_LOG, one
+# subdirectory per worker in sharded mode.
+event_log_dir = os.getenv("HANGMAN_EVENT_LOG", "events")
+if SHARD_INDEX is not None:
+    event_log_dir = os.path.join(event_log_dir, f"shard{SHARD_INDEX}")
+event_log = EventLog(event_log_dir)
+game_store = open_game_store(
+    INACTIVE_GAME_TIMEOUT,
+    snapshot_path=f"games.shard{SHARD_INDEX}.snapshot" if SHARD_INDEX is not None else None
+)
+keyboard_cache = KeyboardCache()
 
 last_pressed_button = None
 
+storage = open_storage()
+
 
 def load_user_configs():
-    try:
-        with open('users_config.json', 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+    # A copy of what storage holds: configs are written back through
+    # user_configs_store only, on the I/O thread.
+    return storage.load_configs()
+
+def serialize_user_config(user_id):
+    config = user_configs.get(user_id)
+    if config is None:
+        return None
+    return {config_type: list(emojis) for config_type, emojis in config.items()}
 
-def save_user_configs(configs):
-    with open('users_config.json', 'w') as f:
-        json.dump(configs, f, indent=4)
+user_configs_store = WriteBehindStore("user_configs", serialize_user_config, storage.write_configs, interval=2.0)
+
+async def save_user_config(user_id):
+    await user_configs_store.save(user_id)
 
 user_configs = load_user_configs()
 
@@ -76,236 +141,211 @@ emoji_options = {
 
 
 
-def load_daily_challenges():
-    try:
-        with open('daily_challenges.json', 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
-
-def save_daily_challenges(daily_challenges):
-    with open('daily_challenges.json', 'w') as f:
-        json.dump(daily_challenges, f, indent=4)
-
-def can_play_daily_challenge(user_id):
-    daily_challenges = load_daily_challenges()
-    today = date.today().isoformat()
-    
-    if user_id not in daily_challenges or daily_challenges[user_id]['last_played'] != today:
-        daily_challenges[user_id] = {'last_played': today, 'score': 0}
-        save_daily_challenges(daily_challenges)
-        return True
-    return False
+daily_state = DailyChallengeState(storage)
+
+async def can_play_daily_challenge(user_id):
+    if not daily_state.can_play(user_id):
+        return False
+    bump_leaderboards(user_id)
+    await daily_state.store.save(user_id)
+    return True
 
 def update_daily_challenge_score(user_id, score):
-    daily_challenges = load_daily_challenges()
-    today = date.today().isoformat()
-    
-    if user_id not in daily_challenges:
-        daily_challenges[user_id] = {
-            'last_played': today,
-            'score': score,
-            'total_score': score,
-            'streak': 1
-        }
-    else:
-        user_data = daily_challenges[user_id]
-        if 'total_score' not in user_data:
-            user_data['total_score'] = user_data['score']  
-        if 'streak' not in user_data:
-            user_data['streak'] = 1  
-        
-        if user_data['last_played'] == today:
-            if score > user_data['score']:
-                user_data['total_score'] += score - user_data['score']
-                user_data['score'] = score
-        else:
-            yesterday = (date.today() - timedelta(days=1)).isoformat()
-            if user_data['last_played'] == yesterday:
-                user_data['streak'] += 1
-            else:
-                user_data['streak'] = 1
-            user_data['last_played'] = today
-            user_data['score'] = score
-            user_data['total_score'] += score
-    
-    save_daily_challenges(daily_challenges)
-    return daily_challenges[user_id]['score'], daily_challenges[user_id]['streak']
+    result = daily_state.update_score(user_id, score)
+    bump_leaderboards(user_id)
+    return result
 
 def get_daily_challenge_leaderboard():
-    daily_challenges = load_daily_challenges()
-    today = date.today().isoformat()
-    
-    leaderboard = [(user_id, data['total_score'], data['streak']) 
-                   for user_id, data in daily_challenges.items() 
-                   if data['last_played'] == today]
-    return sorted(leaderboard, key=lambda x: (x[1], x[2]), reverse=True)[:10]
-
-
-
-def save_player_stats():
-    with open('player_stats.json', 'w') as f:
-        serializable_stats = {
-            user_id: {
-                **stats,
-                "achievements": list(stats["achievements"]),
-                "last_played": stats["last_played"].isoformat() if stats["last_played"] else None
-            }
-            for user_id, stats in player_stats.items()
-        }
-        json.dump(serializable_stats, f, indent=4)
-
-def update_player_name(user_id, new_name):
-    if user_id in player_stats:
-        player_stats[user_id]["name"] = new_name
-        save_player_stats()
+    return daily_state.leaderboard()
+
+
+
+def serialize_player_stats(user_id):
+    # Encoded straight from the live record, on the event loop, so the
+    # writer thread only ever sees immutable values.
+    stats = player_stats.peek(user_id)
+    if stats is None:
+        return None
+    return storage.encode_player(stats)
+
+player_stats_store = WriteBehindStore("player_stats", serialize_player_stats, storage.write_players)
+# Players are read from storage when first needed; at most
+# HANGMAN_PLAYER_CACHE of them are kept in memory, the least recently active
+# ones being dropped once their changes are written.
+player_stats = PlayerCache(
+    lambda user_ids: {user_id: deserialize_player_stats(stats) for user_id, stats in storage.load_players(user_ids).items()},
+    capacity=int(os.getenv("HANGMAN_PLAYER_CACHE", "10000")),
+    pinned=lambda user_id: player_stats_store.is_pending(user_id)
+)
+wins_board = TopK()
+scores_board = TopK()
+
+def mark_player_dirty(user_id):
+    player_stats_store.mark_dirty(user_id)
+
+async def update_player_name(user_id, new_name):
+    stats = await player_stats.fetch(user_id)
+    if stats is not None and stats["name"] != new_name:
+        mark_player_dirty(user_id)
+        stats["name"] = new_name
+        bump_leaderboards(user_id)
         
 
 
+def new_player_stats(user_name):
+    return {
+        "games_played": 0,
+        "games_won": 0,
+        "total_score": 0,
+        "guessed_letters": 0,
+        "solved_words": 0,
+        "name": user_name,
+        "streak": 0,
+        "last_played": None,
+        "achievements": set(),
+        "scores": []
+    }
+
+def deserialize_player_stats(stats):
+    # Missing fields are only filled in memory; a record is written back the
+    # next time that player changes.
+    return {
+        **new_player_stats(stats.get("name", "")),
+        **stats,
+        "achievements": set(stats.get("achievements", [])),
+        "last_played": datetime.fromisoformat(stats["last_played"]).date() if stats.get("last_played") else None
+    }
+
 def load_player_stats():
-    global player_stats
+    # Only the leaderboards are built up front; player records are loaded as
+    # players show up.
+    wins_board.seed(storage.top_players("games_won", wins_board.limit))
+    scores_board.seed(storage.top_players("best_score", scores_board.limit))
+
+async def refresh_leaderboards():
+    # In sharded mode other workers write their players to the shared
+    # database; rebuild the boards from it and pull in the records of the
+    # players shown on them.
+    await player_stats_store.flush()
+    await daily_state.store.flush()
+
+    def read_boards():
+        wins = storage.top_players("games_won", wins_board.limit)
+        scores = storage.top_players("best_score", scores_board.limit)
+        daily = storage.top_daily(daily_state.day, daily_state.board.limit)
+        shown = {row[0] for rows in (wins, scores, daily) for row in rows}
+        return wins, scores, daily, storage.load_players(shown)
+
+    wins, scores, daily, shown_players = await run_io(read_boards)
+    wins_board.clear()
+    wins_board.seed(wins)
+    scores_board.clear()
+    scores_board.seed(scores)
+    daily_state.reload_board(daily)
+    for user_id, stats in shown_players.items():
+        if not player_stats_store.is_pending(user_id):
+            player_stats[user_id] = deserialize_player_stats(stats)
+    for leaderboard_type in leaderboard_versions:
+        leaderboard_versions[leaderboard_type] += 1
+
+async def initialize_player_stats(user_id, user_name):
+    stats = await player_stats.fetch(user_id)
+    if stats is None:
+        stats = player_stats[user_id] = new_player_stats(user_name)
+    return stats
+
+async def forget_game(user_id):
+    await game_store.delete(user_id)
+
+async def delete_chat_messages(chat_id, message_ids):
     try:
-        with open('player_stats.json', 'r') as f:
-            loaded_stats = json.load(f)
-            player_stats = {}
-            for user_id, stats in loaded_stats.items():
-                player_stats[user_id] = {
-                    **stats,
-                    "achievements": set(stats.get("achievements", [])),
-                    "last_played": datetime.fromisoformat(stats["last_played"]).date() if stats.get("last_played") else None
-                }
-    except (FileNotFoundError, json.JSONDecodeError):
-        player_stats = {}
-
-    for user_id, stats in player_stats.items():
-        initialize_player_stats(user_id, stats.get("name", ""))
-
-    save_player_stats()
-
-def initialize_player_stats(user_id, user_name):
-    if user_id not in player_stats or player_stats[user_id] is None:
-        player_stats[user_id] = {
-            "games_played": 0,
-            "games_won": 0,
-            "total_score": 0,
-            "guessed_letters": 0,
-            "solved_words": 0,
-            "name": user_name,
-            "streak": 0,
-            "last_played": None,
-            "achievements": set(),
-            "scores": []
-        }
-    else:
-        stats = player_stats[user_id]
-        stats.setdefault("games_played", 0)
-        stats.setdefault("games_won", 0)
-        stats.setdefault("total_score", 0)
-        stats.setdefault("guessed_letters", 0)
-        stats.setdefault("solved_words", 0)
-        stats.setdefault("name", user_name)
-        stats.setdefault("streak", 0)
-        stats.setdefault("last_played", None)
-        stats.setdefault("achievements", set())
-        stats.setdefault("scores", [])
-
-    return player_stats[user_id]
-
-async def check_inactive_games():
-    while True:
-        current_time = datetime.now()
-        inactive_users = []
-        for user_id, last_activity in list(game_activity.items()):
-            if (current_time - last_activity) > timedelta(minutes=3): 
-                inactive_users.append(user_id)
-        
-        for user_id in inactive_users:
-            if user_id in games:
-                game = games[user_id]
-                try:
-                    await app.delete_messages(
-                        chat_id=game["chat_id"],
-                        message_ids=game["message_ids"]
-                    )
-                    print(f"Deleted {len(game['message_ids'])} inactive game messages for user {user_id}")
-                except Exception as e:
-                    print(f"Error deleting messages for user {user_id}: {e}")
-                del games[user_id]
-            if user_id in game_activity:
-                del game_activity[user_id]
-        
-        await asyncio.sleep(60)
+        for i in range(0, len(message_ids), 100):
+            await app.delete_messages(chat_id=chat_id, message_ids=message_ids[i:i+100])
+        print(f"Deleted {len(message_ids)} inactive game messages in chat {chat_id}")
+    except Exception as e:
+        print(f"Error deleting messages in chat {chat_id}: {e}")
+
+@timed
+async def delete_inactive_games(expired_games):
+    messages_by_chat = {}
+    for game in expired_games:
+        messages_by_chat.setdefault(game.chat_id, []).extend(game.message_ids)
+
+    await gather_bounded(
+        (delete_chat_messages(chat_id, message_ids) for chat_id, message_ids in messages_by_chat.items()),
+        MAX_CONCURRENT_DELETES
+    )
  
 
-def track_game_setup(user_id, stage, chat_id, message_id):
-    if user_id not in games:
-        games[user_id] = {
-            "message_ids": [],
-            "chat_id": chat_id
-        }
-    games[user_id].update({
-        "setup_stage": stage,
-        "chat_id": chat_id,
-    })
-    games[user_id]["message_ids"].append(message_id)
-    game_activity[user_id] = datetime.now()
-
-def create_new_game(user_id, word, category, difficulty, chat_id, message_id):
-    keyboard_letters = generate_keyboard(word, set())
-    attempts = calculate_attempts(len(word))
-    
-    if user_id not in games:
-        games[user_id] = {
-            "message_ids": [],
-            "chat_id": chat_id
-        }
-    
-    games[user_id].update({
-        "word": word,
-        "guessed_letters": set(),
-        "attempts": attempts,
-        "category": category,
-        "difficulty": difficulty,
-        "score": 0,
-        "keyboard_letters": keyboard_letters,
-        "user_name": player_stats[user_id]["name"] if user_id in player_stats else "Unknown Player",
-        "setup_stage": "game_started"
-    })
-    games[user_id]["message_ids"].append(message_id)
-    game_activity[user_id] = datetime.now()
+async def track_game_setup(user_id, stage, chat_id, message_id):
+    game = await game_store.get(user_id)
+    if game is None:
+        game = GameState(chat_id)
+    game.setup_stage = stage
+    game.chat_id = chat_id
+    game.add_message(message_id)
+    await game_store.save(user_id, game)
+
+async def create_new_game(user_id, word_entry, chat_id, message_id, is_daily_challenge=False):
+    game = await game_store.get(user_id)
+    if game is None:
+        game = GameState(chat_id)
+
+    game.word_index = word_entry.index
+    game.guessed_mask = 0
+    game.keyboard_mask = generate_keyboard(word_entry, 0)
+    game.attempts = calculate_attempts(word_entry.length)
+    game.score = 0
+    if is_group_game(user_id):
+        game.user_name = None
+    else:
+        stats = await player_stats.fetch(user_id)
+        game.user_name = stats["name"] if stats is not None else "Unknown Player"
+    game.players = {}
+    game.is_daily_challenge = is_daily_challenge
+    game.started_at = time.time()
+    game.hints = 0
+    game.setup_stage = "game_started"
+    game.add_message(message_id)
+    await game_store.save(user_id, game)
+    return game
 
     
-def update_player_stats(user_id, user_name, won, score, guessed_letter_count=0, solved_word=False):
-    initialize_player_stats(user_id, user_name)
+async def update_player_stats(user_id, user_name, won, score, guessed_letter_count=0, solved_word=False):
+    # Marked dirty first: that keeps the record in the cache while it changes.
+    stats = await initialize_player_stats(user_id, user_name)
+    mark_player_dirty(user_id)
 
-    player_stats[user_id]["games_played"] += 1
+    stats["games_played"] += 1
     if won:
-        player_stats[user_id]["games_won"] += 1
+        stats["games_won"] += 1
     if solved_word:
-        player_stats[user_id]["solved_words"] += 1
-    player_stats[user_id]["total_score"] += score
-    player_stats[user_id]["guessed_letters"] += guessed_letter_count
+        stats["solved_words"] += 1
+    stats["total_score"] += score
+    stats["guessed_letters"] += guessed_letter_count
+
+    if "scores" not in stats:
+        stats["scores"] = []
+    stats["scores"].append(score)
+    stats["scores"] = sorted(stats["scores"], reverse=True)[:5]
 
-    if "scores" not in player_stats[user_id]:
-        player_stats[user_id]["scores"] = []
-    player_stats[user_id]["scores"].append(score)
-    player_stats[user_id]["scores"] = sorted(player_stats[user_id]["scores"], reverse=True)[:5]
+    wins_board.update(user_id, stats["games_won"])
+    scores_board.update(user_id, stats["scores"][0])
 
     current_date = datetime.now().date()
-    last_played = player_stats[user_id]["last_played"]
+    last_played = stats["last_played"]
     if last_played is None:
-        player_stats[user_id]["streak"] = 1
+        stats["streak"] = 1
     elif last_played == current_date - timedelta(days=1):
-        player_stats[user_id]["streak"] += 1
+        stats["streak"] += 1
     elif last_played != current_date:
-        player_stats[user_id]["streak"] = 1
-    player_stats[user_id]["last_played"] = current_date
+        stats["streak"] = 1
+    stats["last_played"] = current_date
 
-    save_player_stats()
+    bump_leaderboards(user_id)
+    return stats
 
-def get_player_stats(user_id):
-    initialize_player_stats(user_id, "")
-    stats = player_stats[user_id]
+def get_player_stats(stats):
     games_played = stats["games_played"]
     win_rate = (stats["games_won"] / games_played * 100) if games_played > 0 else 0
     avg_score = stats["total_score"] / games_played if games_played > 0 else 0
@@ -316,98 +356,191 @@ def get_player_stats(user_id):
             f"Achievements: {', '.join(stats['achievements']) if stats['achievements'] else 'None'}")
 
 def get_random_word(category, difficulty):
-    return random.choice(WORDS[category][difficulty])
+    return random_entry(category, difficulty)
 
 def calculate_attempts(word_length, base_attempts=5, length_factor=2):
     return base_attempts + word_length // length_factor
 
-def create_hangman_display(word, guessed_letters):
-    return " ".join(letter if letter in guessed_letters else "▢" for letter in word)
+def create_hangman_display(word, guessed_mask):
+    return " ".join([letter if LETTER_BITS[letter] & guessed_mask else "▢" for letter in word])
 
-def calculate_score(word, attempts_left, difficulty):
-    difficulty_multiplier = {"easy": 1, "medium": 2, "hard": 3}
-    return len(set(word)) * attempts_left * difficulty_multiplier[difficulty.lower()]
+difficulty_multiplier = {"easy": 1, "medium": 2, "hard": 3}
 
-def get_user_emoji_set(user_id, emoji_type):
-    return user_configs.get(user_id, {}).get(emoji_type, default_emoji_sets[emoji_type])
+def calculate_score(word_entry, attempts_left):
+    return word_entry.unique_letters * attempts_left * difficulty_multiplier[word_entry.difficulty]
 
-def is_original_user(callback_query, original_user_id):
-    if str(callback_query.from_user.id) != original_user_id:
+def is_word_solved(word_entry, guessed_mask):
+    return word_entry.mask & guessed_mask == word_entry.mask
+
+def is_game_over(game):
+    return game.attempts <= 0 or is_word_solved(game.word_entry, game.guessed_mask)
+
+# Applied through game_store.update(), which may run them more than once when
+# another instance changed the game at the same time.
+def apply_guess(game, bit):
+    if not game.started or is_game_over(game) or game.guessed_mask & bit:
         return False
+    game.guessed_mask |= bit
+    if not game.word_entry.mask & bit:
+        game.attempts -= 1
+    game.score = calculate_score(game.word_entry, game.attempts)
     return True
 
-def format_message(word, guessed_letters, attempts, category, difficulty, score, user_id):
-    max_attempts = calculate_attempts(len(word))
-    attempts_left = max(0, min(attempts, max_attempts))
-
-    hangman_display = create_hangman_display(word, guessed_letters)
+def apply_hint(game):
+    if not game.started or is_game_over(game):
+        return None
+    word_entry = game.word_entry
+    hint = random.choice(letters_in(word_entry.mask & ~game.guessed_mask))
+    game.guessed_mask |= LETTER_BITS[hint]
+    game.hints += 1
+    game.attempts -= 1
+    game.score = calculate_score(word_entry, game.attempts)
+    return hint
+
+def record_contribution(game, player_id, player_name, bit=0, hint=False):
+    _, guessed_mask, hints = game.players.get(player_id, (player_name, 0, 0))
+    game.players[player_id] = (player_name, guessed_mask | bit, hints + hint)
+
+def apply_group_guess(game, bit, player_id, player_name):
+    guessed = apply_guess(game, bit)
+    if guessed:
+        record_contribution(game, player_id, player_name, bit=bit)
+    return guessed
+
+def apply_group_hint(game, player_id, player_name):
+    # Hinted letters count for nobody.
+    hint = apply_hint(game)
+    if hint is not None:
+        record_contribution(game, player_id, player_name, hint=True)
+    return hint
+
+default_user_emojis = {emoji_type: tuple(emojis) for emoji_type, emojis in default_emoji_sets.items()}
+user_emoji_cache = {}
+
+def get_user_emojis(user_id):
+    emojis = user_emoji_cache.get(user_id)
+    if emojis is None:
+        config = user_configs.get(user_id)
+        if config is None:
+            return default_user_emojis
+        emojis = user_emoji_cache[user_id] = {
+            emoji_type: tuple(config.get(emoji_type, default_emojis))
+            for emoji_type, default_emojis in default_emoji_sets.items()
+        }
+    return emojis
 
-    lives_emojis = get_user_emoji_set(user_id, "lives")
-    live_emoji, dead_emoji, last_attempt_emoji = lives_emojis
+def get_user_emoji_set(user_id, emoji_type):
+    return get_user_emojis(user_id)[emoji_type]
 
-    if attempts_left == 1:
-        lives_display = last_attempt_emoji * max_attempts
-    else:
-        lives_display = live_emoji * attempts_left + dead_emoji * (max_attempts - attempts_left)
+def forget_user_emojis(user_id):
+    user_emoji_cache.pop(user_id, None)
+    keyboard_cache.forget(user_id)
 
-    difficulty_emojis = get_user_emoji_set(user_id, "difficulty")
-    difficulty_emoji = difficulty_emojis[["easy", "medium", "hard"].index(difficulty.lower())]
+def is_original_user(callback_query, original_user_id):
+    if str(callback_query.from_user.id) != original_user_id:
+        return False
+    return True
 
-    message = f"🎮 Hangman Game - {category.capitalize()} ({difficulty.capitalize()} {difficulty_emoji})\n"
-    message += f"Word: `{hangman_display}`\n\n"
-    message += f"Attempts left: {lives_display}\n"
-    message += f"Guessed letters: {', '.join(sorted(guessed_letters)) if guessed_letters else 'None'}\n"
-    message += f"Current Score: `{score}` \n\n"
-    message += "Guess a letter!"
-    return message
+def is_group_game(game_id):
+    # Group games are keyed by their chat's id, which is negative, and single
+    # player games by the player's.
+    return game_id.startswith("-")
+
+def may_play(callback_query, game_id):
+    # Anyone in the chat may press the buttons of its group game.
+    if is_group_game(game_id):
+        return callback_query.message is not None and str(callback_query.message.chat.id) == game_id
+    return is_original_user(callback_query, game_id)
+
+CATEGORY_BUTTONS = [
+    ("Animals 🐾", "animals"),
+    ("Countries 🌎", "countries"),
+    ("Foods 🍔", "foods"),
+    ("Fruits 🍎", "fruits"),
+    ("Vegetables 🥕", "vegetables"),
+    ("Colors 🎨", "colors"),
+    ("Sports ⚽️", "sports"),
+    ("Occupations 🧑‍💼", "occupations"),
+    ("Actions 🏃", "actions"),
+    ("Adjectives ✨", "adjectives"),
+]
 
-def generate_keyboard(word, guessed_letters):
-    all_letters = set("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
-    word_letters = set(word.upper())
-    remaining_letters = all_letters - guessed_letters - word_letters
+def category_keyboard(game_id, daily=True):
+    rows = [[InlineKeyboardButton("Daily Challenge 📅", callback_data=encode_callback(DAILY, game_id))]] if daily else []
+    rows += [
+        [InlineKeyboardButton(label, callback_data=encode_callback(CATEGORY, category, game_id))]
+        for label, category in CATEGORY_BUTTONS
+    ]
+    return InlineKeyboardMarkup(rows)
 
-    num_additional_letters = max(10, len(word) * 2)
-    num_additional_letters = min(num_additional_letters, len(remaining_letters))
+DIFFICULTY_POSITIONS = {"easy": 0, "medium": 1, "hard": 2}
+MAX_MESSAGE_TEMPLATES = 4096
+message_templates = {}
 
-    remaining_letters_list = list(remaining_letters)
+def compile_message_template(category, difficulty, max_attempts, lives_emojis, difficulty_emoji):
+    live_emoji, dead_emoji, last_attempt_emoji = lives_emojis
+    header = f"🎮 Hangman Game - {category.capitalize()} ({difficulty.capitalize()} {difficulty_emoji})\nWord: `"
+    lives_displays = tuple(
+        last_attempt_emoji * max_attempts if attempts_left == 1
+        else live_emoji * attempts_left + dead_emoji * (max_attempts - attempts_left)
+        for attempts_left in range(max_attempts + 1)
+    )
+    return header, lives_displays
+
+def get_message_template(category, difficulty, max_attempts, user_id):
+    emojis = get_user_emojis(user_id)
+    difficulty_emoji = emojis["difficulty"][DIFFICULTY_POSITIONS[difficulty]]
+    key = (category, difficulty, max_attempts, emojis["lives"], difficulty_emoji)
+    template = message_templates.get(key)
+    if template is None:
+        if len(message_templates) >= MAX_MESSAGE_TEMPLATES:
+            message_templates.clear()
+        template = message_templates[key] = compile_message_template(category, difficulty, max_attempts, emojis["lives"], difficulty_emoji)
+    return template
+
+def format_message(word, guessed_mask, attempts, category, difficulty, score, user_id):
+    max_attempts = calculate_attempts(len(word))
+    attempts_left = max(0, min(attempts, max_attempts))
+    header, lives_displays = get_message_template(category, difficulty, max_attempts, user_id)
+    guessed_letters = ', '.join(letters_in(guessed_mask)) if guessed_mask else 'None'
+
+    return (
+        f"{header}{create_hangman_display(word, guessed_mask)}`\n\n"
+        f"Attempts left: {lives_displays[attempts_left]}\n"
+        f"Guessed letters: {guessed_letters}\n"
+        f"Current Score: `{score}` \n\n"
+        "Guess a letter!"
+    )
 
-    random_sample = random.sample(remaining_letters_list, num_additional_letters)
+def generate_keyboard(word_entry, guessed_mask):
+    remaining_mask = ALL_LETTERS_MASK & ~LETTER_BITS[" "] & ~guessed_mask & ~word_entry.mask
+    remaining_letters = letters_in(remaining_mask)
 
-    keyboard_letters = list(word_letters.union(random_sample))
+    num_additional_letters = max(10, word_entry.length * 2)
+    num_additional_letters = min(num_additional_letters, len(remaining_letters))
 
-    keyboard_letters = sorted(keyboard_letters)
+    random_sample = random.sample(remaining_letters, num_additional_letters)
 
-    return keyboard_letters
+    return word_entry.mask | letters_mask(random_sample)
 
-def create_keyboard_markup(keyboard_letters, guessed_letters, word, user_id):
+def create_keyboard_markup(keyboard_mask, guessed_mask, word_mask, user_id):
     keyboard_emojis = get_user_emoji_set(user_id, "keyboard")
-    correct_emoji, incorrect_emoji = keyboard_emojis
-
-    buttons = []
-    for i in range(0, len(keyboard_letters), 5):
-        row = []
-        for letter in keyboard_letters[i:i+5]:
-            if letter in guessed_letters:
-                if letter in word:
-                    row.append(InlineKeyboardButton(correct_emoji, callback_data=f"used_{user_id}"))
-                else:
-                    row.append(InlineKeyboardButton(incorrect_emoji, callback_data=f"used_{user_id}"))
-            else:
-                row.append(InlineKeyboardButton(letter, callback_data=f"guess_{letter}_{user_id}"))
-        buttons.append(row)
-
-    buttons.append([InlineKeyboardButton("💡 Hint", callback_data=f"hint_{user_id}")])
-
-    return InlineKeyboardMarkup(buttons)
+    return keyboard_cache.markup(user_id, keyboard_emojis, keyboard_mask, guessed_mask, word_mask)
 
 def generate_daily_challenge():
-    category = random.choice(list(WORDS.keys()))
-    difficulty = random.choice(["easy", "medium", "hard"])
-    word = get_random_word(category, difficulty)
-    daily_challenges["word"] = word
+    # Every shard worker has to pick the same word, so the choice is seeded
+    # by the date, keyed with the bot token so the seed cannot be guessed.
+    current_date = datetime.now().date()
+    seed = hmac.new(BOT_TOKEN_HANGMAN.encode(), current_date.isoformat().encode(), hashlib.sha256).digest()
+    rng = random.Random(seed)
+    category = rng.choice(CATEGORIES)
+    difficulty = rng.choice(DIFFICULTIES)
+    word_entry = random_entry(category, difficulty, rng)
+    daily_challenges["word_entry"] = word_entry
+    daily_challenges["word"] = word_entry.word
     daily_challenges["category"] = category
     daily_challenges["difficulty"] = difficulty
-    daily_challenges["date"] = datetime.now().date()
+    daily_challenges["date"] = current_date
 
 def update_leaderboard(user_id, score):
     if user_id not in leaderboard:
@@ -418,8 +551,7 @@ def update_leaderboard(user_id, score):
     leaderboard.clear()
     leaderboard.update(dict(sorted_leaderboard))
 
-def update_streak(user_id):
-    stats = player_stats.get(user_id)
+def update_streak(user_id, stats):
     if stats:
         current_date = datetime.now().date()
         if stats["last_played"] == current_date - timedelta(days=1):
@@ -427,10 +559,10 @@ def update_streak(user_id):
         elif stats["last_played"] != current_date:
             stats["streak"] = 1
         stats["last_played"] = current_date
-        save_player_stats()
+        mark_player_dirty(user_id)
+        bump_leaderboards(user_id)
 
-def check_achievements(user_id):
-    stats = player_stats.get(user_id)
+def check_achievements(user_id, stats, perfect_game=False):
     if not stats:
         return []
 
@@ -459,24 +591,23 @@ def check_achievements(user_id):
         new_achievements.append(all_achievements["words_20"])
         stats["achievements"].add("words_20")
 
-    game = games.get(user_id)
-    if game and "perfect_game" not in stats["achievements"]:
-        word_length = len(game["word"])
-        max_attempts = calculate_attempts(word_length)
-        if game["attempts"] == max_attempts and set(game["word"]) <= game["guessed_letters"]:
-            new_achievements.append(all_achievements["perfect_game"])
-            stats["achievements"].add("perfect_game")
+    if perfect_game and "perfect_game" not in stats["achievements"]:
+        new_achievements.append(all_achievements["perfect_game"])
+        stats["achievements"].add("perfect_game")
 
-    save_player_stats()
+    if new_achievements:
+        mark_player_dirty(user_id)
     return new_achievements
 
 @app.on_message(filters.command("hangman"))
+@timed
 async def start_command(client, message):
     welcome_text = (
         "🎮 **Welcome to Hangman!** 🎉\n\n"
         "Guess the word before the man gets hanged! ☠️\n\n"
         "**Available Commands:**\n"
         "🔹 /play - Start a new game. 🕹️\n"
+        "🔹 /groupplay - Start a game the whole group plays. 👥\n"
         "🔹 /stats - View your statistics. 📊\n"
         "🔹 /ranking - Check the leaderboard. 🏆\n"
         "🔹 /config - Customize your game experience. ⚙️\n\n"
@@ -486,14 +617,14 @@ async def start_command(client, message):
 
 
 @app.on_message(filters.command("stats"))
+@timed
 async def stats_command(client, message):
     user_id = str(message.from_user.id)
     user_name = message.from_user.first_name
     
-    if user_id in player_stats and player_stats[user_id]["name"] != user_name:
-        update_player_name(user_id, user_name)
+    await update_player_name(user_id, user_name)
 
-    stats = player_stats.get(user_id, {
+    stats = await player_stats.fetch(user_id) or {
         "games_played": 0,
         "games_won": 0,
         "total_score": 0,
@@ -501,7 +632,7 @@ async def stats_command(client, message):
         "solved_words": 0,
         "name": user_name,
         "achievements": set()
-    })
+    }
     games_played = stats["games_played"]
     win_rate = (stats["games_won"] / games_played * 100) if games_played > 0 else 0
     avg_score = stats["total_score"] / games_played if games_played > 0 else 0
@@ -518,51 +649,37 @@ async def stats_command(client, message):
     )
 
     keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("🆔 General Info", callback_data=f"stats_general_{user_id}")],
-        [InlineKeyboardButton("📈 Game Performance", callback_data=f"stats_performance_{user_id}")],
-        [InlineKeyboardButton("🏅 Achievements", callback_data=f"stats_achievements_{user_id}")]
+        [InlineKeyboardButton("🆔 General Info", callback_data=encode_callback(STATS, "general", user_id))],
+        [InlineKeyboardButton("📈 Game Performance", callback_data=encode_callback(STATS, "performance", user_id))],
+        [InlineKeyboardButton("🏅 Achievements", callback_data=encode_callback(STATS, "achievements", user_id))]
     ])
 
     await message.reply_text(f"📊 **Your Hangman Statistics**\n\n{performance_text}", reply_markup=keyboard)
 
 @app.on_message(filters.command("play"))
+@timed
 async def play_command(client, message):
     user_id = str(message.from_user.id)
     user_name = message.from_user.first_name
     
-    if user_id in player_stats and player_stats[user_id]["name"] != user_name:
-        update_player_name(user_id, user_name)
+    await update_player_name(user_id, user_name)
 
     difficulty_emojis = user_configs.get(user_id, {}).get("difficulty", default_emoji_sets["difficulty"])
 
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("Daily Challenge 📅", callback_data=f"daily_challenge_{user_id}")],
-        [InlineKeyboardButton("Animals 🐾", callback_data=f"category_animals_{user_id}")],
-        [InlineKeyboardButton("Countries 🌎", callback_data=f"category_countries_{user_id}")],
-        [InlineKeyboardButton("Foods 🍔", callback_data=f"category_foods_{user_id}")],
-        [InlineKeyboardButton("Fruits 🍎", callback_data=f"category_fruits_{user_id}")],
-        [InlineKeyboardButton("Vegetables 🥕", callback_data=f"category_vegetables_{user_id}")],
-        [InlineKeyboardButton("Colors 🎨", callback_data=f"category_colors_{user_id}")],
-        [InlineKeyboardButton("Sports ⚽️", callback_data=f"category_sports_{user_id}")],
-        [InlineKeyboardButton("Occupations 🧑‍💼", callback_data=f"category_occupations_{user_id}")],
-        [InlineKeyboardButton("Actions 🏃", callback_data=f"category_actions_{user_id}")],
-        [InlineKeyboardButton("Adjectives ✨", callback_data=f"category_adjectives_{user_id}")]
-    ])
+    keyboard = category_keyboard(user_id)
     sent_message = await message.reply_text("🎮 **Hangman Game!** 🎉\n\n"
         "Select a category or try the daily challenge! 📚", reply_markup=keyboard)
     
-    track_game_setup(user_id, "category_selection", message.chat.id, sent_message.id)
+    await track_game_setup(user_id, "category_selection", message.chat.id, sent_message.id)
 
-@app.on_callback_query(filters.regex(r"^daily_challenge"))
-async def daily_challenge_callback(client, callback_query):
+async def daily_challenge_callback(client, callback_query, original_user_id):
     user_id = str(callback_query.from_user.id)
-    original_user_id = callback_query.data.split("_")[-1]
 
     if user_id != original_user_id:
         await callback_query.answer("Oops! 🚫 This is not your game. Start your own with /play!", show_alert=True)
         return
 
-    if not can_play_daily_challenge(user_id):
+    if not await can_play_daily_challenge(user_id):
         await callback_query.answer("You've already played today's challenge. Come back tomorrow!", show_alert=True)
         return
 
@@ -570,212 +687,255 @@ async def daily_challenge_callback(client, callback_query):
     if "date" not in daily_challenges or daily_challenges["date"] != current_date:
         generate_daily_challenge()
 
-    word = daily_challenges["word"]
-    category = daily_challenges["category"]
-    difficulty = daily_challenges["difficulty"]
+    word_entry = daily_challenges["word_entry"]
+    word = word_entry.word
+    category = word_entry.category
+    difficulty = word_entry.difficulty
 
     sent_message = await callback_query.message.edit_text(
         "🎮 Setting up your daily challenge...",
     )
 
-    create_new_game(user_id, word, category, difficulty, callback_query.message.chat.id, sent_message.id)
-    
-    game = games[user_id]
-    game["is_daily_challenge"] = True
+    game = await create_new_game(user_id, word_entry, callback_query.message.chat.id, sent_message.id, is_daily_challenge=True)
 
-    initial_message = format_message(word, set(), game["attempts"], category, difficulty, 0, user_id)
+    initial_message = format_message(word, 0, game.attempts, category, difficulty, 0, user_id)
     initial_message = "🌟 Daily Challenge 🌟\n\n" + initial_message
     
     try:
-        await client.edit_message_text(
-            chat_id=game["chat_id"],
-            message_id=game["message_ids"][-1], 
+        await outbox.edit_and_wait(
+            client,
+            game.chat_id,
+            game.message_id,
             text=initial_message,
-            reply_markup=create_keyboard_markup(game["keyboard_letters"], set(), word, user_id)
+            reply_markup=create_keyboard_markup(game.keyboard_mask, 0, word_entry.mask, user_id)
         )
     except Exception as e:
         print(f"Error in daily_challenge_callback: {e}")
-        if user_id in games:
-            del games[user_id]
-        if user_id in game_activity:
-            del game_activity[user_id]
+        await forget_game(user_id)
         await callback_query.answer("An error occurred. Please try again.", show_alert=True)
         return
 
-    game_activity[user_id] = datetime.now()
     await callback_query.answer("Daily challenge started!")
 
-@app.on_callback_query(filters.regex(r"^guess_"))
-async def guess_callback(client, callback_query):
+async def guess_callback(client, callback_query, letter, game_user_id):
+    if is_group_game(game_user_id):
+        await group_guess_callback(client, callback_query, letter, game_user_id)
+        return
+
     user_id = str(callback_query.from_user.id)
-    game_user_id = callback_query.data.split("_")[-1]
 
     if user_id != game_user_id:
         await callback_query.answer("Oops! 🚫 This is not your game. Start your own with /play!", show_alert=True)
         return
 
-    if game_user_id not in games:
+    game, guessed = await game_store.update(game_user_id, lambda game: apply_guess(game, LETTER_BITS[letter]))
+    if game is None or not game.started or not guessed and is_game_over(game):
         await callback_query.answer("🚫 No active game found. Please start a new game with /play.", show_alert=True)
         return
 
-    game = games[game_user_id]
-    letter = callback_query.data.split("_")[1]
-
-    game_activity[game_user_id] = datetime.now()  
-
-    if letter in game["guessed_letters"]:
+    if not guessed:
         await callback_query.answer("You've already guessed this letter!", show_alert=True)
         return
 
-    game["guessed_letters"].add(letter)
+    word_entry = game.word_entry
+    if is_word_solved(word_entry, game.guessed_mask):
+        await end_game(client, callback_query.message, game_user_id, game, won=True)
+    elif game.attempts == 0:
+        await end_game(client, callback_query.message, game_user_id, game, won=False)
+    else:
+        outbox.edit(
+            client,
+            game.chat_id,
+            game.message_id,
+            text=format_message(word_entry.word, game.guessed_mask, game.attempts, word_entry.category, word_entry.difficulty, game.score, game_user_id),
+            reply_markup=create_keyboard_markup(game.keyboard_mask, game.guessed_mask, word_entry.mask, game_user_id)
+        )
+
+    await callback_query.answer()
 
-    if letter not in game["word"]:
-        game["attempts"] -= 1
 
-    game["score"] = calculate_score(game["word"], game["attempts"], game["difficulty"])
+# Group games get presses from many members at once. Guesses of one game are
+# applied one at a time under its lock, which also keeps its message edits
+# in order, and a letter that several members press together only reaches
+# the game store once. The outbox coalesces the edits to the group chat's
+# rate limit.
+group_game_locks = KeyedLocks()
+group_guesses_in_flight = set()
 
-    if set(game["word"]) <= game["guessed_letters"]:
-        await end_game(client, callback_query.message, game_user_id, won=True)
-    elif game["attempts"] == 0:
-        await end_game(client, callback_query.message, game_user_id, won=False)
-    else:
-        try:
-            await client.edit_message_text(
-                chat_id=game["chat_id"],
-                message_id=game["message_ids"][-1],  
-                text=format_message(game["word"], game["guessed_letters"], game["attempts"], game["category"], game["difficulty"], game["score"], game_user_id),
-                reply_markup=create_keyboard_markup(game["keyboard_letters"], game["guessed_letters"], game["word"], game_user_id)
-            )
-        except MessageNotModified:
-            pass
-        except FloodWait as e:
-            await asyncio.sleep(e.value)
-            await client.edit_message_text(
-                chat_id=game["chat_id"],
-                message_id=game["message_ids"][-1], 
-                text=format_message(game["word"], game["guessed_letters"], game["attempts"], game["category"], game["difficulty"], game["score"], game_user_id),
-                reply_markup=create_keyboard_markup(game["keyboard_letters"], game["guessed_letters"], game["word"], game_user_id)
-            )
+def format_group_message(game, game_id):
+    word_entry = game.word_entry
+    players = f" ({len(game.players)} playing)" if game.players else ""
+    return f"👥 Group Game - everyone can guess!{players}\n\n" + format_message(
+        word_entry.word, game.guessed_mask, game.attempts, word_entry.category, word_entry.difficulty, game.score, game_id
+    )
 
-    await callback_query.answer()
+async def group_guess_callback(client, callback_query, letter, game_id):
+    if not may_play(callback_query, game_id):
+        await callback_query.answer("🚫 This game belongs to another chat.", show_alert=True)
+        return
 
+    bit = LETTER_BITS[letter]
+    key = (game_id, bit)
+    if key in group_guesses_in_flight:
+        await callback_query.answer(f"Someone just guessed {letter}!")
+        return
 
-@app.on_callback_query(filters.regex(r"^hint_"))
-async def hint_callback(client, callback_query):
-    user_id = str(callback_query.from_user.id)
-    game_user_id = callback_query.data.split("_")[-1]
+    player_id = str(callback_query.from_user.id)
+    player_name = callback_query.from_user.first_name
+    group_guesses_in_flight.add(key)
+    try:
+        async with group_game_locks.hold(game_id):
+            game, guessed = await game_store.update(game_id, lambda game: apply_group_guess(game, bit, player_id, player_name))
+            if game is None or not game.started or not guessed and is_game_over(game):
+                answer, alert = "🚫 No active game found. Start a new one with /groupplay.", True
+            elif not guessed:
+                answer, alert = f"{letter} has already been guessed!", False
+            else:
+                word_entry = game.word_entry
+                answer, alert = ("✅ Good guess!" if word_entry.mask & bit else "❌ Not in the word."), False
+                if is_word_solved(word_entry, game.guessed_mask):
+                    await end_group_game(client, callback_query.message, game_id, game, won=True, solver_id=player_id)
+                elif game.attempts == 0:
+                    await end_group_game(client, callback_query.message, game_id, game, won=False)
+                else:
+                    outbox.edit(
+                        client,
+                        game.chat_id,
+                        game.message_id,
+                        text=format_group_message(game, game_id),
+                        reply_markup=create_keyboard_markup(game.keyboard_mask, game.guessed_mask, word_entry.mask, game_id)
+                    )
+    finally:
+        group_guesses_in_flight.discard(key)
 
-    if user_id != game_user_id:
+    await callback_query.answer(answer, show_alert=alert)
+
+
+async def hint_callback(client, callback_query, game_user_id):
+    if not may_play(callback_query, game_user_id):
         await callback_query.answer("Oops! 🚫 This is not your game. Start your own with /play!", show_alert=True)
         return
 
-    if game_user_id not in games:
+    group = is_group_game(game_user_id)
+    if group:
+        player_id = str(callback_query.from_user.id)
+        player_name = callback_query.from_user.first_name
+        apply = lambda game: apply_group_hint(game, player_id, player_name)
+    else:
+        apply = apply_hint
+
+    async with group_game_locks.hold(game_user_id) if group else nullcontext():
+        game, hint = await game_store.update(game_user_id, apply)
+        if game is not None and game.started and hint is not None:
+            finish = end_group_game if group else end_game
+            word_entry = game.word_entry
+            if is_word_solved(word_entry, game.guessed_mask):
+                await finish(client, callback_query.message, game_user_id, game, won=True)
+            elif game.attempts == 0:
+                await finish(client, callback_query.message, game_user_id, game, won=False)
+            else:
+                if group:
+                    formatted_message = format_group_message(game, game_user_id)
+                else:
+                    formatted_message = format_message(word_entry.word, game.guessed_mask, game.attempts, word_entry.category, word_entry.difficulty, game.score, game_user_id)
+                outbox.edit(
+                    client,
+                    callback_query.message.chat.id,
+                    game.message_id,
+                    text=formatted_message,
+                    reply_markup=create_keyboard_markup(game.keyboard_mask, game.guessed_mask, word_entry.mask, game_user_id)
+                )
+
+    if game is None or not game.started:
         await callback_query.answer("🚫 No active game found. Please start a new game with /play.", show_alert=True)
         return
 
-    game = games[game_user_id]
-    unguessed_letters = set(game["word"]) - game["guessed_letters"]
-    if not unguessed_letters:
+    if hint is None:
         await callback_query.answer("No more hints available!", show_alert=True)
         return
 
-    hint = random.choice(list(unguessed_letters))
-    game["guessed_letters"].add(hint)
-    game["attempts"] -= 1
-    game["score"] = calculate_score(game["word"], game["attempts"], game["difficulty"])
-
-    game_activity[game_user_id] = datetime.now()
-
-    if set(game["word"]) <= game["guessed_letters"]:
-        await end_game(client, callback_query.message, game_user_id, won=True)
-    elif game["attempts"] == 0:
-        await end_game(client, callback_query.message, game_user_id, won=False)
-    else:
-        formatted_message = format_message(game["word"], game["guessed_letters"], game["attempts"], game["category"], game["difficulty"], game["score"], game_user_id)
-        try:
-            await client.edit_message_text(
-                chat_id=callback_query.message.chat.id,
-                message_id=game["message_ids"][-1], 
-                text=formatted_message,
-                reply_markup=create_keyboard_markup(game["keyboard_letters"], game["guessed_letters"], game["word"], game_user_id)
-            )
-        except MessageNotModified:
-            pass
-        except FloodWait as e:
-            await asyncio.sleep(e.value)
-            await client.edit_message_text(
-                chat_id=callback_query.message.chat.id,
-                message_id=game["message_ids"][-1], 
-                text=formatted_message,
-                reply_markup=create_keyboard_markup(game["keyboard_letters"], game["guessed_letters"], game["word"], game_user_id)
-            )
-
     await callback_query.answer(f"Hint: The word contains the letter '{hint}'")
 
 
-@app.on_callback_query(filters.regex(r"^category_"))
-async def category_callback(client, callback_query):
-    user_id = str(callback_query.from_user.id)
-    category, original_user_id = callback_query.data.split("_")[1:]
-
-    if user_id != original_user_id:
+async def category_callback(client, callback_query, category, original_user_id):
+    if not may_play(callback_query, original_user_id):
         await callback_query.answer("Oops! 🚫 This is not your game. Start your own with /play!", show_alert=True)
         return
 
-    difficulty_emojis = user_configs.get(user_id, {}).get("difficulty", default_emoji_sets["difficulty"])
-    easy_emoji, medium_emoji, hard_emoji = difficulty_emojis
+    if is_group_game(original_user_id):
+        # An old menu must not replace the message of a running game.
+        game = await game_store.get(original_user_id)
+        if game is not None and game.started:
+            await callback_query.answer("A game is already running in this chat!", show_alert=True)
+            return
+
+    easy_emoji, medium_emoji, hard_emoji = get_user_emoji_set(original_user_id, "difficulty")
 
     keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton(f"Easy {easy_emoji}", callback_data=f"difficulty_{category}_easy_{user_id}")],
-        [InlineKeyboardButton(f"Medium {medium_emoji}", callback_data=f"difficulty_{category}_medium_{user_id}")],
-        [InlineKeyboardButton(f"Hard {hard_emoji}", callback_data=f"difficulty_{category}_hard_{user_id}")]
+        [InlineKeyboardButton(f"Easy {easy_emoji}", callback_data=encode_callback(DIFFICULTY, category, "easy", original_user_id))],
+        [InlineKeyboardButton(f"Medium {medium_emoji}", callback_data=encode_callback(DIFFICULTY, category, "medium", original_user_id))],
+        [InlineKeyboardButton(f"Hard {hard_emoji}", callback_data=encode_callback(DIFFICULTY, category, "hard", original_user_id))]
     ])
     edited_message = await callback_query.message.edit_text(f"Choose difficulty for {category}:", reply_markup=keyboard)
     
-    track_game_setup(user_id, "difficulty_selection", edited_message.chat.id, edited_message.id)
-
+    await track_game_setup(original_user_id, "difficulty_selection", edited_message.chat.id, edited_message.id)
 
-@app.on_callback_query(filters.regex(r"^difficulty_"))
-async def difficulty_callback(client, callback_query):
-    user_id = str(callback_query.from_user.id)
-    _, category, difficulty, game_user_id = callback_query.data.split("_")
 
-    if user_id != game_user_id:
+async def difficulty_callback(client, callback_query, category, difficulty, game_user_id):
+    if not may_play(callback_query, game_user_id):
         await callback_query.answer("Oops! 🚫 This is not your game. Start your own with /play!", show_alert=True)
         return
 
-    word = get_random_word(category, difficulty)
+    if is_group_game(game_user_id):
+        await start_group_game(client, callback_query, category, difficulty, game_user_id)
+        return
+
+    word_entry = get_random_word(category, difficulty)
     
     sent_message = await callback_query.message.edit_text(
         "🎮 Setting up your game...",
     )
     
-    create_new_game(user_id, word, category, difficulty, callback_query.message.chat.id, sent_message.id)
+    game = await create_new_game(game_user_id, word_entry, callback_query.message.chat.id, sent_message.id)
+    initial_message = format_message(word_entry.word, 0, game.attempts, category, difficulty, 0, game_user_id)
     
-    game = games[user_id]
-    initial_message = format_message(word, set(), game["attempts"], category, difficulty, 0, user_id)
-    
-    game_message = await client.edit_message_text(
-        chat_id=game["chat_id"],
-        message_id=sent_message.id,
+    await outbox.edit_and_wait(
+        client,
+        game.chat_id,
+        sent_message.id,
         text=initial_message,
-        reply_markup=create_keyboard_markup(game["keyboard_letters"], set(), word, user_id)
+        reply_markup=create_keyboard_markup(game.keyboard_mask, 0, word_entry.mask, game_user_id)
     )
+
+async def start_group_game(client, callback_query, category, difficulty, game_id):
+    # Several members may pick a difficulty at the same time; the first one
+    # starts the game and the others are told it is running.
+    async with group_game_locks.hold(game_id):
+        game = await game_store.get(game_id)
+        if game is not None and game.started:
+            await callback_query.answer("A game is already running in this chat!", show_alert=True)
+            return
+        game = await create_new_game(game_id, get_random_word(category, difficulty), callback_query.message.chat.id, callback_query.message.id)
+
+    await outbox.edit_and_wait(
+        client,
+        game.chat_id,
+        game.message_id,
+        text=format_group_message(game, game_id),
+        reply_markup=create_keyboard_markup(game.keyboard_mask, 0, game.word_entry.mask, game_id)
+    )
+    await callback_query.answer()
     
-    track_game_setup(user_id, "game_started", game_message.chat.id, game_message.id)
-    
-@app.on_callback_query(filters.regex(r"^stats_"))
-async def stats_section_callback(client, callback_query):
+async def stats_section_callback(client, callback_query, section, stats_user_id):
     global last_pressed_section
 
     user_id = str(callback_query.from_user.id)
-    stats_user_id = callback_query.data.split("_")[-1]
 
     if user_id != stats_user_id:
         await callback_query.answer("🚫 These are not your stats! Please view your own stats with /stats.", show_alert=True)
         return
 
-    stats = player_stats.get(user_id, {
+    stats = await player_stats.fetch(user_id) or {
         "games_played": 0,
         "games_won": 0,
         "total_score": 0,
@@ -783,12 +943,11 @@ async def stats_section_callback(client, callback_query):
         "solved_words": 0,
         "name": callback_query.from_user.first_name,
         "achievements": set()
-    })
+    }
     games_played = stats["games_played"]
     win_rate = (stats["games_won"] / games_played * 100) if games_played > 0 else 0
     avg_score = stats["total_score"] / games_played if games_played > 0 else 0
 
-    section = callback_query.data.split("_")[1]
     last_pressed_section = section
 
     if section == "general":
@@ -841,9 +1000,9 @@ async def stats_section_callback(client, callback_query):
         achievements_button_text = "○ " + achievements_button_text + " ○"
 
     keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton(general_button_text, callback_data=f"stats_general_{user_id}")],
-        [InlineKeyboardButton(performance_button_text, callback_data=f"stats_performance_{user_id}")],
-        [InlineKeyboardButton(achievements_button_text, callback_data=f"stats_achievements_{user_id}")]
+        [InlineKeyboardButton(general_button_text, callback_data=encode_callback(STATS, "general", user_id))],
+        [InlineKeyboardButton(performance_button_text, callback_data=encode_callback(STATS, "performance", user_id))],
+        [InlineKeyboardButton(achievements_button_text, callback_data=encode_callback(STATS, "achievements", user_id))]
     ])
 
     try:
@@ -867,22 +1026,21 @@ tips = [
 ]
 
 @app.on_message(filters.command("config"))
+@timed
 async def config_command(client, message):
     user_id = str(message.from_user.id)
     keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("🎭 Customize Emojis", callback_data=f"config_emoji_{user_id}")],
-        [InlineKeyboardButton("🔄 Reset to Default", callback_data=f"config_reset_{user_id}")],
-        [InlineKeyboardButton("❌ Close Configuration", callback_data=f"config_close_{user_id}")]
+        [InlineKeyboardButton("🎭 Customize Emojis", callback_data=encode_callback(CONFIG, "emoji", user_id))],
+        [InlineKeyboardButton("🔄 Reset to Default", callback_data=encode_callback(CONFIG, "reset", user_id))],
+        [InlineKeyboardButton("❌ Close Configuration", callback_data=encode_callback(CONFIG, "close", user_id))]
     ])
     await message.reply_text("⚙️ **Hangman Configuration**\n\nCustomize your game experience:", reply_markup=keyboard)
 
 
-@app.on_callback_query(filters.regex(r"^config_"))
-async def config_callback(client, callback_query):
+async def config_callback(client, callback_query, config_type, original_user_id):
     user_id = str(callback_query.from_user.id)
-    data_parts = callback_query.data.split("_")
-    config_type = data_parts[1]
-    original_user_id = data_parts[2] if len(data_parts) > 2 else user_id
+    if original_user_id is None:
+        original_user_id = user_id
 
     if not is_original_user(callback_query, original_user_id):
         await callback_query.answer("bad boy 🤡.", show_alert=True)
@@ -890,16 +1048,16 @@ async def config_callback(client, callback_query):
 
     if config_type == "emoji":
         keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("❤️ Lives Emojis", callback_data=f"config_lives_{user_id}")],
-            [InlineKeyboardButton("⌨️ Keyboard Emojis", callback_data=f"config_keyboard_{user_id}")],
-            [InlineKeyboardButton("🔥 Difficulty Emojis", callback_data=f"config_difficulty_{user_id}")],
-            [InlineKeyboardButton("« Back", callback_data=f"config_back_{user_id}")]
+            [InlineKeyboardButton("❤️ Lives Emojis", callback_data=encode_callback(CONFIG, "lives", user_id))],
+            [InlineKeyboardButton("⌨️ Keyboard Emojis", callback_data=encode_callback(CONFIG, "keyboard", user_id))],
+            [InlineKeyboardButton("🔥 Difficulty Emojis", callback_data=encode_callback(CONFIG, "difficulty", user_id))],
+            [InlineKeyboardButton("« Back", callback_data=encode_callback(CONFIG, "back", user_id))]
         ])
         await callback_query.message.edit_text("🎨 **Emoji Customization**\n\nChoose which emojis to customize:", reply_markup=keyboard)
     elif config_type == "reset":
         confirm_keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("✅ Yes, reset", callback_data=f"confirm_reset_{user_id}")],
-            [InlineKeyboardButton("❌ No, cancel", callback_data=f"config_back_{user_id}")]
+            [InlineKeyboardButton("✅ Yes, reset", callback_data=encode_callback(CONFIRM_RESET, user_id))],
+            [InlineKeyboardButton("❌ No, cancel", callback_data=encode_callback(CONFIG, "back", user_id))]
         ])
         await callback_query.message.edit_text("🔄 **Reset Configuration**\n\nAre you sure you want to reset your configuration to default?", reply_markup=confirm_keyboard)
     elif config_type == "close":
@@ -909,20 +1067,20 @@ async def config_callback(client, callback_query):
         options = emoji_options[config_type]
 
         keyboard = []
-        for option in options:
+        for option_index, option in enumerate(options):
             if config_type == "keyboard":
                 row = [
-                    InlineKeyboardButton(f"{option[0]} {'✓' if option[0] == current_emojis[0] else ''}", callback_data=f"set_{config_type}_0_{option[0]}_{user_id}"),
-                    InlineKeyboardButton(f"{option[1]} {'✓' if option[1] == current_emojis[1] else ''}", callback_data=f"set_{config_type}_1_{option[1]}_{user_id}")
+                    InlineKeyboardButton(f"{option[0]} {'✓' if option[0] == current_emojis[0] else ''}", callback_data=encode_callback(SET_EMOJI, config_type, option_index, 0, user_id)),
+                    InlineKeyboardButton(f"{option[1]} {'✓' if option[1] == current_emojis[1] else ''}", callback_data=encode_callback(SET_EMOJI, config_type, option_index, 1, user_id))
                 ]
             else:
                 row = [
-                    InlineKeyboardButton(f"{emoji} {'✓' if emoji == current_emojis[i] else ''}", callback_data=f"set_{config_type}_{i}_{emoji}_{user_id}")
+                    InlineKeyboardButton(f"{emoji} {'✓' if emoji == current_emojis[i] else ''}", callback_data=encode_callback(SET_EMOJI, config_type, option_index, i, user_id))
                     for i, emoji in enumerate(option)
                 ]
             keyboard.append(row)
 
-        keyboard.append([InlineKeyboardButton("« Back", callback_data=f"config_emoji_{user_id}")])
+        keyboard.append([InlineKeyboardButton("« Back", callback_data=encode_callback(CONFIG, "emoji", user_id))])
 
         title = {
             "lives": "❤️ Lives Emojis",
@@ -936,18 +1094,16 @@ async def config_callback(client, callback_query):
         )
     elif config_type == "back":
         keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🎭 Customize Emojis", callback_data=f"config_emoji_{user_id}")],
-            [InlineKeyboardButton("🔄 Reset to Default", callback_data=f"config_reset_{user_id}")],
-            [InlineKeyboardButton("❌ Close Configuration", callback_data=f"config_close_{user_id}")]
+            [InlineKeyboardButton("🎭 Customize Emojis", callback_data=encode_callback(CONFIG, "emoji", user_id))],
+            [InlineKeyboardButton("🔄 Reset to Default", callback_data=encode_callback(CONFIG, "reset", user_id))],
+            [InlineKeyboardButton("❌ Close Configuration", callback_data=encode_callback(CONFIG, "close", user_id))]
         ])
         await callback_query.message.edit_text("⚙️ **Hangman Configuration**\n\nCustomize your game experience:", reply_markup=keyboard)
 
     await callback_query.answer()
 
-@app.on_callback_query(filters.regex(r"^confirm_reset_"))
-async def confirm_reset_callback(client, callback_query):
+async def confirm_reset_callback(client, callback_query, original_user_id):
     user_id = str(callback_query.from_user.id)
-    original_user_id = callback_query.data.split("_")[-1]
 
     if not is_original_user(callback_query, original_user_id):
         await callback_query.answer("bad boy 🤡.", show_alert=True)
@@ -955,18 +1111,20 @@ async def confirm_reset_callback(client, callback_query):
 
     if user_id in user_configs:
         del user_configs[user_id]
-        save_user_configs(user_configs)
+        await save_user_config(user_id)
+        forget_user_emojis(user_id)
     await callback_query.answer("Configuration reset to default", show_alert=True)
     await callback_query.message.edit_text("Configuration reset to default. Use /play to start a new game!")
 
-@app.on_callback_query(filters.regex(r"^set_"))
-async def set_emoji_callback(client, callback_query):
-    data_parts = callback_query.data.split("_")
-    config_type = data_parts[1]
-    index = int(data_parts[2])
-    new_emoji = data_parts[3]
-    user_id = data_parts[4]
+async def set_emoji_option_callback(client, callback_query, config_type, option, index, user_id):
+    try:
+        new_emoji = emoji_options[config_type][option][index]
+    except IndexError:
+        await callback_query.answer("This option is no longer available.", show_alert=True)
+        return
+    await set_emoji_callback(client, callback_query, config_type, index, new_emoji, user_id)
 
+async def set_emoji_callback(client, callback_query, config_type, index, new_emoji, user_id):
     if not is_original_user(callback_query, user_id):
         await callback_query.answer("bad boy 🤡.", show_alert=True)
         return
@@ -977,7 +1135,8 @@ async def set_emoji_callback(client, callback_query):
         user_configs[user_id][config_type] = default_emoji_sets[config_type].copy()
 
     user_configs[user_id][config_type][index] = new_emoji
-    save_user_configs(user_configs)
+    await save_user_config(user_id)
+    forget_user_emojis(user_id)
 
     await callback_query.answer(f"{config_type.capitalize()} emoji at position {index + 1} updated to {new_emoji}")
 
@@ -985,23 +1144,23 @@ async def set_emoji_callback(client, callback_query):
     options = emoji_options[config_type]
 
     keyboard = []
-    for option in options:
+    for option_index, option in enumerate(options):
         if config_type == "keyboard":
             row = [
                 InlineKeyboardButton(f"{option[0]} {'✓' if option[0] == current_emojis[0] else ''}",
-                                     callback_data=f"set_{config_type}_0_{option[0]}_{user_id}"),
+                                     callback_data=encode_callback(SET_EMOJI, config_type, option_index, 0, user_id)),
                 InlineKeyboardButton(f"{option[1]} {'✓' if option[1] == current_emojis[1] else ''}",
-                                     callback_data=f"set_{config_type}_1_{option[1]}_{user_id}")
+                                     callback_data=encode_callback(SET_EMOJI, config_type, option_index, 1, user_id))
             ]
         else:
             row = [
                 InlineKeyboardButton(f"{emoji} {'✓' if emoji == current_emojis[i] else ''}",
-                                     callback_data=f"set_{config_type}_{i}_{emoji}_{user_id}")
+                                     callback_data=encode_callback(SET_EMOJI, config_type, option_index, i, user_id))
                 for i, emoji in enumerate(option)
             ]
         keyboard.append(row)
 
-    keyboard.append([InlineKeyboardButton("« Back", callback_data=f"config_emoji_{user_id}")])
+    keyboard.append([InlineKeyboardButton("« Back", callback_data=encode_callback(CONFIG, "emoji", user_id))])
 
     title = {
         "lives": "❤️ Lives Emojis",
@@ -1014,31 +1173,38 @@ async def set_emoji_callback(client, callback_query):
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
-@app.on_callback_query(filters.regex(r"^leaderboard_"))
-async def leaderboard_callback(client, callback_query):
-    global last_pressed_button
-
-    user_id = str(callback_query.from_user.id)
-    user_name = callback_query.from_user.first_name
-
-    if user_id in player_stats and player_stats[user_id]["name"] != user_name:
-        update_player_name(user_id, user_name)
-
-    leaderboard_type = callback_query.data.split("_")[1]
-    last_pressed_button = leaderboard_type
-
-    def format_name(name):
-        # Check if the name contains Arabic characters
-        if any('\u0600' <= char <= '\u06FF' for char in name):
-            # If it's Arabic, wrap it in RLO and PDF markers
-            return f"\u202E**{name}**\u202C"
-        # For non-Arabic names, use LRE and PDF markers
-        return f"\u202A**{name}**\u202C"
+leaderboard_versions = {"daily": 0, "wins": 0, "scores": 0}
+leaderboard_cache = {}
+
+def bump_leaderboards(user_id):
+    if user_id in daily_state.board:
+        leaderboard_versions["daily"] += 1
+    if user_id in wins_board:
+        leaderboard_versions["wins"] += 1
+    if user_id in scores_board:
+        leaderboard_versions["scores"] += 1
+
+def format_name(name):
+    # Check if the name contains Arabic characters
+    if any('\u0600' <= char <= '\u06FF' for char in name):
+        # If it's Arabic, wrap it in RLO and PDF markers
+        return f"\u202E**{name}**\u202C"
+    # For non-Arabic names, use LRE and PDF markers
+    return f"\u202A**{name}**\u202C"
+
+def format_entry(rank, name, value, unit):
+    formatted_name = format_name(name)
+    # Ensure the whole entry is wrapped in LTR override
+    return f"\u202A{rank_emoji(rank)} {formatted_name}: {value} {unit}\u202C"
+
+async def render_leaderboard(leaderboard_type):
+    version = leaderboard_versions[leaderboard_type]
+    if leaderboard_type == "daily":
+        version = (version, daily_state.current_day())
 
-    def format_entry(rank, name, value, unit):
-        formatted_name = format_name(name)
-        # Ensure the whole entry is wrapped in LTR override
-        return f"\u202A{rank_emoji(rank)} {formatted_name}: {value} {unit}\u202C"
+    cached = leaderboard_cache.get(leaderboard_type)
+    if cached is not None and cached[0] == version:
+        return cached[1]
 
     if leaderboard_type == "daily":
         title = "📅 **Daily Challenge Leaderboard**"
@@ -1046,42 +1212,49 @@ async def leaderboard_callback(client, callback_query):
         entry_formatter = lambda rank, name, value, streak: format_entry(rank, name, value, f"points (Streak: {streak})")
     elif leaderboard_type == "wins":
         title = "🏆 **Most Wins Leaderboard**"
-        sorted_data = sorted(
-            [(uid, stats["games_won"]) for uid, stats in player_stats.items() if "games_won" in stats],
-            key=itemgetter(1),
-            reverse=True
-        )[:10]
+        sorted_data = wins_board.items()
         entry_formatter = lambda rank, name, value: format_entry(rank, name, value, "wins")
-    elif leaderboard_type == "scores":
+    else:
         title = "🔥 **Highest Scores Leaderboard**"
-        sorted_data = sorted(
-            [(uid, max(stats.get("scores", [0]))) for uid, stats in player_stats.items()],
-            key=itemgetter(1),
-            reverse=True
-        )[:10]
+        sorted_data = scores_board.items()
         entry_formatter = lambda rank, name, value: format_entry(rank, name, value, "points")
-    else:
-        await callback_query.answer("Invalid leaderboard type", show_alert=True)
-        return
 
     leaderboard_text = f"{title}\n\n"
+    players = await player_stats.fetch_many(entry[0] for entry in sorted_data)
     for rank, entry in enumerate(sorted_data, start=1):
         if leaderboard_type == "daily":
             uid, value, streak = entry
-            player_name = player_stats[uid].get("name", "Unknown Player")
+            player_name = players[uid].get("name", "Unknown Player")
             entry_text = entry_formatter(rank, player_name, value, streak)
         else:
             uid, value = entry
-            player_name = player_stats[uid].get("name", "Unknown Player")
+            player_name = players[uid].get("name", "Unknown Player")
             entry_text = entry_formatter(rank, player_name, value)
 
-        extra_info = get_player_extra_info(uid, leaderboard_type)
+        extra_info = get_player_extra_info(players[uid], leaderboard_type)
         leaderboard_text += f"<blockquote>{entry_text}\n{extra_info}</blockquote>\n\n"
 
     if not sorted_data:
         leaderboard_text += "No data available yet. Start playing to climb the leaderboard!\n"
 
-    leaderboard_text += "\n" + random.choice(tips)
+    leaderboard_cache[leaderboard_type] = (version, leaderboard_text)
+    return leaderboard_text
+
+async def leaderboard_callback(client, callback_query, leaderboard_type):
+    global last_pressed_button
+
+    user_id = str(callback_query.from_user.id)
+    user_name = callback_query.from_user.first_name
+
+    await update_player_name(user_id, user_name)
+
+    if leaderboard_type not in leaderboard_versions:
+        await callback_query.answer("Invalid leaderboard type", show_alert=True)
+        return
+
+    last_pressed_button = leaderboard_type
+
+    leaderboard_text = (await render_leaderboard(leaderboard_type)) + "\n" + random.choice(tips)
 
     daily_button_text = "📅 Daily Challenge"
     wins_button_text = "🏆 Most Wins"
@@ -1095,9 +1268,9 @@ async def leaderboard_callback(client, callback_query):
         scores_button_text = "○ " + scores_button_text + " ○"
 
     keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton(daily_button_text, callback_data="leaderboard_daily")],
-        [InlineKeyboardButton(wins_button_text, callback_data="leaderboard_wins")],
-        [InlineKeyboardButton(scores_button_text, callback_data="leaderboard_scores")]
+        [InlineKeyboardButton(daily_button_text, callback_data=encode_callback(LEADERBOARD, "daily"))],
+        [InlineKeyboardButton(wins_button_text, callback_data=encode_callback(LEADERBOARD, "wins"))],
+        [InlineKeyboardButton(scores_button_text, callback_data=encode_callback(LEADERBOARD, "scores"))]
     ])
 
     try:
@@ -1118,8 +1291,7 @@ def rank_emoji(rank):
     else:
         return f"{rank}."
 
-def get_player_extra_info(user_id, leaderboard_type):
-    stats = player_stats[user_id]
+def get_player_extra_info(stats, leaderboard_type):
     games_played = stats['games_played']
     win_rate = (stats['games_won'] / games_played * 100) if games_played > 0 else 0
 
@@ -1164,57 +1336,70 @@ hangman_lost_graphic = (
     "```\n"
 )
 
-async def end_game(client, message, user_id, won):
-    game = games[user_id]
-    user_name = game["user_name"]
+@timed
+async def end_game(client, message, user_id, game, won):
+    # The outcome is logged and handed to the aggregator, which updates the
+    # stats and leaderboards and shows the result; nothing else happens here.
+    finished_at = time.time()
+    outcome = GameOutcome(
+        finished_at, int(user_id), game.chat_id, game.message_id, game.word_index, game.guessed_mask,
+        count_letters(game.guessed_mask) - game.hints, game.hints, game.attempts, game.score,
+        finished_at - game.started_at if game.started_at else 0.0, won, game.is_daily_challenge
+    )
+    event_log.append(outcome)
+    outcome_aggregator.submit((client, outcome, game.user_name))
+    await forget_game(user_id)
+
+@timed
+async def apply_game_outcome(item):
+    client, outcome, user_name = item
+    user_id = str(outcome.user_id)
+    word_entry = WORD_TABLE[outcome.word_index]
+    won = outcome.won
+    score = outcome.score
 
-    guessed_letter_count = len(game["guessed_letters"])
-    solved_word = set(game["word"]) <= game["guessed_letters"]
+    solved_word = is_word_solved(word_entry, outcome.guessed_mask)
 
-    update_player_stats(
+    stats = await update_player_stats(
         user_id,
         user_name,
         won,
-        game["score"],
-        guessed_letter_count=guessed_letter_count,
+        score,
+        guessed_letter_count=count_letters(outcome.guessed_mask),
         solved_word=solved_word
     )
 
-    update_streak(user_id)
-    new_achievements = check_achievements(user_id)
+    update_streak(user_id, stats)
+    streak = stats["streak"]
+    perfect_game = solved_word and outcome.attempts_left == calculate_attempts(word_entry.length)
+    new_achievements = check_achievements(user_id, stats, perfect_game)
 
-    if game.get("is_daily_challenge", False):
+    if outcome.is_daily_challenge:
         try:
-            final_score, daily_streak = update_daily_challenge_score(user_id, game["score"])
-            game["score"] = final_score
-            game["daily_streak"] = daily_streak
+            score, _ = update_daily_challenge_score(user_id, score)
+            await daily_state.store.save(user_id)
         except Exception as e:
             print(f"Error updating daily challenge score: {e}")
-            game["daily_streak"] = 1 
-
-    if game.get("is_daily_challenge", False):
-        final_score = update_daily_challenge_score(user_id, game["score"])
-        game["score"] = final_score
 
     if won:
         end_message = (
         f"🎉 **Congratulations, {user_name}!** 🎊🥳\n\n"
-        f"You saved the man by guessing the word: **{game['word']}**\n"
+        f"You saved the man by guessing the word: **{word_entry.word}**\n"
         f"{hangman_won_graphic}\n"
-        f"🏷️ **Category:** {game['category']}\n"
-        f"⚙️ **Difficulty:** {game['difficulty']}\n"
-        f"🏆 **Score:** {game['score']}\n"
-        f"🔥 **Streak:** {player_stats[user_id]['streak']} days\n\n"
+        f"🏷️ **Category:** {word_entry.category}\n"
+        f"⚙️ **Difficulty:** {word_entry.difficulty}\n"
+        f"🏆 **Score:** {score}\n"
+        f"🔥 **Streak:** {streak} days\n\n"
     )
     else:
         end_message = (
         f"😔 **Oh no, {user_name}!** The man was hanged.\n\n"
-        f"The word was: **{game['word']}**\n"
+        f"The word was: **{word_entry.word}**\n"
         f"{hangman_lost_graphic}\n"
-        f"🏷️ **Category:** {game['category']}\n"
-        f"⚙️ **Difficulty:** {game['difficulty']}\n"
-        f"🏆 **Score:** {game['score']}\n"
-        f"🔥 **Streak:** {player_stats[user_id]['streak']} days\n\n"
+        f"🏷️ **Category:** {word_entry.category}\n"
+        f"⚙️ **Difficulty:** {word_entry.difficulty}\n"
+        f"🏆 **Score:** {score}\n"
+        f"🔥 **Streak:** {streak} days\n\n"
     )
 
     if new_achievements:
@@ -1222,133 +1407,394 @@ async def end_game(client, message, user_id, won):
 
     end_message += f"🌟 **{'Great job! Keep it up!' if won else 'Better luck next time!'}** 🌟"
 
-    if game.get("is_daily_challenge", False):
+    if outcome.is_daily_challenge:
         end_message += f"\n\n📊 Check /ranking to see your ranking!"
 
     play_again_keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("🎮 Play Again", callback_data=f"play_again_{user_id}")]
+        [InlineKeyboardButton("🎮 Play Again", callback_data=encode_callback(PLAY_AGAIN, user_id))]
     ])
 
-    try:
-        await client.edit_message_text(
-            chat_id=game["chat_id"],
-            message_id=game["message_ids"][-1],  
-            text=end_message,
-            reply_markup=play_again_keyboard
-        )
-    except FloodWait as e:
-        await asyncio.sleep(e.value)
-        await client.edit_message_text(
-            chat_id=game["chat_id"],
-            message_id=game["message_ids"][-1], 
-            text=end_message,
-            reply_markup=play_again_keyboard
+    await player_stats_store.save(user_id)
+    outbox.edit(
+        client,
+        outcome.chat_id,
+        outcome.message_id,
+        text=end_message,
+        reply_markup=play_again_keyboard
+    )
+
+outcome_aggregator = Aggregator(apply_game_outcome)
+
+
+MAX_LISTED_PLAYERS = 10
+
+def group_scores(game, won):
+    # A won game's score is shared out by how many of the word's letters each
+    # player found. Returns ({player: score}, {player: letters found}).
+    word_mask = game.word_entry.mask
+    found = {player_id: count_letters(guessed_mask & word_mask) for player_id, (_, guessed_mask, _) in game.players.items()}
+    total_found = sum(found.values())
+    team_score = game.score if won else 0
+    scores = {player_id: team_score * count // total_found if total_found else 0 for player_id, count in found.items()}
+    return scores, found
+
+def format_group_result(game, won, scores, found, solver_id):
+    word_entry = game.word_entry
+    if won:
+        text = f"🎉 **The group saved the man!** 🎊🥳\n\nThe word was: **{word_entry.word}**\n{hangman_won_graphic}\n"
+    else:
+        text = f"😔 **Oh no, the man was hanged.**\n\nThe word was: **{word_entry.word}**\n{hangman_lost_graphic}\n"
+    text += (
+        f"🏷️ **Category:** {word_entry.category}\n"
+        f"⚙️ **Difficulty:** {word_entry.difficulty}\n"
+        f"🏆 **Team Score:** {game.score if won else 0}\n"
+    )
+
+    ranking = sorted(game.players, key=lambda player_id: (-scores[player_id], -found[player_id]))
+    if ranking:
+        text += "\n👥 **Players:**\n"
+        for rank, player_id in enumerate(ranking[:MAX_LISTED_PLAYERS], 1):
+            letters, points = found[player_id], scores[player_id]
+            text += (
+                f"{rank_emoji(rank)} {format_name(game.players[player_id][0])}: "
+                f"{letters} letter{'' if letters == 1 else 's'}, {points} point{'' if points == 1 else 's'}\n"
+            )
+        if len(ranking) > MAX_LISTED_PLAYERS:
+            text += f"...and {len(ranking) - MAX_LISTED_PLAYERS} more\n"
+    if solver_id is not None:
+        text += f"\n🎯 {format_name(game.players[solver_id][0])} found the last letter!"
+    return text
+
+@timed
+async def end_group_game(client, message, game_id, game, won, solver_id=None):
+    # Every player gets an outcome with their share of the score. The result
+    # only needs the game itself, so it is shown right away.
+    finished_at = time.time()
+    duration = finished_at - game.started_at if game.started_at else 0.0
+    scores, found = group_scores(game, won)
+    for player_id, (player_name, guessed_mask, hints) in game.players.items():
+        outcome = GameOutcome(
+            finished_at, int(player_id), game.chat_id, game.message_id, game.word_index, guessed_mask,
+            count_letters(guessed_mask), hints, game.attempts, scores[player_id], duration, won, False, True
         )
+        event_log.append(outcome)
+        submit_player_outcome(outcome, player_name, player_id == solver_id)
 
-    del games[user_id]
-    if user_id in game_activity:
-        del game_activity[user_id]
+    play_again_keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("🎮 Play Again", callback_data=encode_callback(PLAY_AGAIN, game_id))]
+    ])
+    outbox.edit(
+        client,
+        game.chat_id,
+        game.message_id,
+        text=format_group_result(game, won, scores, found, solver_id),
+        reply_markup=play_again_keyboard
+    )
+    await forget_game(game_id)
+
+@timed
+async def apply_player_outcome(item):
+    # One player's part in a group game, applied by whoever owns the
+    # player's stats (another shard worker than the chat's, possibly).
+    outcome, user_name, solved_word = item
+    user_id = str(outcome.user_id)
+    word_entry = WORD_TABLE[outcome.word_index]
+    stats = await update_player_stats(
+        user_id,
+        user_name,
+        outcome.won,
+        outcome.score,
+        guessed_letter_count=count_letters(outcome.guessed_mask & word_entry.mask),
+        solved_word=solved_word
+    )
+    check_achievements(user_id, stats)
+    await player_stats_store.save(user_id)
+
+player_outcome_aggregator = Aggregator(apply_player_outcome)
 
+# Set by shard workers to send a player's outcome to the worker that owns
+# the player.
+forward_player_outcome = None
 
-@app.on_callback_query(filters.regex(r"^play_again_"))
-async def play_again_callback(client, callback_query):
+def submit_player_outcome(outcome, user_name, solved_word):
+    if forward_player_outcome is not None:
+        forward_player_outcome(outcome, user_name, solved_word)
+    else:
+        player_outcome_aggregator.submit((outcome, user_name, solved_word))
+
+
+async def play_again_callback(client, callback_query, original_user_id):
     user_id = str(callback_query.from_user.id)
-    original_user_id = callback_query.data.split("_")[-1]
 
-    if user_id != original_user_id:
+    if not may_play(callback_query, original_user_id):
         await callback_query.answer("Oops! 🚫 This is not your game. Start your own with /play!", show_alert=True)
         return
 
-    difficulty_emojis = user_configs.get(user_id, {}).get("difficulty", default_emoji_sets["difficulty"])
+    if is_group_game(original_user_id):
+        await callback_query.message.edit_text(
+            "👥 **Group Hangman!** 🎉\n\nAnyone can pick a category! 📚",
+            reply_markup=category_keyboard(original_user_id, daily=False)
+        )
+        await callback_query.answer()
+        return
 
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("Daily Challenge 📅", callback_data=f"daily_challenge_{user_id}")],
-        [InlineKeyboardButton("Animals 🐾", callback_data=f"category_animals_{user_id}")],
-        [InlineKeyboardButton("Countries 🌎", callback_data=f"category_countries_{user_id}")],
-        [InlineKeyboardButton("Foods 🍔", callback_data=f"category_foods_{user_id}")],
-        [InlineKeyboardButton("Fruits 🍎", callback_data=f"category_fruits_{user_id}")],
-        [InlineKeyboardButton("Vegetables 🥕", callback_data=f"category_vegetables_{user_id}")],
-        [InlineKeyboardButton("Colors 🎨", callback_data=f"category_colors_{user_id}")],
-        [InlineKeyboardButton("Sports ⚽️", callback_data=f"category_sports_{user_id}")],
-        [InlineKeyboardButton("Occupations 🧑‍💼", callback_data=f"category_occupations_{user_id}")],
-        [InlineKeyboardButton("Actions 🏃", callback_data=f"category_actions_{user_id}")],
-        [InlineKeyboardButton("Adjectives ✨", callback_data=f"category_adjectives_{user_id}")]
-    ])
+    keyboard = category_keyboard(user_id)
 
     await callback_query.message.edit_text(
         "🎮 **Hangman Game!** 🎉\n\nSelect a category or try the daily challenge! 📚",
         reply_markup=keyboard
     )
     await callback_query.answer()
-    
-    
+
+async def used_callback(client, callback_query, game_user_id):
+    await callback_query.answer()
+
+
+CALLBACK_HANDLERS = {
+    DAILY: daily_challenge_callback,
+    GUESS: guess_callback,
+    HINT: hint_callback,
+    USED: used_callback,
+    CATEGORY: category_callback,
+    DIFFICULTY: difficulty_callback,
+    STATS: stats_section_callback,
+    CONFIG: config_callback,
+    CONFIRM_RESET: confirm_reset_callback,
+    SET_EMOJI: set_emoji_option_callback,
+    SET_EMOJI_LEGACY: set_emoji_callback,
+    LEADERBOARD: leaderboard_callback,
+    PLAY_AGAIN: play_again_callback,
+}
+
+# Every button press goes through this one handler: the payload is decoded
+# once and dispatched by opcode instead of being matched against a regex per
+# handler.
+@app.on_callback_query()
+async def callback_router(client, callback_query):
+    decoded = decode_callback(callback_query.data)
+    if decoded is None:
+        await callback_query.answer("This button has expired. Start a new game with /play!", show_alert=True)
+        return
+    opcode, args = decoded
+    handler = CALLBACK_HANDLERS[opcode]
+    with handler_seconds.time(handler.__name__):
+        await handler(client, callback_query, *args)
+
+
+@app.on_message(filters.command("groupplay"))
+@timed
+async def group_play_command(client, message):
+    if message.chat.id > 0:
+        await message.reply_text("👥 Group games are played in group chats. Use /play to play on your own!")
+        return
+
+    game_id = str(message.chat.id)
+    game = await game_store.get(game_id)
+    if game is not None and game.started:
+        await message.reply_text("A game is already running in this chat! Keep guessing 🔠")
+        return
+
+    sent_message = await message.reply_text(
+        "👥 **Group Hangman!** 🎉\n\nAnyone can pick a category, and everyone can guess! 📚",
+        reply_markup=category_keyboard(game_id, daily=False)
+    )
+    await track_game_setup(game_id, "category_selection", message.chat.id, sent_message.id)
+
+
+@app.on_message(filters.command("botstats"))
+@timed
+async def botstats_command(client, message):
+    if message.from_user.id not in ADMINS:
+        return
+    title = "📈 **Bot Stats**" if SHARD_INDEX is None else f"📈 **Bot Stats** (worker {SHARD_INDEX})"
+    await message.reply_text(f"{title}\n```\n{metrics_summary()}\n```")
+
+
+background_tasks = set()
+
+def run_in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def save_profile(profiler, seconds):
+    worker = "" if SHARD_INDEX is None else f"-worker{SHARD_INDEX}"
+    name = datetime.now().strftime("profile-%Y%m%d-%H%M%S") + worker
+    collapsed_path, summary_path = await collect_profile(profiler, seconds, PROFILE_DIR, name)
+    print(f"Wrote profile to {collapsed_path} and {summary_path}")
+    return collapsed_path
+
+async def profile_and_reply(profiler, message, seconds):
+    try:
+        collapsed_path = await save_profile(profiler, seconds)
+    except Exception as e:
+        print(f"Error profiling: {e}")
+        await message.reply_text("❌ Profiling failed, see the bot's log.")
+        return
+    summary = profiler.summary(limit=15)[:3500]
+    await message.reply_text(f"🔥 **Profile**\n```\n{summary}\n```\nFlamegraph stacks: `{collapsed_path}`")
+
+async def profile_to_log(profiler, seconds):
+    try:
+        await save_profile(profiler, seconds)
+    except Exception as e:
+        print(f"Error profiling: {e}")
+        return
+    print(profiler.summary())
+
+def profile_on_signal():
+    try:
+        profiler = start_profiler()
+    except RuntimeError as e:
+        print(f"Error profiling: {e}")
+        return
+    print(f"Profiling for {DEFAULT_PROFILE_SECONDS}s")
+    run_in_background(profile_to_log(profiler, DEFAULT_PROFILE_SECONDS))
+
+
+@app.on_message(filters.command("profile"))
+@timed
+async def profile_command(client, message):
+    if message.from_user.id not in ADMINS:
+        return
+    try:
+        seconds = int(message.command[1]) if len(message.command) > 1 else DEFAULT_PROFILE_SECONDS
+    except ValueError:
+        await message.reply_text(f"Usage: /profile [seconds, up to {MAX_PROFILE_SECONDS}]")
+        return
+    seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+    try:
+        profiler = start_profiler()
+    except RuntimeError:
+        await message.reply_text("⏳ A profile is already running.")
+        return
+    # The results are sent from a task of its own so that the handler
+    # returns now.
+    run_in_background(profile_and_reply(profiler, message, seconds))
+    worker = "" if SHARD_INDEX is None else f" on worker {SHARD_INDEX}"
+    await message.reply_text(f"⏱️ Profiling{worker} for {seconds}s...")
+
+
 @app.on_message(filters.command("ranking"))
+@timed
 async def leaderboard_command(client, message):
     global last_pressed_button
     
     user_id = str(message.from_user.id)
     user_name = message.from_user.first_name
     
-    if user_id in player_stats and player_stats[user_id]["name"] != user_name:
-        update_player_name(user_id, user_name)
+    await update_player_name(user_id, user_name)
 
     last_pressed_button = "wins"  
 
-    def format_name(name):
-        if any('\u0600' <= char <= '\u06FF' for char in name):
-            return f"\u202E**{name}**\u202C"
-        return f"\u202A**{name}**\u202C"
-
-    def format_entry(rank, name, value, unit):
-        formatted_name = format_name(name)
-        return f"\u202A{rank_emoji(rank)} {formatted_name}: {value} {unit}\u202C"
-
-    title = "🏆 **Most Wins Leaderboard**"
-    sorted_data = sorted(
-        [(uid, stats["games_won"]) for uid, stats in player_stats.items() if "games_won" in stats],
-        key=itemgetter(1),
-        reverse=True
-    )[:10]
-    entry_formatter = lambda rank, name, value: format_entry(rank, name, value, "wins")
-
-    leaderboard_text = f"{title}\n\n"
-    for rank, entry in enumerate(sorted_data, start=1):
-        uid, value = entry
-        player_name = player_stats[uid].get("name", "Unknown Player")
-        entry_text = entry_formatter(rank, player_name, value)
-
-        extra_info = get_player_extra_info(uid, "wins")
-        leaderboard_text += f"<blockquote>{entry_text}\n{extra_info}</blockquote>\n\n"
-
-    if not sorted_data:
-        leaderboard_text += "No data available yet. Start playing to climb the leaderboard!\n"
-
-    leaderboard_text += "\n" + random.choice(tips)
+    leaderboard_text = (await render_leaderboard("wins")) + "\n" + random.choice(tips)
 
     daily_button_text = "📅 Daily Challenge"
     wins_button_text = "○ 🏆 Most Wins ○"  # Pre-selected button
     scores_button_text = "🔥 Highest Scores"
 
     keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton(daily_button_text, callback_data="leaderboard_daily")],
-        [InlineKeyboardButton(wins_button_text, callback_data="leaderboard_wins")],
-        [InlineKeyboardButton(scores_button_text, callback_data="leaderboard_scores")]
+        [InlineKeyboardButton(daily_button_text, callback_data=encode_callback(LEADERBOARD, "daily"))],
+        [InlineKeyboardButton(wins_button_text, callback_data=encode_callback(LEADERBOARD, "wins"))],
+        [InlineKeyboardButton(scores_button_text, callback_data=encode_callback(LEADERBOARD, "scores"))]
     ])
 
     await message.reply_text(leaderboard_text, reply_markup=keyboard)
-user_configs = load_user_configs()
+
+
+# Used by shard workers, which receive commands from the ingress process
+# instead of through the client's own handlers.
+COMMAND_HANDLERS = {
+    "hangman": start_command,
+    "stats": stats_command,
+    "play": play_command,
+    "groupplay": group_play_command,
+    "config": config_command,
+    "ranking": leaderboard_command,
+    "botstats": botstats_command,
+    "profile": profile_command,
+}
+
+# Group -1 runs before the handlers above and lets the update through to them.
+if trace_recorder is not None:
+    from shard import callback_frame, message_frame
+
+    @app.on_message(filters.command(list(COMMAND_HANDLERS)), group=-1)
+    async def trace_message(client, message):
+        if message.from_user is not None:
+            trace_recorder.record(message_frame(message, message.command[0].lower()))
+
+    @app.on_callback_query(group=-1)
+    async def trace_callback_query(client, callback_query):
+        trace_recorder.record(callback_frame(callback_query))
+
+Gauge("hangman_active_games", "Games in progress.", game_store.active_count)
+Gauge("hangman_cached_players", "Player records held in memory.", lambda: len(player_stats.entries))
+Gauge(
+    "hangman_unwritten_records", "Changed records waiting to be written.",
+    lambda: {store.name: len(store.dirty) for store in (player_stats_store, daily_state.store, user_configs_store)},
+    label="store"
+)
+Gauge("hangman_pending_edits", "Message edits queued in the outbox.", lambda: len(outbox.pending))
+Gauge(
+    "hangman_pending_outcomes", "Finished games not yet folded into the stats.",
+    lambda: len(outcome_aggregator.pending) + len(player_outcome_aggregator.pending)
+)
 
 load_player_stats()
+atexit.register(flush_all_sync, player_stats_store, daily_state.store, user_configs_store)
+atexit.register(event_log.flush_sync)
+if trace_recorder is not None:
+    atexit.register(trace_recorder.flush_sync)
+
 
+metrics_server = None
 
 async def on_startup():
+    global metrics_server
     print("Hangman bot has started!")
-    asyncio.create_task(check_inactive_games())
+    player_stats_store.start()
+    user_configs_store.start()
+    outbox.start()
+    event_log.start()
+    outcome_aggregator.start()
+    player_outcome_aggregator.start()
+    daily_state.store.start()
+    game_store.start()
+    if trace_recorder is not None:
+        trace_recorder.start()
+    asyncio.create_task(game_store.run_expiry(delete_inactive_games))
+    asyncio.create_task(monitor_loop_lag())
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profile_on_signal)
+    if METRICS_PORT:
+        metrics_server = await serve_metrics(METRICS_PORT)
+
+async def on_shutdown():
+    if metrics_server is not None:
+        metrics_server.close()
+    # The aggregator goes first: folding the last outcomes still queues edits
+    # and marks players dirty.
+    await outcome_aggregator.close()
+    await player_outcome_aggregator.close()
+    await outbox.close()
+    await event_log.close()
+    await player_stats_store.close()
+    await daily_state.store.close()
+    await user_configs_store.close()
+    await game_store.close()
+    if trace_recorder is not None:
+        await trace_recorder.close()
+    storage.close()
+    print("Hangman bot has stopped.")
 
 async def main():
     await app.start()
     await on_startup()
     await idle()
+    await on_shutdown()
+    await app.stop()
 
 if __name__ == "__main__":
     print('Hangman bot is starting...')
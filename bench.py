@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+
+# Drives the real handlers with a fake Telegram client: every simulated user
+# sends /play, picks a category and a difficulty and guesses letters until the
+# game ends. Runs against a throwaway data directory, so it never touches the
+# bot's own files.
+#
+#   python bench.py --users 2000 --concurrency 500
+#   python bench.py --users 2000 --save benchmarks/baseline.json
+#   python bench.py --users 2000 --compare benchmarks/baseline.json
+class FakeChat:
+    __slots__ = ("id", "type")
+
+    def __init__(self, chat_id):
+        self.id = chat_id
+        self.type = "private" if chat_id > 0 else "group"
+
+
+class FakeUser:
+    __slots__ = ("id", "first_name")
+
+    def __init__(self, user_id, first_name):
+        self.id = user_id
+        self.first_name = first_name
+
+
+class FakeMessage:
+    def __init__(self, client, chat_id, message_id, from_user=None, text=None):
+        self._client = client
+        self.chat = FakeChat(chat_id)
+        self.id = message_id
+        self.from_user = from_user
+        self.text = text
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        return await self._client.send_message(self.chat.id, text, reply_markup=reply_markup)
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        return await self._client.edit_message_text(self.chat.id, self.id, text, reply_markup=reply_markup)
+
+
+class FakeCallbackQuery:
+    def __init__(self, client, query_id, from_user, message, data):
+        self._client = client
+        self.id = query_id
+        self.from_user = from_user
+        self.message = message
+        self.data = data
+
+    async def answer(self, text=None, show_alert=None, **kwargs):
+        return await self._client.answer_callback_query(self.id, text=text, show_alert=show_alert)
+
+
+class FakeClient:
+    # Stands in for hydrogram's Client: every call succeeds after `latency`
+    # seconds and is only counted. The last message sent to each chat is
+    # remembered, the way a user would see it.
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.last_message = {}
+        self._message_ids = itertools.count(1)
+
+    async def _call(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        await self._call("send_message")
+        message = FakeMessage(self, chat_id, next(self._message_ids), text=text)
+        self.last_message[chat_id] = message.id
+        return message
+
+    async def edit_message_text(self, chat_id, message_id, text, reply_markup=None, **kwargs):
+        await self._call("edit_message_text")
+        return FakeMessage(self, chat_id, message_id, text=text)
+
+    async def answer_callback_query(self, callback_query_id, text=None, show_alert=None, **kwargs):
+        await self._call("answer_callback_query")
+        return True
+
+    async def delete_messages(self, chat_id, message_ids, **kwargs):
+        await self._call("delete_messages")
+        return True
+
+
+def prepare_environment(directory, storage="sqlite", game_store="memory"):
+    # Must run before Hangman is imported: it reads these at import time.
+    os.chdir(directory)
+    os.environ["HANGMAN_STORAGE"] = storage
+    os.environ["HANGMAN_DB"] = os.path.join(directory, "hangman.db")
+    os.environ["HANGMAN_GAME_STORE"] = game_store
+    os.environ["HANGMAN_GAME_SNAPSHOT"] = os.path.join(directory, "games.snapshot")
+    os.environ["HANGMAN_EVENT_LOG"] = os.path.join(directory, "events")
+    os.environ.pop("HANGMAN_METRICS_PORT", None)
+    os.environ.pop("HANGMAN_SHARD_INDEX", None)
+
+
+def lift_telegram_limits(outbox):
+    # The fake client has no flood limits; without this the outbox would pace
+    # edits the way Telegram requires and the run would measure the pacing.
+    from outbox import TokenBucket
+
+    outbox.PRIVATE_CHAT_RATE = outbox.GROUP_CHAT_RATE = (1e9, 1e9)
+    outbox.global_bucket = TokenBucket(1e9, 1e9)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.updates = 0
+
+    async def measure(self, step, awaitable, update=True):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.latencies[step].append(time.perf_counter() - start)
+            self.updates += update
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def play_game(hangman, client, recorder, user, rng, daily=False):
+    from callbacks import CATEGORY, DAILY, DIFFICULTY, GUESS, encode_callback
+    from word_index import ALPHABET
+
+    user_id = str(user.id)
+    chat_id = user.id
+    query_ids = itertools.count(1)
+
+    def callback(*payload):
+        message = FakeMessage(client, chat_id, client.last_message[chat_id])
+        return FakeCallbackQuery(client, f"{user_id}-{next(query_ids)}", user, message, encode_callback(*payload))
+
+    command = FakeMessage(client, chat_id, 0, from_user=user, text="/play")
+    await recorder.measure("play", hangman.COMMAND_HANDLERS["play"](client, command))
+    if daily:
+        await recorder.measure("daily", hangman.callback_router(client, callback(DAILY, user_id)))
+    else:
+        category = rng.choice(sorted(hangman.CATEGORIES))
+        difficulty = rng.choice(("easy", "medium", "hard"))
+        await recorder.measure("category", hangman.callback_router(client, callback(CATEGORY, category, user_id)))
+        await recorder.measure("difficulty", hangman.callback_router(client, callback(DIFFICULTY, category, difficulty, user_id)))
+
+    # The space is a key of its own for words with more than one part.
+    letters = list(ALPHABET)
+    rng.shuffle(letters)
+    for letter in letters:
+        if await hangman.game_store.get(user_id) is None:
+            break
+        await recorder.measure("guess", hangman.callback_router(client, callback(GUESS, letter, user_id)))
+
+
+async def run(args):
+    import Hangman as hangman
+
+    client = FakeClient(args.latency)
+    recorder = Recorder()
+    if not args.telegram_limits:
+        lift_telegram_limits(hangman.outbox)
+
+    # end_game is reached from the last guess; time it on its own as well.
+    end_game = hangman.end_game
+
+    async def timed_end_game(*end_args, **kwargs):
+        return await recorder.measure("end_game", end_game(*end_args, **kwargs), update=False)
+
+    hangman.end_game = timed_end_game
+
+    await hangman.on_startup()
+    rng = random.Random(args.seed)
+    users = [FakeUser(1_000_000 + i, f"Player {i}") for i in range(args.users)]
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def simulate(user, seed):
+        user_rng = random.Random(seed)
+        async with slots:
+            for _ in range(args.games):
+                await play_game(hangman, client, recorder, user, user_rng, daily=user_rng.random() < args.daily)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    await asyncio.gather(*(simulate(user, rng.random()) for user in users))
+    elapsed = time.perf_counter() - start
+    active_games = hangman.game_store.active_count()
+    cached_players = len(hangman.player_stats.entries)
+
+    start = time.perf_counter()
+    await hangman.on_shutdown()
+    drain = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    games = len(recorder.latencies["end_game"])
+    return {
+        "config": {
+            "users": args.users, "games": args.games, "concurrency": args.concurrency, "daily": args.daily,
+            "latency": args.latency, "storage": args.storage, "game_store": args.game_store,
+            "telegram_limits": args.telegram_limits, "seed": args.seed,
+        },
+        "environment": {"python": platform.python_version(), "machine": platform.machine(), "date": datetime.now().isoformat(timespec="seconds")},
+        "results": {
+            "elapsed_seconds": elapsed,
+            "drain_seconds": drain,
+            "updates": recorder.updates,
+            "games_finished": games,
+            "updates_per_second": recorder.updates / elapsed,
+            "games_per_second": games / elapsed,
+            "peak_rss_mb": rss_after / 1024,
+            "rss_growth_mb": (rss_after - rss_before) / 1024,
+            "games_left": active_games,
+            "cached_players": cached_players,
+            "api_calls": dict(client.calls),
+            "steps": {
+                step: {
+                    "count": len(values),
+                    "p50_ms": percentile(values, 0.5) * 1000,
+                    "p99_ms": percentile(values, 0.99) * 1000,
+                    "max_ms": max(values) * 1000,
+                }
+                for step, values in recorder.latencies.items()
+            },
+        },
+    }
+
+
+def print_report(report):
+    config, results = report["config"], report["results"]
+    print(
+        f"{config['users']} users x {config['games']} games, concurrency {config['concurrency']}, "
+        f"{config['storage']}/{config['game_store']}"
+    )
+    print(
+        f"{results['updates']} updates in {results['elapsed_seconds']:.2f}s: "
+        f"{results['updates_per_second']:.0f} updates/s, {results['games_per_second']:.0f} games/s "
+        f"(final flush {results['drain_seconds']:.2f}s)"
+    )
+    print(f"{'step':<12} {'count':>8} {'p50':>9} {'p99':>9} {'max':>9}")
+    for step, stats in results["steps"].items():
+        print(f"{step:<12} {stats['count']:>8} {stats['p50_ms']:>7.2f}ms {stats['p99_ms']:>7.2f}ms {stats['max_ms']:>7.2f}ms")
+    print(
+        f"peak RSS {results['peak_rss_mb']:.1f}MB (+{results['rss_growth_mb']:.1f}MB during the run), "
+        f"{results['cached_players']} players cached, {results['games_left']} games left"
+    )
+
+
+def compare(report, baseline):
+    # Positive change is an improvement for every line.
+    def change(current, previous, higher_is_better):
+        if not previous:
+            return "      -"
+        delta = (current - previous) / previous * 100
+        return f"{delta if higher_is_better else -delta:>+6.1f}%"
+
+    results, previous = report["results"], baseline["results"]
+    print(f"\ncompared with baseline from {baseline['environment']['date']} (positive is better)")
+    rows = [
+        ("updates/s", results["updates_per_second"], previous["updates_per_second"], True),
+        ("games/s", results["games_per_second"], previous["games_per_second"], True),
+        ("peak RSS MB", results["peak_rss_mb"], previous["peak_rss_mb"], False),
+    ]
+    for step, stats in results["steps"].items():
+        old = previous["steps"].get(step)
+        if old:
+            rows.append((f"{step} p50 ms", stats["p50_ms"], old["p50_ms"], False))
+            rows.append((f"{step} p99 ms", stats["p99_ms"], old["p99_ms"], False))
+    for label, current, old, higher_is_better in rows:
+        print(f"  {label:<18} {old:>10.2f} -> {current:>10.2f} {change(current, old, higher_is_better)}")
+    if report["config"] != baseline["config"]:
+        print("  (the baseline was recorded with different settings)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Hangman handlers with simulated users.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--games", type=int, default=1, help="games played by each user")
+    parser.add_argument("--concurrency", type=int, default=500, help="users playing at the same time")
+    parser.add_argument("--daily", type=float, default=0.0, help="share of games that are daily challenges")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds each fake API call takes")
+    parser.add_argument("--storage", choices=("sqlite", "json"), default="sqlite")
+    parser.add_argument("--game-store", choices=("memory", "redis"), default="memory")
+    parser.add_argument("--telegram-limits", action="store_true", help="keep the outbox's Telegram rate limits")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare with a saved baseline")
+    parser.add_argument("--keep", action="store_true", help="keep the data directory")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    save = os.path.abspath(args.save) if args.save else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    directory = tempfile.mkdtemp(prefix="hangman-bench-")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    prepare_environment(directory, args.storage, args.game_store)
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if args.keep:
+            print(f"Data left in {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    print_report(report)
+    if baseline_path:
+        with open(baseline_path) as f:
+            compare(report, json.load(f))
+    if save:
+        os.makedirs(os.path.dirname(save), exist_ok=True)
+        with open(save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import base64
+
+from word_index import ALPHABET, CATEGORIES, DIFFICULTIES
+
+
+# Callback data is "<version><base64url payload>". The payload is an opcode
+# byte followed by the fields listed in CALLBACK_FIELDS; user ids are zigzag
+# varints, "index" fields are raw bytes and every other field is an index into
+# one of the tables below. Buttons sent before this format still carry the
+# "<name>_<arg>_..." strings and are parsed by decode_legacy_callback.
+CALLBACK_VERSION = "1"
+
+DAILY = 1
+GUESS = 2
+HINT = 3
+USED = 4
+CATEGORY = 5
+DIFFICULTY = 6
+STATS = 7
+CONFIG = 8
+CONFIRM_RESET = 9
+SET_EMOJI = 10
+LEADERBOARD = 11
+PLAY_AGAIN = 12
+# Old "set_" buttons name the emoji itself rather than its option row.
+SET_EMOJI_LEGACY = 13
+
+STATS_SECTIONS = ("general", "performance", "achievements")
+CONFIG_ACTIONS = ("emoji", "reset", "close", "lives", "keyboard", "difficulty", "back")
+EMOJI_TYPES = ("lives", "keyboard", "difficulty")
+LEADERBOARDS = ("daily", "wins", "scores")
+
+FIELD_TABLES = {
+    "letter": ALPHABET,
+    "category": CATEGORIES,
+    "difficulty": DIFFICULTIES,
+    "section": STATS_SECTIONS,
+    "config": CONFIG_ACTIONS,
+    "emoji_type": EMOJI_TYPES,
+    "board": LEADERBOARDS,
+}
+FIELD_INDEXES = {kind: {value: i for i, value in enumerate(table)} for kind, table in FIELD_TABLES.items()}
+
+CALLBACK_FIELDS = {
+    DAILY: ("user",),
+    GUESS: ("letter", "user"),
+    HINT: ("user",),
+    USED: ("user",),
+    CATEGORY: ("category", "user"),
+    DIFFICULTY: ("category", "difficulty", "user"),
+    STATS: ("section", "user"),
+    CONFIG: ("config", "user"),
+    CONFIRM_RESET: ("user",),
+    SET_EMOJI: ("emoji_type", "index", "index", "user"),
+    LEADERBOARD: ("board",),
+    PLAY_AGAIN: ("user",),
+}
+
+CALLBACK_DATA_LIMIT = 64
+
+
+def _write_varint(out, value):
+    value = (value << 1) ^ (value >> 63)
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(payload, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = payload[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return (value >> 1) ^ -(value & 1), position
+
+
+def encode_callback(opcode, *args):
+    fields = CALLBACK_FIELDS[opcode]
+    if len(args) != len(fields):
+        raise ValueError(f"Opcode {opcode} takes {len(fields)} arguments, got {len(args)}")
+    out = bytearray((opcode,))
+    for kind, value in zip(fields, args):
+        if kind == "user":
+            _write_varint(out, int(value))
+        elif kind == "index":
+            out.append(value)
+        else:
+            out.append(FIELD_INDEXES[kind][value])
+    data = CALLBACK_VERSION + base64.urlsafe_b64encode(bytes(out)).rstrip(b"=").decode()
+    if len(data.encode()) > CALLBACK_DATA_LIMIT:
+        raise ValueError(f"Callback data for opcode {opcode} is {len(data)} bytes long")
+    return data
+
+
+def decode_callback(data):
+    if not data:
+        return None
+    if data[0] != CALLBACK_VERSION:
+        return decode_legacy_callback(data)
+    try:
+        encoded = data[1:]
+        payload = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+        opcode = payload[0]
+        position = 1
+        args = []
+        for kind in CALLBACK_FIELDS[opcode]:
+            if kind == "user":
+                value, position = _read_varint(payload, position)
+                args.append(str(value))
+            elif kind == "index":
+                args.append(payload[position])
+                position += 1
+            else:
+                args.append(FIELD_TABLES[kind][payload[position]])
+                position += 1
+    except (ValueError, KeyError, IndexError):
+        return None
+    return opcode, tuple(args)
+
+
+def decode_legacy_callback(data):
+    parts = data.split("_")
+    name = parts[0]
+    try:
+        if name == "daily":
+            return DAILY, (parts[-1],)
+        if name == "guess":
+            return GUESS, (parts[1], parts[-1])
+        if name == "hint":
+            return HINT, (parts[-1],)
+        if name == "used":
+            return USED, (parts[-1],)
+        if name == "category":
+            return CATEGORY, (parts[1], parts[2])
+        if name == "difficulty":
+            return DIFFICULTY, (parts[1], parts[2], parts[3])
+        if name == "stats":
+            return STATS, (parts[1], parts[-1])
+        if name == "config":
+            return CONFIG, (parts[1], parts[2] if len(parts) > 2 else None)
+        if name == "confirm":
+            return CONFIRM_RESET, (parts[-1],)
+        if name == "set":
+            return SET_EMOJI_LEGACY, (parts[1], int(parts[2]), parts[3], parts[4])
+        if name == "leaderboard":
+            return LEADERBOARD, (parts[1],)
+        if name == "play":
+            return PLAY_AGAIN, (parts[-1],)
+    except (IndexError, ValueError):
+        return None
+    return None
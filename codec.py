@@ -0,0 +1,147 @@
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+
+# JSON encoding for everything the bot writes to disk or sends between
+# processes. Output is compact UTF-8; sets are written as lists and dates as
+# ISO strings, so live player records can be encoded as they are. orjson or
+# msgspec is used when installed (HANGMAN_JSON_CODEC picks one explicitly).
+def _default(value):
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class StdlibCodec:
+    name = "json"
+    DecodeError = ValueError
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default)
+
+    def dumps(self, value):
+        return self._encoder.encode(value).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    name = "orjson"
+    DecodeError = ValueError
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def dumps(self, value):
+        # Dates are handled natively; sets go through the default hook.
+        return self._orjson.dumps(value, default=_default)
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+
+class MsgspecCodec:
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self._encoder = msgspec.json.Encoder(enc_hook=_default)
+        self._decoder = msgspec.json.Decoder()
+        self.DecodeError = (msgspec.DecodeError, ValueError)
+
+    def dumps(self, value):
+        return self._encoder.encode(value)
+
+    def loads(self, data):
+        return self._decoder.decode(data)
+
+
+CODECS = {codec.name: codec for codec in (OrjsonCodec, MsgspecCodec, StdlibCodec)}
+
+
+def available_codecs():
+    found = []
+    for codec_class in CODECS.values():
+        try:
+            found.append(codec_class())
+        except ImportError:
+            pass
+    return found
+
+
+def get_codec(name=None):
+    name = name or os.getenv("HANGMAN_JSON_CODEC", "auto")
+    if name == "auto":
+        return available_codecs()[0]
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec: {name}")
+    return CODECS[name]()
+
+
+codec = get_codec()
+
+
+def fake_players(count, seed=0):
+    rng = random.Random(seed)
+    today = date.today()
+    achievements = ["first_win", "streak_7", "games_50", "words_20", "perfect_game"]
+    return {
+        str(100000000 + i): {
+            "games_played": rng.randint(0, 500),
+            "games_won": rng.randint(0, 300),
+            "total_score": rng.randint(0, 50000),
+            "guessed_letters": rng.randint(0, 5000),
+            "solved_words": rng.randint(0, 300),
+            "name": f"Player {i}",
+            "streak": rng.randint(0, 30),
+            "last_played": today - timedelta(days=rng.randint(0, 60)),
+            "achievements": set(rng.sample(achievements, rng.randint(0, 5))),
+            "scores": sorted((rng.randint(0, 500) for _ in range(5)), reverse=True),
+        }
+        for i in range(count)
+    }
+
+
+def benchmark(count):
+    players = fake_players(count)
+
+    def legacy():
+        # The previous path: convert every record, then pretty-print it.
+        document = {
+            user_id: {
+                **stats,
+                "achievements": list(stats["achievements"]),
+                "last_played": stats["last_played"].isoformat() if stats["last_played"] else None
+            }
+            for user_id, stats in players.items()
+        }
+        return json.dumps(document, indent=4).encode()
+
+    runs = [("json indent=4 (previous)", legacy, json.loads)]
+    runs += [(f"{c.name} compact", lambda c=c: c.dumps(players), c.loads) for c in available_codecs()]
+
+    print(f"{count} players")
+    print(f"{'codec':<26} {'encode':>9} {'decode':>9} {'size':>10}")
+    for label, encode, decode in runs:
+        start = time.perf_counter()
+        data = encode()
+        encoded = time.perf_counter() - start
+        start = time.perf_counter()
+        decode(data)
+        decoded = time.perf_counter() - start
+        print(f"{label:<26} {encoded * 1000:>7.0f}ms {decoded * 1000:>7.0f}ms {len(data) / 1e6:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["bench"]:
+        print("Usage: python codec.py bench [players]")
+        sys.exit(1)
+    benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
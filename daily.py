@@ -0,0 +1,83 @@
+from datetime import date, timedelta
+
+from leaderboards import TopK
+from persistence import WriteBehindStore
+
+
+class DailyChallengeState:
+    def __init__(self, storage, limit=10):
+        self.entries = storage.load_daily()
+        for data in self.entries.values():
+            data.setdefault('total_score', data['score'])
+            data.setdefault('streak', 1)
+        self.storage = storage
+        self.day = date.today().isoformat()
+        self.board = TopK(limit)
+        self.reload_board()
+        self.store = WriteBehindStore("daily_challenges", self._serialize, storage.write_daily, interval=2.0)
+
+    def _serialize(self, user_id):
+        data = self.entries.get(user_id)
+        return dict(data) if data is not None else None
+
+    def reload_board(self, rows=None):
+        # `rows` are top_daily() results fetched by the caller; without them
+        # storage is queried here.
+        if rows is None:
+            rows = self.storage.top_daily(self.day, self.board.limit)
+        self.board.clear()
+        self.board.seed((user_id, (total_score, streak)) for user_id, total_score, streak in rows)
+
+    def current_day(self):
+        today = date.today().isoformat()
+        if today != self.day:
+            self.rollover(today)
+        return today
+
+    def rollover(self, today):
+        self.day = today
+        self.board.clear()
+
+    def can_play(self, user_id):
+        today = self.current_day()
+        data = self.entries.get(user_id)
+        if data is not None and data['last_played'] == today:
+            return False
+
+        self.entries[user_id] = {'last_played': today, 'score': 0, 'total_score': 0, 'streak': 1}
+        self.board.update(user_id, (0, 1))
+        self.store.mark_dirty(user_id)
+        return True
+
+    def update_score(self, user_id, score):
+        today = self.current_day()
+        data = self.entries.get(user_id)
+
+        if data is None:
+            data = self.entries[user_id] = {
+                'last_played': today,
+                'score': score,
+                'total_score': score,
+                'streak': 1
+            }
+        elif data['last_played'] == today:
+            if score > data['score']:
+                data['total_score'] += score - data['score']
+                data['score'] = score
+        else:
+            yesterday = (date.fromisoformat(today) - timedelta(days=1)).isoformat()
+            if data['last_played'] == yesterday:
+                data['streak'] += 1
+            else:
+                data['streak'] = 1
+            data['last_played'] = today
+            data['score'] = score
+            data['total_score'] += score
+
+        self.board.update(user_id, (data['total_score'], data['streak']))
+        self.store.mark_dirty(user_id)
+        return data['score'], data['streak']
+
+    def leaderboard(self):
+        self.current_day()
+        return [(user_id, total_score, streak) for user_id, (total_score, streak) in self.board.items()]
@@ -0,0 +1,217 @@
+import asyncio
+import glob
+import os
+import struct
+import sys
+import zlib
+from collections import Counter, defaultdict, namedtuple
+
+from metrics import flush_seconds
+from persistence import run_io
+
+
+# One record per finished game. Segments are files of fixed-size records, each
+# followed by a CRC32, behind a 4-byte magic; a new segment is started once the
+# current one passes `segment_size`, and segments are never rewritten.
+# Each player of a group game gets an outcome of their own, with the letters
+# and hints they contributed and their share of the score.
+GameOutcome = namedtuple(
+    "GameOutcome",
+    "finished_at user_id chat_id message_id word_index guessed_mask guesses hints "
+    "attempts_left score duration won is_daily_challenge is_group_game",
+    defaults=(False,)
+)
+
+SEGMENT_MAGIC = b"HGE1"
+SEGMENT_PATTERN = "events-{:06d}.log"
+OUTCOME_RECORD = struct.Struct("<dqqiiIBBhifB")
+CHECKSUM = struct.Struct("<I")
+RECORD_SIZE = OUTCOME_RECORD.size + CHECKSUM.size
+WON_FLAG = 1
+DAILY_FLAG = 2
+GROUP_FLAG = 4
+
+
+def encode_outcome(outcome):
+    flags = (
+        (WON_FLAG if outcome.won else 0) | (DAILY_FLAG if outcome.is_daily_challenge else 0)
+        | (GROUP_FLAG if outcome.is_group_game else 0)
+    )
+    record = OUTCOME_RECORD.pack(
+        outcome.finished_at, outcome.user_id, outcome.chat_id, outcome.message_id, outcome.word_index,
+        outcome.guessed_mask, min(outcome.guesses, 0xFF), min(outcome.hints, 0xFF), outcome.attempts_left,
+        outcome.score, outcome.duration, flags
+    )
+    return record + CHECKSUM.pack(zlib.crc32(record))
+
+
+def decode_outcome(data, offset=0):
+    record = data[offset:offset + OUTCOME_RECORD.size]
+    checksum, = CHECKSUM.unpack_from(data, offset + OUTCOME_RECORD.size)
+    if zlib.crc32(record) != checksum:
+        raise ValueError("bad checksum")
+    *fields, flags = OUTCOME_RECORD.unpack(record)
+    return GameOutcome(*fields, bool(flags & WON_FLAG), bool(flags & DAILY_FLAG), bool(flags & GROUP_FLAG))
+
+
+def segment_index(path):
+    return int(os.path.basename(path)[len("events-"):-len(".log")])
+
+
+def read_outcomes(directory):
+    # Every outcome in every segment under `directory`, oldest segment first.
+    # A record torn by a crash ends its segment.
+    for path in sorted(glob.glob(os.path.join(directory, "**", "events-*.log"), recursive=True)):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+            continue
+        for offset in range(len(SEGMENT_MAGIC), len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+            try:
+                yield decode_outcome(data, offset)
+            except ValueError:
+                break
+
+
+class EventLog:
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, interval=1.0, max_buffer=64 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.buffer = bytearray()
+        self.appended = 0
+        os.makedirs(directory, exist_ok=True)
+        segments = glob.glob(os.path.join(directory, "events-*.log"))
+        # Start a fresh segment rather than appending behind a possibly torn
+        # record at the end of the last one.
+        self.segment = max(map(segment_index, segments), default=0) + 1
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    def append(self, outcome):
+        self.buffer += encode_outcome(outcome)
+        self.appended += 1
+        if len(self.buffer) >= self.max_buffer:
+            self._wakeup.set()
+
+    def _segment_path(self):
+        return os.path.join(self.directory, SEGMENT_PATTERN.format(self.segment))
+
+    def _write(self, data):
+        # Runs on the I/O thread.
+        with open(self._segment_path(), "ab") as f:
+            if f.tell() == 0:
+                f.write(SEGMENT_MAGIC)
+            f.write(data)
+            size = f.tell()
+        if size >= self.segment_size:
+            self.segment += 1
+
+    async def flush(self):
+        if self.buffer:
+            data, self.buffer = bytes(self.buffer), bytearray()
+            try:
+                with flush_seconds.time("event_log"):
+                    await run_io(self._write, data)
+            except OSError as e:
+                print(f"Error writing game events: {e}")
+                self.buffer[:0] = data
+
+    def flush_sync(self):
+        if self.buffer:
+            data, self.buffer = bytes(self.buffer), bytearray()
+            self._write(data)
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+class Aggregator:
+    # Folds submitted items in batches on a background task, so that the
+    # handler that produced them only has to queue them. fold is a coroutine
+    # function.
+    def __init__(self, fold):
+        self.fold = fold
+        self.pending = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    def submit(self, item):
+        self.pending.append(item)
+        self._wakeup.set()
+
+    async def drain(self):
+        batch, self.pending = self.pending, []
+        for item in batch:
+            try:
+                await self.fold(item)
+            except Exception as e:
+                print(f"Error aggregating game outcome: {e}")
+
+    async def _run(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.drain()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.drain()
+
+
+def summarize(directory):
+    from word_index import WORD_TABLE
+
+    games = Counter()
+    wins = Counter()
+    durations = defaultdict(float)
+    hints = Counter()
+    for outcome in read_outcomes(directory):
+        entry = WORD_TABLE[outcome.word_index]
+        key = (entry.category, entry.difficulty)
+        games[key] += 1
+        wins[key] += outcome.won
+        durations[key] += outcome.duration
+        hints[key] += outcome.hints
+
+    print(f"{'category':<12} {'difficulty':<10} {'games':>7} {'win rate':>9} {'avg time':>9} {'hints/game':>11}")
+    for key in sorted(games):
+        count = games[key]
+        print(f"{key[0]:<12} {key[1]:<10} {count:>7} {wins[key] / count:>8.1%} {durations[key] / count:>8.1f}s {hints[key] / count:>11.2f}")
+    print(f"{sum(games.values())} games in total")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["summary"]:
+        print("Usage: python event_log.py summary [events directory]")
+        sys.exit(1)
+    summarize(sys.argv[2] if len(sys.argv) > 2 else os.getenv("HANGMAN_EVENT_LOG", "events"))
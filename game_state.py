@@ -0,0 +1,100 @@
+from codec import codec
+from word_index import WORD_TABLE, letters_in
+
+
+class GameState:
+    __slots__ = (
+        "chat_id", "message_ids", "setup_stage", "word_index", "guessed_mask",
+        "keyboard_mask", "attempts", "score", "user_name", "is_daily_challenge",
+        "started_at", "hints", "players"
+    )
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.message_ids = ()
+        self.setup_stage = None
+        self.word_index = -1
+        self.guessed_mask = 0
+        self.keyboard_mask = 0
+        self.attempts = 0
+        self.score = 0
+        self.user_name = None
+        self.is_daily_challenge = False
+        self.started_at = 0.0
+        self.hints = 0
+        # Group games only: {user_id: (name, guessed_mask, hints)} for every
+        # member who has guessed a letter or asked for a hint.
+        self.players = {}
+
+    def add_message(self, message_id):
+        # Setup and game screens are edits of the same message, so the id is
+        # usually already known and nothing has to be stored.
+        if message_id not in self.message_ids:
+            self.message_ids += (message_id,)
+
+    @property
+    def message_id(self):
+        return self.message_ids[-1]
+
+    @property
+    def started(self):
+        return self.word_index >= 0
+
+    @property
+    def word_entry(self):
+        return WORD_TABLE[self.word_index]
+
+    @property
+    def word(self):
+        return WORD_TABLE[self.word_index].word
+
+    @property
+    def category(self):
+        return WORD_TABLE[self.word_index].category
+
+    @property
+    def difficulty(self):
+        return WORD_TABLE[self.word_index].difficulty
+
+    @property
+    def keyboard_letters(self):
+        return letters_in(self.keyboard_mask)
+
+    def to_fields(self):
+        return {
+            "chat_id": self.chat_id,
+            "message_ids": ",".join(map(str, self.message_ids)),
+            "setup_stage": self.setup_stage or "",
+            "word_index": self.word_index,
+            "guessed_mask": self.guessed_mask,
+            "keyboard_mask": self.keyboard_mask,
+            "attempts": self.attempts,
+            "score": self.score,
+            "user_name": self.user_name or "",
+            "is_daily_challenge": int(self.is_daily_challenge),
+            "started_at": repr(self.started_at),
+            "hints": self.hints,
+            "players": codec.dumps([
+                [user_id, name, guessed_mask, hints] for user_id, (name, guessed_mask, hints) in self.players.items()
+            ]).decode() if self.players else "",
+        }
+
+    @classmethod
+    def from_fields(cls, fields):
+        game = cls(int(fields["chat_id"]))
+        game.message_ids = tuple(int(message_id) for message_id in fields["message_ids"].split(",") if message_id)
+        game.setup_stage = fields["setup_stage"] or None
+        game.word_index = int(fields["word_index"])
+        game.guessed_mask = int(fields["guessed_mask"])
+        game.keyboard_mask = int(fields["keyboard_mask"])
+        game.attempts = int(fields["attempts"])
+        game.score = int(fields["score"])
+        game.user_name = fields["user_name"] or None
+        game.is_daily_challenge = fields["is_daily_challenge"] == "1"
+        game.started_at = float(fields.get("started_at", 0.0))
+        game.hints = int(fields.get("hints", 0))
+        if fields.get("players"):
+            game.players = {
+                user_id: (name, guessed_mask, hints) for user_id, name, guessed_mask, hints in codec.loads(fields["players"])
+            }
+        return game
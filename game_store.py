@@ -0,0 +1,343 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from game_state import GameState
+from metrics import flush_seconds
+from persistence import run_io
+from reaper import TimerWheel
+from resp import RespError, RespPool
+from snapshot import GameJournal
+
+
+# Every store has the same interface:
+#   get(user_id) / save(user_id, game) / delete(user_id)
+#   update(user_id, apply) -> (game, result): runs apply(game) on the current
+#       state and stores the game if apply returned a true value; the game's
+#       deadline is refreshed either way. (None, None) when there is no game.
+#   run_expiry(on_expired): calls on_expired(games) with games that were not
+#       touched for `timeout` seconds, after removing them.
+#   active_count(): number of games in progress (as of the last change this
+#       instance made, for shared stores).
+#   start() / close(): called once the event loop runs / on shutdown.
+# Games are keyed by their player's user id, or by the chat id (negative) for
+# a game the whole group plays.
+class GameStoreConflict(Exception):
+    pass
+
+
+class KeyedLocks:
+    # One asyncio.Lock per key, dropped again once nobody holds or waits for
+    # it, so idle games cost nothing.
+    def __init__(self):
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        lock, waiting = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, waiting + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, waiting = self._locks[key]
+            if waiting == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, waiting - 1)
+
+
+class MemoryGameStore:
+    # With a snapshot path, every change is also appended to a journal that
+    # is written out every `journal_interval` seconds, and all games are
+    # snapshotted every `snapshot_interval` seconds (or once the journal grows
+    # past `max_journal_size`) and on shutdown, so a restart picks the games
+    # up where they were.
+    def __init__(self, timeout, snapshot_path=None, journal_interval=1.0, snapshot_interval=60.0,
+                 max_journal_size=4 * 1024 * 1024):
+        self.games = {}
+        self.timeouts = TimerWheel(timeout)
+        self.overdue = []
+        self.journal = GameJournal(snapshot_path) if snapshot_path else None
+        self.journal_interval = journal_interval
+        self.snapshot_interval = snapshot_interval
+        self.max_journal_size = max_journal_size
+        self._task = None
+        if self.journal is not None:
+            self._restore()
+
+    def _restore(self):
+        now, now_monotonic = time.time(), time.monotonic()
+        for user_id, (game, deadline) in self.journal.load().items():
+            self.games[user_id] = game
+            remaining = deadline - now
+            if remaining <= self.timeouts.resolution:
+                self.overdue.append(user_id)
+            else:
+                self.timeouts.touch(user_id, now=now_monotonic + remaining - self.timeouts.timeout)
+        if self.games:
+            print(f"Restored {len(self.games)} active games from {self.journal.snapshot_path}")
+
+    def _deadline(self, user_id):
+        return time.time() + self.timeouts.deadline(user_id) - time.monotonic()
+
+    def _record_save(self, user_id, game):
+        if self.journal is not None:
+            self.journal.record_save(user_id, game, time.time() + self.timeouts.timeout)
+
+    def _record_delete(self, user_id):
+        if self.journal is not None:
+            self.journal.record_delete(user_id)
+
+    def _record_touch(self, user_id):
+        if self.journal is not None:
+            self.journal.record_touch(user_id, time.time() + self.timeouts.timeout)
+
+    def active_count(self):
+        return len(self.games)
+
+    async def get(self, user_id):
+        return self.games.get(user_id)
+
+    async def save(self, user_id, game):
+        self.games[user_id] = game
+        self.timeouts.touch(user_id)
+        self._record_save(user_id, game)
+
+    async def delete(self, user_id):
+        if self.games.pop(user_id, None) is not None:
+            self._record_delete(user_id)
+        self.timeouts.discard(user_id)
+
+    async def update(self, user_id, apply):
+        # Nothing else runs on the event loop while apply() does, so the game
+        # can be changed in place.
+        game = self.games.get(user_id)
+        if game is None:
+            return None, None
+        self.timeouts.touch(user_id)
+        result = apply(game)
+        if result:
+            self._record_save(user_id, game)
+        else:
+            # Unchanged, but a restart must not expire it any earlier.
+            self._record_touch(user_id)
+        return game, result
+
+    def _pop_expired(self, user_ids):
+        expired = []
+        for user_id in user_ids:
+            game = self.games.pop(user_id, None)
+            if game is not None:
+                self._record_delete(user_id)
+                expired.append(game)
+        return expired
+
+    async def run_expiry(self, on_expired):
+        async def expire(user_ids):
+            expired = self._pop_expired(user_ids)
+            if expired:
+                await on_expired(expired)
+
+        if self.overdue:
+            overdue, self.overdue = self.overdue, []
+            await expire(overdue)
+        await self.timeouts.run(expire)
+
+    async def _write_journal(self):
+        data = self.journal.take_pending()
+        if data:
+            with flush_seconds.time("game_journal"):
+                await run_io(self.journal.write_journal, data)
+
+    async def snapshot(self):
+        now = time.time()
+        games = [
+            (user_id, game, self._deadline(user_id) if user_id in self.timeouts else now)
+            for user_id, game in self.games.items()
+        ]
+        generation, data = self.journal.build_snapshot(games)
+        with flush_seconds.time("game_snapshot"):
+            await run_io(self.journal.write_snapshot, generation, data)
+
+    async def _run_journal(self):
+        last_snapshot = time.monotonic()
+        while True:
+            await asyncio.sleep(self.journal_interval)
+            try:
+                if time.monotonic() - last_snapshot >= self.snapshot_interval or self.journal.journal_size >= self.max_journal_size:
+                    last_snapshot = time.monotonic()
+                    await self.snapshot()
+                else:
+                    await self._write_journal()
+            except OSError as e:
+                print(f"Error writing game journal: {e}")
+
+    def start(self):
+        if self.journal is not None and self._task is None:
+            self._task = asyncio.create_task(self._run_journal())
+
+    async def close(self):
+        if self._task is not None:
+            # Stopped before the final snapshot is built. Anything it already
+            # handed to the I/O thread finishes before that snapshot is
+            # written, on the same thread.
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.journal is not None:
+            await self.snapshot()
+
+
+class RedisGameStore:
+    # Games are hashes with a TTL, so abandoned games disappear from the server
+    # on their own. Their deadlines are also kept in a sorted set; whichever
+    # bot instance claims a due entry first cleans up that game's messages.
+    # Guesses use WATCH/MULTI/EXEC, so two instances (or two taps) can never
+    # both apply a change to the same game state.
+    def __init__(self, url, timeout, prefix="hangman", resolution=1.0, grace=60, max_retries=10, pool_size=8):
+        self.pool = RespPool(url, pool_size)
+        self.timeout = timeout
+        self.prefix = prefix
+        self.resolution = resolution
+        self.ttl_ms = int((timeout + grace) * 1000)
+        self.max_retries = max_retries
+        self.deadlines = f"{prefix}:deadlines"
+        self._closing = False
+        self._locks = KeyedLocks()
+        self.active = 0
+
+    def _key(self, user_id):
+        return f"{self.prefix}:game:{user_id}"
+
+    def active_count(self):
+        return self.active
+
+    def _touch_commands(self, user_id):
+        return [
+            ["PEXPIRE", self._key(user_id), self.ttl_ms],
+            ["ZADD", self.deadlines, time.time() + self.timeout, user_id],
+        ]
+
+    def _write_commands(self, user_id, game):
+        fields = []
+        for name, value in game.to_fields().items():
+            fields += [name, value]
+        return [["HSET", self._key(user_id), *fields], *self._touch_commands(user_id)]
+
+    @staticmethod
+    def _decode(reply):
+        if not reply:
+            return None
+        values = [value.decode() for value in reply]
+        return GameState.from_fields(dict(zip(values[::2], values[1::2])))
+
+    async def get(self, user_id):
+        reply, = await self.pool.execute(["HGETALL", self._key(user_id)])
+        return self._decode(reply)
+
+    async def save(self, user_id, game):
+        replies = await self.pool.execute(
+            ["MULTI"], *self._write_commands(user_id, game), ["ZCARD", self.deadlines], ["EXEC"]
+        )
+        self.active = replies[-1][-1]
+
+    async def delete(self, user_id):
+        _, _, self.active = await self.pool.execute(
+            ["DEL", self._key(user_id)], ["ZREM", self.deadlines, user_id], ["ZCARD", self.deadlines]
+        )
+
+    async def update(self, user_id, apply):
+        # Updates from this process are queued per game so that WATCH only
+        # has to resolve races with other instances.
+        async with self._locks.hold(user_id):
+            return await self._update(user_id, apply)
+
+    async def _update(self, user_id, apply):
+        key = self._key(user_id)
+        async with self.pool.connection() as connection:
+            for _ in range(self.max_retries):
+                _, reply = await connection.execute(["WATCH", key], ["HGETALL", key])
+                game = self._decode(reply)
+                if game is None:
+                    await connection.execute(["UNWATCH"])
+                    return None, None
+
+                result = apply(game)
+                if not result:
+                    await connection.execute(["UNWATCH"], *self._touch_commands(user_id))
+                    return game, result
+
+                commands = self._write_commands(user_id, game)
+                replies = await connection.execute(["MULTI"], *commands, ["EXEC"])
+                if replies[-1] is not None:
+                    return game, result
+                # Someone else changed the game since WATCH: start over from
+                # the new state.
+        raise GameStoreConflict(f"Gave up updating the game of {user_id} after {self.max_retries} conflicts")
+
+    async def _claim(self, connection, user_id, now):
+        # A guess may refresh a game between it being found due and being
+        # removed. WATCH makes the removal fail if the game changed, and the
+        # deadline is checked again under it; whichever instance removes the
+        # game first has claimed it.
+        key = self._key(user_id)
+        _, deadline, reply = await connection.execute(
+            ["WATCH", key], ["ZSCORE", self.deadlines, user_id], ["HGETALL", key]
+        )
+        if deadline is None or float(deadline) > now:
+            await connection.execute(["UNWATCH"])
+            return None
+        replies = await connection.execute(["MULTI"], ["ZREM", self.deadlines, user_id], ["DEL", key], ["EXEC"])
+        if replies[-1] is None or not replies[-1][0]:
+            return None
+        return self._decode(reply)
+
+    async def _claim_expired(self):
+        expired = []
+        async with self.pool.connection() as connection:
+            now = time.time()
+            due, = await connection.execute(["ZRANGEBYSCORE", self.deadlines, "-inf", now])
+            for user_id in due:
+                game = await self._claim(connection, user_id.decode(), now)
+                if game is not None:
+                    expired.append(game)
+            self.active, = await connection.execute(["ZCARD", self.deadlines])
+        return expired
+
+    async def run_expiry(self, on_expired):
+        while not self._closing:
+            await asyncio.sleep(self.resolution)
+            try:
+                expired = await self._claim_expired()
+            except (OSError, RespError) as e:
+                print(f"Error claiming expired games: {e}")
+                continue
+            if expired:
+                try:
+                    await on_expired(expired)
+                except Exception as e:
+                    print(f"Error expiring {len(expired)} games: {e}")
+
+    def start(self):
+        pass
+
+    async def close(self):
+        self._closing = True
+        self.pool.close()
+
+
+def open_game_store(timeout, backend=None, url=None, snapshot_path=None):
+    backend = backend or os.getenv("HANGMAN_GAME_STORE", "memory")
+    if backend == "memory":
+        # An empty HANGMAN_GAME_SNAPSHOT keeps games in memory only.
+        return MemoryGameStore(timeout, snapshot_path or os.getenv("HANGMAN_GAME_SNAPSHOT", "games.snapshot") or None)
+    if backend == "redis":
+        return RedisGameStore(url or os.getenv("HANGMAN_REDIS_URL", "redis://localhost:6379/0"), timeout)
+    raise ValueError(f"Unknown game store backend: {backend}")
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+from hydrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from callbacks import GUESS, HINT, USED, encode_callback
+from word_index import LETTER_BITS, letters_in
+
+
+class UserKeyboard:
+    __slots__ = ("user_id", "correct_button", "incorrect_button", "hint_row", "letter_buttons",
+                 "layout_key", "layout", "rows")
+
+    def __init__(self, user_id, correct_emoji, incorrect_emoji):
+        self.user_id = user_id
+        self.correct_button = InlineKeyboardButton(correct_emoji, callback_data=encode_callback(USED, user_id))
+        self.incorrect_button = InlineKeyboardButton(incorrect_emoji, callback_data=encode_callback(USED, user_id))
+        self.hint_row = [InlineKeyboardButton("💡 Hint", callback_data=encode_callback(HINT, user_id))]
+        self.letter_buttons = {}
+        self.layout_key = None
+        self.layout = ()
+        self.rows = {}
+
+    def letter_button(self, letter):
+        button = self.letter_buttons.get(letter)
+        if button is None:
+            button = self.letter_buttons[letter] = InlineKeyboardButton(letter, callback_data=encode_callback(GUESS, letter, self.user_id))
+        return button
+
+    def set_layout(self, keyboard_mask, word_mask):
+        letters = letters_in(keyboard_mask)
+        layout = []
+        for i in range(0, len(letters), 5):
+            row_letters = letters[i:i+5]
+            row_mask = 0
+            for letter in row_letters:
+                row_mask |= LETTER_BITS[letter]
+            layout.append((row_letters, row_mask))
+        self.layout_key = (keyboard_mask, word_mask)
+        self.layout = layout
+        self.rows = {}
+
+    def build_row(self, row_letters, guessed_mask, word_mask):
+        row = []
+        for letter in row_letters:
+            bit = LETTER_BITS[letter]
+            if bit & guessed_mask:
+                row.append(self.correct_button if bit & word_mask else self.incorrect_button)
+            else:
+                row.append(self.letter_button(letter))
+        return row
+
+
+class KeyboardCache:
+    # Button objects are built once per user and whole rows are reused while
+    # none of their letters has been guessed, so a guess only builds the one
+    # row that changed.
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self.users = OrderedDict()
+
+    def forget(self, user_id):
+        self.users.pop(user_id, None)
+
+    def _user_keyboard(self, user_id, keyboard_emojis):
+        keyboard = self.users.get(user_id)
+        if keyboard is None:
+            keyboard = self.users[user_id] = UserKeyboard(user_id, *keyboard_emojis)
+            if len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+        else:
+            self.users.move_to_end(user_id)
+        return keyboard
+
+    def markup(self, user_id, keyboard_emojis, keyboard_mask, guessed_mask, word_mask):
+        keyboard = self._user_keyboard(user_id, keyboard_emojis)
+        if keyboard.layout_key != (keyboard_mask, word_mask):
+            keyboard.set_layout(keyboard_mask, word_mask)
+
+        rows = []
+        for row_letters, row_mask in keyboard.layout:
+            key = (row_mask, guessed_mask & row_mask)
+            row = keyboard.rows.get(key)
+            if row is None:
+                row = keyboard.rows[key] = keyboard.build_row(row_letters, guessed_mask, word_mask)
+            rows.append(row)
+        rows.append(keyboard.hint_row)
+        return InlineKeyboardMarkup(rows)
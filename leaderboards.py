@@ -0,0 +1,42 @@
+class TopK:
+    # Scores on every board only ever grow (wins, best score, today's daily
+    # total), so a player who drops out of the top K can only come back through
+    # a later update() and the board never has to look at the other players.
+    def __init__(self, limit=10):
+        self.limit = limit
+        self.entries = []
+        self.members = {}
+
+    def update(self, user_id, value):
+        current = self.members.get(user_id)
+        if current is not None:
+            if current == value:
+                return False
+            self.entries.remove((current, user_id))
+        elif len(self.entries) >= self.limit and value <= self.entries[-1][0]:
+            return False
+
+        position = len(self.entries)
+        while position > 0 and self.entries[position - 1][0] < value:
+            position -= 1
+        self.entries.insert(position, (value, user_id))
+        self.members[user_id] = value
+
+        if len(self.entries) > self.limit:
+            _, dropped = self.entries.pop()
+            del self.members[dropped]
+        return True
+
+    def seed(self, items):
+        for user_id, value in items:
+            self.update(user_id, value)
+
+    def clear(self):
+        self.entries = []
+        self.members = {}
+
+    def items(self):
+        return [(user_id, value) for value, user_id in self.entries]
+
+    def __contains__(self, user_id):
+        return user_id in self.members
@@ -0,0 +1,256 @@
+import asyncio
+import bisect
+import functools
+import time
+from contextlib import contextmanager
+
+
+# In-process metrics, rendered in the Prometheus text format by serve() and
+# summarized for the /botstats command. Every metric has at most one label.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+REGISTRY = []
+started_at = time.time()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(label, value):
+    if label is None:
+        return ""
+    return f'{{{label}="{_escape(value)}"}}'
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, label_value=None):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_value, value in sorted(self.values.items(), key=lambda item: str(item[0])):
+            yield f"{self.name}{_labels(self.label, label_value)} {_number(value)}"
+
+
+class Gauge:
+    # `read()` is called at render time and returns a number, or a dict of
+    # label values to numbers for a labelled gauge.
+    def __init__(self, name, help, read, label=None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.label = label
+        REGISTRY.append(self)
+
+    def values(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Error reading metric {self.name}: {e}")
+            return {}
+        return value if isinstance(value, dict) else {None: value}
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for label_value, value in sorted(self.values().items(), key=lambda item: str(item[0])):
+            yield f"{self.name}{_labels(self.label, label_value)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name, help, label=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        # label value -> [per-bucket counts (last one is +Inf), sum, count]
+        self.series = {}
+        REGISTRY.append(self)
+
+    def observe(self, value, label_value=None):
+        series = self.series.get(label_value)
+        if series is None:
+            series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, label_value=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, label_value)
+
+    def count(self, label_value=None):
+        series = self.series.get(label_value)
+        return series[2] if series else 0
+
+    def quantile(self, q, label_value=None):
+        # Estimated the way Prometheus' histogram_quantile() does: linearly
+        # within the bucket the quantile falls into.
+        series = self.series.get(label_value)
+        if not series or not series[2]:
+            return None
+        rank = q * series[2]
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets + (float("inf"),), series[0]):
+            if seen + count >= rank and count:
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return lower
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for label_value, (counts, total, count) in sorted(self.series.items(), key=lambda item: str(item[0])):
+            prefix = "" if self.label is None else f'{self.label}="{_escape(label_value)}",'
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{{{prefix}le="{_number(upper)}"}} {cumulative}'
+            yield f"{self.name}_sum{_labels(self.label, label_value)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.label, label_value)} {count}"
+
+
+handler_seconds = Histogram("hangman_handler_seconds", "Time spent in update handlers.", "handler")
+loop_lag_seconds = Histogram("hangman_event_loop_lag_seconds", "How late the event loop runs a timer.", buckets=LAG_BUCKETS)
+api_seconds = Histogram("hangman_telegram_api_seconds", "Duration of Telegram API calls.", "method")
+api_errors = Counter("hangman_telegram_api_errors_total", "Telegram API calls that raised.", "method")
+flood_waits = Counter("hangman_flood_waits_total", "FloodWait errors returned by Telegram.", "method")
+flood_wait_seconds = Counter("hangman_flood_wait_seconds_total", "Seconds Telegram asked to wait in FloodWait errors.", "method")
+flush_seconds = Histogram("hangman_flush_seconds", "Time taken by persistence writes.", "store")
+
+
+def timed(handler):
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        with handler_seconds.time(handler.__name__):
+            return await handler(*args, **kwargs)
+    return wrapper
+
+
+def instrument_client(client):
+    # Every high-level client method goes through invoke(), so timing it
+    # covers all Telegram API calls, labelled with the raw method name.
+    from hydrogram.errors import FloodWait
+
+    invoke = client.invoke
+
+    async def timed_invoke(query, *args, **kwargs):
+        method = type(query).__name__
+        start = time.perf_counter()
+        try:
+            return await invoke(query, *args, **kwargs)
+        except FloodWait as e:
+            flood_waits.inc(1, method)
+            flood_wait_seconds.inc(e.value, method)
+            api_errors.inc(1, method)
+            raise
+        except Exception:
+            api_errors.inc(1, method)
+            raise
+        finally:
+            api_seconds.observe(time.perf_counter() - start, method)
+
+    client.invoke = timed_invoke
+
+
+async def monitor_loop_lag(interval=0.25):
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag_seconds.observe(max(0.0, loop.time() - scheduled))
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _serve_client(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+        path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+        if path.split(b"?")[0] in (b"/", b"/metrics"):
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(port, host="127.0.0.1"):
+    server = await asyncio.start_server(_serve_client, host, port)
+    print(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value * 1000:.1f}ms"
+
+
+def summary(limit=12):
+    lines = [f"uptime {time.time() - started_at:.0f}s"]
+
+    def histogram_lines(title, histogram):
+        rows = sorted(histogram.series, key=lambda label_value: -histogram.count(label_value))[:limit]
+        if not rows:
+            return
+        lines.append("")
+        lines.append(title)
+        for label_value in rows:
+            lines.append(
+                f"  {str(label_value or '-'):<24} n={histogram.count(label_value):<7} "
+                f"p50={_seconds(histogram.quantile(0.5, label_value))} p99={_seconds(histogram.quantile(0.99, label_value))}"
+            )
+
+    histogram_lines("handlers", handler_seconds)
+    histogram_lines("event loop lag", loop_lag_seconds)
+    histogram_lines("telegram api", api_seconds)
+    if flood_waits.values:
+        lines.append("")
+        lines.append("flood waits")
+        for method, count in sorted(flood_waits.values.items(), key=lambda item: -item[1]):
+            lines.append(f"  {method:<24} n={count:<7} waited={flood_wait_seconds.values.get(method, 0)}s")
+    histogram_lines("persistence flushes", flush_seconds)
+
+    gauges = [metric for metric in REGISTRY if isinstance(metric, Gauge)]
+    if gauges:
+        lines.append("")
+        for gauge in gauges:
+            for label_value, value in gauge.values().items():
+                name = gauge.name if label_value is None else f"{gauge.name}[{label_value}]"
+                lines.append(f"  {name} {value}")
+    return "\n".join(lines)
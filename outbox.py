@@ -0,0 +1,221 @@
+import asyncio
+import time
+
+from hydrogram.errors import FloodWait, MessageNotModified
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        # Returns how long to wait before a token is available; takes the
+        # token when that wait is zero.
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class PendingEdit:
+    __slots__ = ("client", "kwargs", "waiters", "attempts")
+
+    def __init__(self, client, kwargs):
+        self.client = client
+        self.kwargs = kwargs
+        self.waiters = []
+        self.attempts = 0
+
+
+class EditScheduler:
+    PRIVATE_CHAT_RATE = (1.0, 3)
+    GROUP_CHAT_RATE = (20 / 60, 3)
+    GLOBAL_RATE = (30.0, 30)
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self, workers=4, max_retries=5, base_backoff=0.5):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.pending = {}
+        self.inflight = set()
+        self.chat_buckets = {}
+        self.chat_paused_until = {}
+        self.global_bucket = TokenBucket(*self.GLOBAL_RATE)
+        self.queue = None
+        self._tasks = []
+        self.sent = 0
+        self.coalesced = 0
+        self.flood_waits = 0
+
+    def start(self):
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue()
+        for key in self.pending:
+            if key not in self.inflight:
+                self.queue.put_nowait(key)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        while (self.pending or self.inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def edit(self, client, chat_id, message_id, **kwargs):
+        key = (chat_id, message_id)
+        pending = self.pending.get(key)
+        if pending is not None:
+            # Only the newest state of a message matters; earlier edits that
+            # have not been sent yet are dropped.
+            pending.client = client
+            pending.kwargs = kwargs
+            self.coalesced += 1
+            return pending
+
+        pending = self.pending[key] = PendingEdit(client, kwargs)
+        if key not in self.inflight and self.queue is not None:
+            self.queue.put_nowait(key)
+        return pending
+
+    async def edit_and_wait(self, client, chat_id, message_id, **kwargs):
+        if not self._tasks:
+            # No workers before start() or after close(): send it right away
+            # rather than wait for a result that would never come.
+            return await self._send_now(client, chat_id, message_id, kwargs)
+        pending = self.edit(client, chat_id, message_id, **kwargs)
+        waiter = asyncio.get_running_loop().create_future()
+        pending.waiters.append(waiter)
+        return await waiter
+
+    async def _send_now(self, client, chat_id, message_id, kwargs):
+        # An edit still queued for this message is older; it is replaced.
+        stale = self.pending.pop((chat_id, message_id), None)
+        waiters = stale.waiters if stale is not None else []
+        try:
+            result = await client.edit_message_text(chat_id=chat_id, message_id=message_id, **kwargs)
+        except MessageNotModified:
+            result = None
+        except Exception as e:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            raise
+        self.sent += 1
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(result)
+        return result
+
+    def _bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                self._prune_buckets()
+            rate = self.PRIVATE_CHAT_RATE if chat_id > 0 else self.GROUP_CHAT_RATE
+            bucket = self.chat_buckets[chat_id] = TokenBucket(*rate)
+        return bucket
+
+    def _prune_buckets(self):
+        # A bucket that has refilled completely behaves exactly like a new one.
+        now = time.monotonic()
+        for chat_id, bucket in list(self.chat_buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.capacity:
+                del self.chat_buckets[chat_id]
+        for chat_id, paused_until in list(self.chat_paused_until.items()):
+            if paused_until <= now:
+                del self.chat_paused_until[chat_id]
+
+    def _requeue_later(self, key, delay):
+        asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, key)
+
+    async def _worker(self):
+        while True:
+            key = await self.queue.get()
+            if key in self.inflight or key not in self.pending:
+                continue
+
+            chat_id = key[0]
+            now = time.monotonic()
+            paused_until = self.chat_paused_until.get(chat_id, 0)
+            if paused_until > now:
+                self._requeue_later(key, paused_until - now)
+                continue
+            wait = self._bucket(chat_id).take(now)
+            if wait:
+                self._requeue_later(key, wait)
+                continue
+
+            wait = self.global_bucket.take()
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self.global_bucket.take()
+
+            pending = self.pending.pop(key, None)
+            if pending is None:
+                continue
+            self.inflight.add(key)
+            try:
+                await self._send(key, pending)
+            finally:
+                self.inflight.discard(key)
+                if key in self.pending:
+                    self.queue.put_nowait(key)
+
+    async def _send(self, key, pending):
+        chat_id, message_id = key
+        try:
+            result = await pending.client.edit_message_text(chat_id=chat_id, message_id=message_id, **pending.kwargs)
+        except MessageNotModified:
+            result = None
+        except FloodWait as e:
+            self.flood_waits += 1
+            self.chat_paused_until[chat_id] = time.monotonic() + e.value
+            self._retry(key, pending, e, e.value)
+            return
+        except (OSError, asyncio.TimeoutError) as e:
+            self._retry(key, pending, e, self.base_backoff * 2 ** pending.attempts)
+            return
+        except Exception as e:
+            self._fail(key, pending, e)
+            return
+
+        self.sent += 1
+        for waiter in pending.waiters:
+            if not waiter.done():
+                waiter.set_result(result)
+
+    def _retry(self, key, pending, error, delay):
+        pending.attempts += 1
+        if pending.attempts > self.max_retries:
+            self._fail(key, pending, error)
+            return
+        asyncio.get_running_loop().call_later(delay, self._restore, key, pending)
+
+    def _restore(self, key, pending):
+        newer = self.pending.get(key)
+        if newer is not None:
+            newer.waiters.extend(pending.waiters)
+            newer.attempts = max(newer.attempts, pending.attempts)
+        else:
+            self.pending[key] = pending
+        self.queue.put_nowait(key)
+
+    def _fail(self, key, pending, error):
+        print(f"Error editing message {key[1]} in chat {key[0]}: {error}")
+        for waiter in pending.waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+
+
+outbox = EditScheduler()
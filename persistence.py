@@ -0,0 +1,253 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from codec import codec
+from metrics import flush_seconds
+
+
+io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hangman-io")
+# At most this many calls wait on the I/O thread at a time; run_io() callers
+# beyond that wait on the event loop, so a slow disk slows down the handlers
+# that write instead of growing an unbounded backlog.
+MAX_QUEUED_IO = 32
+io_slots = asyncio.Semaphore(MAX_QUEUED_IO)
+
+
+async def run_io(function, *args):
+    # All blocking storage calls go through here: file and database access
+    # happen on the one I/O thread, in the order they were requested.
+    async with io_slots:
+        return await asyncio.get_running_loop().run_in_executor(io_executor, function, *args)
+
+
+def sync_directory(directory):
+    # Makes a rename in `directory` durable.
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_atomically(path, data, sync_dir=True):
+    # Readers (and a restart after a crash) see either the old contents or
+    # the new ones, never a partly written file.
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    if sync_dir:
+        sync_directory(os.path.dirname(path))
+
+
+class GroupCommit:
+    # Files rewritten through commit() are written out together by one job on
+    # the I/O thread, queued behind the writes already waiting there: a file
+    # changed several times meanwhile is written once, with its latest
+    # contents, and every directory involved is synced once. A file that
+    # fails to write stays pending and is retried with the next commit.
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.scheduled = False
+        self.commits = 0
+
+    def commit(self, path, render):
+        with self.lock:
+            self.pending[path] = render
+            if self.scheduled:
+                return
+            self.scheduled = True
+        try:
+            io_executor.submit(self.run)
+        except RuntimeError:
+            # The executor is already shut down when exiting; flush_all_sync()
+            # runs the commit itself.
+            with self.lock:
+                self.scheduled = False
+
+    def run(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.scheduled = False
+        if not pending:
+            return
+        start = time.perf_counter()
+        directories = set()
+        for path, render in pending.items():
+            try:
+                write_atomically(path, render(), sync_dir=False)
+                directories.add(os.path.dirname(path))
+            except Exception as e:
+                print(f"Error writing {path}: {e}")
+                with self.lock:
+                    self.pending.setdefault(path, render)
+        for directory in directories:
+            try:
+                sync_directory(directory)
+            except OSError as e:
+                print(f"Error syncing directory {directory or '.'}: {e}")
+        self.commits += 1
+        flush_seconds.observe(time.perf_counter() - start, "group_commit")
+
+
+group_commit = GroupCommit()
+
+
+class JsonDocumentFile:
+    # Every record is also kept encoded, so rewriting the file only encodes
+    # the records that changed since the last write.
+    def __init__(self, path):
+        self.path = path
+        self.document = {}
+        self.encoded = {}
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                self.document = codec.loads(f.read())
+        except FileNotFoundError:
+            self.document = {}
+        except codec.DecodeError as e:
+            # Never start over on top of data that could still be recovered
+            # by hand.
+            corrupt_path = f"{self.path}.corrupt-{time.strftime('%Y%m%d-%H%M%S')}"
+            os.replace(self.path, corrupt_path)
+            print(f"Error reading {self.path} ({e}); moved it to {corrupt_path} and starting empty")
+            self.document = {}
+        self.encoded = {}
+        return self.document
+
+    def copy_of(self, key):
+        # A fresh decode of one record, which callers may change freely; the
+        # records in `document` belong to the thread that writes the file.
+        data = self.encoded.get(key)
+        if data is None:
+            data = self.encoded[key] = codec.dumps(self.document[key])
+        return codec.loads(data)
+
+    def copy(self):
+        return {key: self.copy_of(key) for key in self.document}
+
+    def write_all(self, document):
+        self.document = document
+        self.encoded = {}
+        self._dump()
+
+    def write_batch(self, batch):
+        # Records may come already encoded (bytes).
+        for key, record in batch.items():
+            if record is None:
+                self.document.pop(key, None)
+                self.encoded.pop(key, None)
+            elif isinstance(record, bytes):
+                self.document[key] = codec.loads(record)
+                self.encoded[key] = record
+            else:
+                self.document[key] = record
+                self.encoded[key] = codec.dumps(record)
+        self._dump()
+
+    def _dump(self):
+        group_commit.commit(self.path, self._render)
+
+    def _render(self):
+        # Runs on the I/O thread, like write_batch().
+        parts = []
+        for key, record in self.document.items():
+            data = self.encoded.get(key)
+            if data is None:
+                data = self.encoded[key] = codec.dumps(record)
+            parts.append(codec.dumps(key) + b":" + data)
+        return b"{" + b",".join(parts) + b"}"
+
+
+class WriteBehindStore:
+    # Once `high_water` keys are waiting to be written, save() makes its
+    # caller wait for a flush.
+    def __init__(self, name, serialize, write_batch, interval=5.0, max_dirty=256, high_water=None):
+        self.name = name
+        self.serialize = serialize
+        self.write_batch = write_batch
+        self.interval = interval
+        self.max_dirty = max_dirty
+        self.high_water = high_water or 4 * max_dirty
+        self.dirty = set()
+        self.flushing = set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+        self._flush_lock = asyncio.Lock()
+
+    def mark_dirty(self, key):
+        self.dirty.add(key)
+        if len(self.dirty) >= self.max_dirty:
+            self._wakeup.set()
+
+    async def save(self, key):
+        self.mark_dirty(key)
+        if len(self.dirty) >= self.high_water:
+            await self.flush()
+
+    def is_pending(self, key):
+        # True until the key's latest change has been written.
+        return key in self.dirty or key in self.flushing
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.dirty:
+                return
+            keys, self.dirty = self.dirty, set()
+            # Records are serialized on the event loop so the writer thread never
+            # sees a dict that is being mutated by a handler.
+            batch = {key: self.serialize(key) for key in keys}
+            self.flushing = keys
+            try:
+                with flush_seconds.time(self.name):
+                    await run_io(self.write_batch, batch)
+            except Exception as e:
+                print(f"Error flushing {self.name} ({len(batch)} records): {e}")
+                self.dirty.update(keys)
+            finally:
+                self.flushing = set()
+
+    async def close(self):
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def flush_sync(self):
+        if not self.dirty:
+            return
+        keys, self.dirty = self.dirty, set()
+        self.write_batch({key: self.serialize(key) for key in keys})
+
+
+def flush_all_sync(*stores):
+    for store in stores:
+        try:
+            store.flush_sync()
+        except Exception as e:
+            print(f"Error flushing {store.name} on exit: {e}")
+    group_commit.run()
@@ -0,0 +1,149 @@
+import asyncio
+from collections import Counter, OrderedDict
+from collections.abc import MutableMapping
+
+from persistence import run_io
+
+
+# Marks a player that storage does not know, so that asking again for the same
+# unknown user does not hit storage again.
+NOT_FOUND = object()
+
+
+class PlayerNotLoaded(Exception):
+    pass
+
+
+class PlayerCache(MutableMapping):
+    # Player records are read with `await fetch(key)` (or fetch_many()), which
+    # loads the ones that are not cached on the I/O thread, and kept in
+    # least-recently-used order. The mapping interface only covers what is
+    # cached: reading a player that is not raises PlayerNotLoaded rather than
+    # block the event loop on storage. Once more than `capacity` players are
+    # cached, the coldest ones are dropped again, except those `pinned(key)`
+    # holds on to (changes that have not reached storage yet), the one just
+    # added and those a prefetch() is still waiting for; the cache grows past
+    # `capacity` while nothing else can go.
+    #
+    # load(keys) returns {key: record} for the keys storage has. Iterating
+    # and len() only cover the players that are cached right now.
+    def __init__(self, load, capacity=10000, pinned=None):
+        self.load = load
+        self.capacity = capacity
+        self.pinned = pinned or (lambda key: False)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._batch = None
+        self._wanted = Counter()
+        self._load_lock = asyncio.Lock()
+
+    def _lookup(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            raise PlayerNotLoaded(f"Player {key} was not prefetched")
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _insert(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self._evict(len(self.entries) - self.capacity, key)
+
+    def _evict(self, count, keep):
+        victims = []
+        for key in self.entries:
+            if len(victims) == count:
+                break
+            if key != keep and not self._wanted[key] and not self.pinned(key):
+                victims.append(key)
+        for key in victims:
+            del self.entries[key]
+        self.evictions += len(victims)
+
+    async def fetch(self, key):
+        # The player's record, or None if storage has none.
+        await self.prefetch([key])
+        value = self._lookup(key)
+        return None if value is NOT_FOUND else value
+
+    async def fetch_many(self, keys):
+        # {key: record} for the players among `keys` that storage has.
+        keys = list(dict.fromkeys(keys))
+        await self.prefetch(keys)
+        records = {key: self._lookup(key) for key in keys}
+        return {key: value for key, value in records.items() if value is not NOT_FOUND}
+
+    def peek(self, key):
+        # The cached record, without loading or counting as a use.
+        value = self.entries.get(key)
+        return None if value is NOT_FOUND else value
+
+    async def prefetch(self, keys):
+        # Loads the players among `keys` that are not cached on the I/O thread,
+        # so handlers can have them ready without blocking the event loop.
+        # Players asked for while a load is running are collected and loaded
+        # together by the next one. All of `keys` are cached when this returns.
+        keys = list(dict.fromkeys(keys))
+        missing = [key for key in keys if key not in self.entries]
+        if not missing:
+            return
+        self.misses += len(missing)
+        batch = self._batch
+        if batch is None:
+            batch = self._batch = (set(), asyncio.get_running_loop().create_future())
+            asyncio.create_task(self._load_batch(batch))
+        batch[0].update(missing)
+        # Other loads finishing meanwhile must not evict these keys before
+        # the caller gets to use them.
+        self._wanted.update(keys)
+        try:
+            # Shielded: one caller being cancelled must not fail the whole batch.
+            await asyncio.shield(batch[1])
+        finally:
+            self._wanted.subtract(keys)
+            for key in keys:
+                if not self._wanted[key]:
+                    del self._wanted[key]
+
+    async def _load_batch(self, batch):
+        keys, done = batch
+        try:
+            async with self._load_lock:
+                if self._batch is batch:
+                    self._batch = None
+                records = await run_io(self.load, list(keys))
+        except Exception as e:
+            done.set_exception(e)
+            return
+        for key in keys:
+            # Skip players that were created or loaded meanwhile.
+            if key not in self.entries:
+                self._insert(key, records.get(key, NOT_FOUND))
+        done.set_result(None)
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is NOT_FOUND:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key) is not NOT_FOUND
+
+    def __setitem__(self, key, value):
+        self._insert(key, value)
+
+    def __delitem__(self, key):
+        if self._lookup(key) is NOT_FOUND:
+            raise KeyError(key)
+        self.entries[key] = NOT_FOUND
+
+    def __iter__(self):
+        return (key for key, value in list(self.entries.items()) if value is not NOT_FOUND)
+
+    def __len__(self):
+        return sum(value is not NOT_FOUND for value in self.entries.values())
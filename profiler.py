@@ -0,0 +1,147 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from persistence import run_io
+
+
+# A sampling profiler for the running bot. A thread of its own looks at the
+# Python stack of every other thread (the event loop and the I/O thread) every
+# `interval` seconds, so nothing is traced call by call the way cProfile does
+# and the bot keeps running at close to full speed while it is profiled.
+#
+# Each session writes "<name>.collapsed", one "thread;outer;...;inner count"
+# line per distinct stack (the input flamegraph.pl, speedscope and inferno
+# take), and "<name>.txt", the functions with the most samples.
+DEFAULT_INTERVAL = 0.005
+
+# Leaf frames of a thread that is waiting for work rather than doing any.
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+active = None
+
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.idle = Counter()
+        self.ticks = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = frame_label(code)
+        return label
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            leaf = frame.f_code
+            labels = []
+            while frame is not None:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, f"thread-{thread_id}"))
+            stack = ";".join(reversed(labels))
+            self.stacks[stack] += 1
+            if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                self.idle[stack] += 1
+        self.ticks += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="hangman-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def top_functions(self, limit=20):
+        # (self samples, total samples, label) for the busiest functions,
+        # leaving out threads that were waiting for work. Recursive calls
+        # count once towards a stack's total.
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            count -= self.idle[stack]
+            if count <= 0:
+                continue
+            frames = stack.split(";")[1:]
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        return [(own[label], total[label], label) for label, _ in own.most_common(limit)]
+
+    def summary(self, limit=20):
+        # Samples are shown as the time they stand for: the sampling thread
+        # may fall behind `interval` while the GIL is busy.
+        per_sample = self.elapsed / self.ticks if self.ticks else self.interval
+        busy = sum(self.stacks.values()) - sum(self.idle.values())
+        lines = [
+            f"{self.ticks} samples over {self.elapsed:.1f}s, {busy * per_sample:.2f}s busy across all threads",
+            f"{'self':>9} {'total':>9}  function",
+        ]
+        for own, total, label in self.top_functions(limit):
+            lines.append(f"{own * per_sample:>8.3f}s {total * per_sample:>8.3f}s  {label}")
+        return "\n".join(lines)
+
+    def write(self, directory, name):
+        os.makedirs(directory, exist_ok=True)
+        collapsed_path = os.path.join(directory, f"{name}.collapsed")
+        summary_path = os.path.join(directory, f"{name}.txt")
+        with open(collapsed_path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(summary_path, "w") as f:
+            f.write(self.summary(limit=100) + "\n")
+        return collapsed_path, summary_path
+
+
+def start(interval=DEFAULT_INTERVAL):
+    # Sampling has begun by the time this returns, so a second request can be
+    # turned down straight away.
+    global active
+    if active is not None:
+        raise RuntimeError("A profile is already running")
+    active = SamplingProfiler(interval)
+    active.start()
+    return active
+
+
+async def collect(profiler, seconds, directory, name):
+    # Lets `profiler` sample for `seconds`, then writes its files on the I/O
+    # thread and returns their paths.
+    global active
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await asyncio.to_thread(profiler.stop)
+        active = None
+    return await run_io(profiler.write, directory, name)
@@ -0,0 +1,84 @@
+import asyncio
+import math
+import time
+
+
+class TimerWheel:
+    # A hashed timing wheel with one slot per tick. The wheel has more slots
+    # than the timeout spans, so a slot only ever holds keys that expire on
+    # the tick being processed and no rounds have to be tracked.
+    def __init__(self, timeout, resolution=1.0):
+        self.timeout = timeout
+        self.resolution = resolution
+        self.size = int(math.ceil(timeout / resolution)) + 2
+        self.slots = [set() for _ in range(self.size)]
+        self.deadlines = {}
+        self.last_tick = self._tick(time.monotonic())
+
+    def _tick(self, now):
+        return int(now / self.resolution)
+
+    def touch(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        deadline = int(math.ceil((now + self.timeout) / self.resolution))
+        previous = self.deadlines.get(key)
+        if previous == deadline:
+            return
+        if previous is not None:
+            self.slots[previous % self.size].discard(key)
+        self.deadlines[key] = deadline
+        self.slots[deadline % self.size].add(key)
+
+    def discard(self, key):
+        deadline = self.deadlines.pop(key, None)
+        if deadline is not None:
+            self.slots[deadline % self.size].discard(key)
+
+    def deadline(self, key):
+        deadline = self.deadlines.get(key)
+        return deadline * self.resolution if deadline is not None else None
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def expire(self, now=None):
+        now_tick = self._tick(time.monotonic() if now is None else now)
+        expired = []
+        # Never walk more than one revolution, even after a long stall.
+        first_tick = max(self.last_tick + 1, now_tick - self.size + 1)
+        for tick in range(first_tick, now_tick + 1):
+            slot = self.slots[tick % self.size]
+            if not slot:
+                continue
+            due = [key for key in slot if self.deadlines[key] <= now_tick]
+            for key in due:
+                slot.discard(key)
+                del self.deadlines[key]
+            expired.extend(due)
+        self.last_tick = max(self.last_tick, now_tick)
+        return expired
+
+    async def run(self, on_expired):
+        while True:
+            now = time.monotonic()
+            next_tick = (self._tick(now) + 1) * self.resolution
+            await asyncio.sleep(next_tick - now)
+            expired = self.expire()
+            if expired:
+                try:
+                    await on_expired(expired)
+                except Exception as e:
+                    print(f"Error expiring {len(expired)} games: {e}")
+
+
+async def gather_bounded(coroutines, limit):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines), return_exceptions=True)
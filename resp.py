@@ -0,0 +1,113 @@
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+
+class RespError(Exception):
+    pass
+
+
+def encode_command(args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader):
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the server")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        # Returned rather than raised so that the rest of a pipeline is still
+        # read off the stream.
+        return RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        count = int(body)
+        if count < 0:
+            return None
+        return [await read_reply(reader) for _ in range(count)]
+    raise RespError(f"Unexpected reply: {line!r}")
+
+
+class RespConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host, port, db=0, password=None):
+        reader, writer = await asyncio.open_connection(host, port)
+        connection = cls(reader, writer)
+        setup = []
+        if password:
+            setup.append(["AUTH", password])
+        if db:
+            setup.append(["SELECT", db])
+        if setup:
+            try:
+                await connection.execute(*setup)
+            except BaseException:
+                connection.close()
+                raise
+        return connection
+
+    async def execute(self, *commands):
+        # All commands go out in one write and their replies are read back in
+        # order: a pipeline costs a single round trip.
+        self.writer.write(b"".join(encode_command(command) for command in commands))
+        await self.writer.drain()
+        replies = [await read_reply(self.reader) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def close(self):
+        self.writer.close()
+
+
+class RespPool:
+    def __init__(self, url, size=8):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.size = size
+        self.idle = []
+        self._slots = asyncio.Semaphore(size)
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self._slots:
+            connection = self.idle.pop() if self.idle else await RespConnection.open(self.host, self.port, self.db, self.password)
+            try:
+                yield connection
+            except BaseException:
+                # The connection may be half way through a reply or still
+                # watching keys; don't hand it out again.
+                connection.close()
+                raise
+            self.idle.append(connection)
+
+    async def execute(self, *commands):
+        async with self.connection() as connection:
+            return await connection.execute(*commands)
+
+    def close(self):
+        for connection in self.idle:
+            connection.close()
+        self.idle = []
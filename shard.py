@@ -0,0 +1,388 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
+import signal
+import struct
+import sys
+import tempfile
+import zlib
+
+from hydrogram import Client, filters, idle
+from hydrogram.enums import ChatType
+from hydrogram.handlers import CallbackQueryHandler, MessageHandler
+
+from config import API_HASH, API_ID, BOT_TOKEN_HANGMAN
+from callbacks import CALLBACK_FIELDS, decode_callback
+from codec import codec
+from storage import open_storage
+from traces import TraceRecorder
+
+
+# Frames between the ingress and the workers are a 4-byte big-endian length
+# followed by a compact JSON array:
+#   ["m", user_id, first_name, chat_id, message_id, quote, command, args]
+#   ["c", query_id, user_id, first_name, chat_id, message_id, data]
+#   ["o", outcome fields, user_name, solved_word]
+# A worker's first frame to the ingress is [shard_index]. After that workers
+# only send "o" frames: a group game player's outcome, which the ingress
+# passes on to the worker that owns the player, since that worker keeps the
+# player's stats.
+#
+# Updates go to the worker of the user who sent them, except those for a
+# group game, which go to the worker of the chat it is played in.
+FRAME_HEADER = struct.Struct(">I")
+MAX_PENDING_UPDATES = 10000
+LEADERBOARD_REFRESH_INTERVAL = 10.0
+# Commands that act on the chat's group game.
+CHAT_COMMANDS = {"groupplay"}
+SHUTDOWN_TIMEOUT = 30
+
+
+def shard_for(user_id, shards):
+    # crc32 rather than hash(): every process, and every restart, has to send
+    # a user to the same worker.
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+def pack_frame(payload):
+    body = codec.dumps(payload)
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+async def read_frame(reader):
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        body = await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return codec.loads(body)
+
+
+def callback_game_id(data):
+    # The game id in a button's data: a user id, or a (negative) chat id for a
+    # group game. None for buttons that belong to no game.
+    decoded = decode_callback(data)
+    if decoded is None:
+        return None
+    opcode, args = decoded
+    for kind, value in zip(CALLBACK_FIELDS.get(opcode, ()), args):
+        if kind == "user":
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def message_frame(message, command):
+    user = message.from_user
+    return [
+        "m", user.id, user.first_name, message.chat.id, message.id,
+        message.chat.type != ChatType.PRIVATE, command, message.text.split()[1:]
+    ]
+
+
+def callback_frame(callback_query):
+    user = callback_query.from_user
+    message = callback_query.message
+    return [
+        "c", callback_query.id, user.id, user.first_name,
+        message.chat.id if message else None, message.id if message else None, callback_query.data
+    ]
+
+
+class ShardUser:
+    __slots__ = ("id", "first_name")
+
+    def __init__(self, user_id, first_name):
+        self.id = user_id
+        self.first_name = first_name
+
+
+class ShardChat:
+    __slots__ = ("id",)
+
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+
+class ShardMessage:
+    # The parts of hydrogram's Message that the handlers in Hangman.py use,
+    # rebuilt in the worker from an ingress frame.
+    __slots__ = ("_client", "id", "chat", "from_user", "quote", "command")
+
+    def __init__(self, client, chat_id, message_id, from_user=None, quote=False, command=None):
+        self._client = client
+        self.id = message_id
+        self.chat = ShardChat(chat_id)
+        self.from_user = from_user
+        self.quote = quote
+        # The command and its arguments, like hydrogram's Message.command.
+        self.command = command
+
+    async def reply_text(self, text, reply_markup=None):
+        return await self._client.send_message(
+            self.chat.id, text, reply_markup=reply_markup,
+            reply_to_message_id=self.id if self.quote else None
+        )
+
+    async def edit_text(self, text, reply_markup=None):
+        return await self._client.edit_message_text(self.chat.id, self.id, text, reply_markup=reply_markup)
+
+
+class ShardCallbackQuery:
+    __slots__ = ("_client", "id", "data", "from_user", "message")
+
+    def __init__(self, client, query_id, from_user, message, data):
+        self._client = client
+        self.id = query_id
+        self.from_user = from_user
+        self.message = message
+        self.data = data
+
+    async def answer(self, text=None, show_alert=None):
+        return await self._client.answer_callback_query(self.id, text=text, show_alert=show_alert)
+
+
+async def dispatch(hangman, frame):
+    client = hangman.app
+    try:
+        if frame[0] == "m":
+            _, user_id, first_name, chat_id, message_id, quote, command = frame[:7]
+            # Traces recorded without arguments have no eighth field.
+            args = frame[7] if len(frame) > 7 else []
+            handler = hangman.COMMAND_HANDLERS.get(command)
+            if handler is not None:
+                message = ShardMessage(client, chat_id, message_id, ShardUser(user_id, first_name), quote, [command, *args])
+                await handler(client, message)
+        elif frame[0] == "o":
+            _, fields, user_name, solved_word = frame
+            hangman.player_outcome_aggregator.submit((hangman.GameOutcome(*fields), user_name, solved_word))
+        else:
+            _, query_id, user_id, first_name, chat_id, message_id, data = frame
+            message = ShardMessage(client, chat_id, message_id) if chat_id is not None else None
+            await hangman.callback_router(client, ShardCallbackQuery(client, query_id, ShardUser(user_id, first_name), message, data))
+    except Exception as e:
+        print(f"Error handling update in shard {hangman.SHARD_INDEX}: {e}")
+
+
+async def refresh_leaderboards(hangman):
+    while True:
+        await asyncio.sleep(LEADERBOARD_REFRESH_INTERVAL)
+        try:
+            # Shielded so that shutdown never interrupts a flush half way.
+            await asyncio.shield(hangman.refresh_leaderboards())
+        except Exception as e:
+            print(f"Error refreshing leaderboards: {e}")
+
+
+async def worker_main(index, address):
+    import Hangman
+
+    await Hangman.app.start()
+    await Hangman.on_startup()
+    refresher = asyncio.create_task(refresh_leaderboards(Hangman))
+    handlers = set()
+    try:
+        reader, writer = await asyncio.open_unix_connection(address)
+        writer.write(pack_frame([index]))
+        await writer.drain()
+        Hangman.forward_player_outcome = lambda outcome, user_name, solved_word: writer.write(
+            pack_frame(["o", list(outcome), user_name, solved_word])
+        )
+        while True:
+            frame = await read_frame(reader)
+            if frame is None:
+                break
+            task = asyncio.create_task(dispatch(Hangman, frame))
+            handlers.add(task)
+            task.add_done_callback(handlers.discard)
+        # Still open while the last handlers run: they may forward outcomes.
+        if handlers:
+            await asyncio.wait(handlers, timeout=SHUTDOWN_TIMEOUT)
+        writer.close()
+    finally:
+        refresher.cancel()
+        await Hangman.on_shutdown()
+        await Hangman.app.stop()
+
+
+def run_worker(index, address):
+    # Ctrl-C reaches the whole process group. Workers instead stop once the
+    # ingress closes their connection, after it has forwarded what it had.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ["HANGMAN_SHARD_INDEX"] = str(index)
+    asyncio.run(worker_main(index, address))
+
+
+class ShardLink:
+    def __init__(self, index):
+        self.index = index
+        self.pending = asyncio.Queue(MAX_PENDING_UPDATES)
+        self.writer = None
+        self.connected = asyncio.Event()
+        self.dropped = 0
+
+    def send(self, frame):
+        # Updates are queued while a worker is (re)starting.
+        try:
+            self.pending.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                print(f"Shard {self.index} is not keeping up, dropped {self.dropped} updates")
+
+    def attach(self, writer):
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = writer
+        self.connected.set()
+
+    def detach(self, writer):
+        if self.writer is writer:
+            self.writer = None
+            self.connected.clear()
+        writer.close()
+
+    async def run(self):
+        while True:
+            frame = await self.pending.get()
+            try:
+                while True:
+                    await self.connected.wait()
+                    writer = self.writer
+                    try:
+                        writer.write(frame)
+                        await writer.drain()
+                        break
+                    except (ConnectionError, OSError):
+                        self.detach(writer)
+            finally:
+                self.pending.task_done()
+
+
+class Ingress:
+    # Receives every update with the bot's own session and forwards it to the
+    # worker that owns the user, so each worker keeps its users' games, stats
+    # and configuration to itself.
+    def __init__(self, shards, address):
+        self.address = address
+        self.context = multiprocessing.get_context("spawn")
+        self.links = [ShardLink(index) for index in range(shards)]
+        self.processes = [None] * shards
+        self.tasks = []
+        self.closing = False
+        self.server = None
+        trace_path = os.getenv("HANGMAN_TRACE")
+        self.trace = TraceRecorder(trace_path) if trace_path else None
+        self.client = Client("hangman_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN_HANGMAN)
+        self.client.add_handler(MessageHandler(self.on_message, filters.text & filters.regex(r"^/")))
+        self.client.add_handler(CallbackQueryHandler(self.on_callback_query))
+
+    def route(self, user_id, frame):
+        if self.trace is not None:
+            self.trace.record(frame)
+        self.forward(user_id, frame)
+
+    def forward(self, user_id, frame):
+        self.links[shard_for(user_id, len(self.links))].send(pack_frame(frame))
+
+    async def on_message(self, client, message):
+        if message.from_user is None:
+            return
+        command, _, mention = message.text.split(maxsplit=1)[0][1:].partition("@")
+        if mention and mention.lower() != (client.me.username or "").lower():
+            return
+        command = command.lower()
+        owner = message.chat.id if command in CHAT_COMMANDS else message.from_user.id
+        self.route(owner, message_frame(message, command))
+
+    async def on_callback_query(self, client, callback_query):
+        game_id = callback_game_id(callback_query.data)
+        owner = game_id if game_id is not None and game_id < 0 else callback_query.from_user.id
+        self.route(owner, callback_frame(callback_query))
+
+    async def accept(self, reader, writer):
+        hello = await read_frame(reader)
+        if not hello or not 0 <= hello[0] < len(self.links):
+            writer.close()
+            return
+        link = self.links[hello[0]]
+        link.attach(writer)
+        # End of stream means the worker has gone away.
+        while (frame := await read_frame(reader)) is not None:
+            if frame[0] == "o":
+                self.forward(frame[1][1], frame)
+        link.detach(writer)
+
+    def spawn(self, index):
+        process = self.context.Process(target=run_worker, args=(index, self.address), name=f"hangman-shard-{index}")
+        process.start()
+        self.processes[index] = process
+
+    async def supervise(self):
+        while not self.closing:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if not self.closing and not process.is_alive():
+                    print(f"Shard worker {index} exited with code {process.exitcode}, restarting")
+                    self.spawn(index)
+
+    async def start(self):
+        self.server = await asyncio.start_unix_server(self.accept, path=self.address)
+        for index in range(len(self.links)):
+            self.spawn(index)
+        self.tasks = [asyncio.create_task(link.run()) for link in self.links]
+        self.tasks.append(asyncio.create_task(self.supervise()))
+        if self.trace is not None:
+            self.trace.start()
+        await self.client.start()
+        print(f"Hangman bot has started with {len(self.links)} shard workers!")
+
+    async def stop(self):
+        await self.client.stop()
+        self.closing = True
+        try:
+            await asyncio.wait_for(asyncio.gather(*(link.pending.join() for link in self.links)), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print("Timed out forwarding the last updates to the shard workers")
+        if self.trace is not None:
+            await self.trace.close()
+        for task in self.tasks:
+            task.cancel()
+        for link in self.links:
+            if link.writer is not None:
+                link.detach(link.writer)
+        self.server.close()
+
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                print(f"Shard worker {process.name} did not stop, terminating it")
+                process.terminate()
+        print("Hangman bot has stopped.")
+
+
+async def main(shards):
+    if os.getenv("HANGMAN_STORAGE", "sqlite") != "sqlite":
+        raise SystemExit("Sharded mode needs the sqlite storage backend.")
+    # Create the schema and run the one-shot JSON migration here, before the
+    # workers open the database at the same time.
+    open_storage().close()
+
+    socket_dir = tempfile.mkdtemp(prefix="hangman-")
+    ingress = Ingress(shards, os.path.join(socket_dir, "ingress.sock"))
+    try:
+        await ingress.start()
+        await idle()
+        await ingress.stop()
+    finally:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    shards = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+    print(f'Hangman bot is starting with {shards} shard workers...')
+    asyncio.run(main(shards))
@@ -0,0 +1,222 @@
+import os
+import struct
+import zlib
+
+from game_state import GameState
+from persistence import write_atomically
+
+
+# Both files start with a magic and a generation number. The snapshot holds
+# every active game followed by a CRC32 of the whole file; the journal holds
+# the changes made since the snapshot of the same generation, each entry with
+# its own CRC32 so a write torn by a crash is simply where replay stops.
+SNAPSHOT_MAGIC = b"HGS2"
+JOURNAL_MAGIC = b"HGJ2"
+FILE_HEADER = struct.Struct("<4sQ")
+COUNT = struct.Struct("<I")
+CHECKSUM = struct.Struct("<I")
+ENTRY_HEADER = struct.Struct("<IBH")
+USER_ID = struct.Struct("<q")
+# user_id and the game's new deadline (wall clock).
+TOUCH_RECORD = struct.Struct("<qd")
+# user_id, chat_id, word_index, guessed_mask, keyboard_mask, attempts, score,
+# flags, setup stage, hints, start time, deadline (both wall clock), message id
+# count, name length; followed by the message ids and the UTF-8 name.
+GAME_RECORD = struct.Struct("<qqiIIhiBBBddBH")
+# Group games (PLAYERS_FLAG) then have a player count and, for each player,
+# user_id, guessed_mask, hints, name length and the UTF-8 name.
+PLAYER_COUNT = struct.Struct("<H")
+PLAYER_RECORD = struct.Struct("<qIBH")
+
+SAVE = 1
+DELETE = 2
+TOUCH = 3
+DAILY_FLAG = 1
+PLAYERS_FLAG = 2
+SETUP_STAGES = (None, "category_selection", "difficulty_selection", "game_started")
+MAX_MESSAGE_IDS = 255
+
+
+def encode_game(user_id, game, deadline):
+    name = (game.user_name or "").encode()[:0xFFFF]
+    message_ids = game.message_ids[-MAX_MESSAGE_IDS:]
+    flags = (DAILY_FLAG if game.is_daily_challenge else 0) | (PLAYERS_FLAG if game.players else 0)
+    parts = [
+        GAME_RECORD.pack(
+            int(user_id), game.chat_id, game.word_index, game.guessed_mask, game.keyboard_mask,
+            game.attempts, game.score, flags,
+            SETUP_STAGES.index(game.setup_stage), min(game.hints, 0xFF), game.started_at, deadline,
+            len(message_ids), len(name)
+        ),
+        struct.pack(f"<{len(message_ids)}i", *message_ids),
+        name,
+    ]
+    if game.players:
+        parts.append(PLAYER_COUNT.pack(len(game.players)))
+        for player_id, (player_name, guessed_mask, hints) in game.players.items():
+            player_name = (player_name or "").encode()[:0xFFFF]
+            parts.append(PLAYER_RECORD.pack(int(player_id), guessed_mask, min(hints, 0xFF), len(player_name)))
+            parts.append(player_name)
+    return b"".join(parts)
+
+
+def decode_game(data, offset=0):
+    (user_id, chat_id, word_index, guessed_mask, keyboard_mask, attempts, score,
+     flags, stage, hints, started_at, deadline, message_count, name_length) = GAME_RECORD.unpack_from(data, offset)
+    offset += GAME_RECORD.size
+    game = GameState(chat_id)
+    game.message_ids = struct.unpack_from(f"<{message_count}i", data, offset)
+    offset += 4 * message_count
+    game.user_name = data[offset:offset + name_length].decode() or None
+    offset += name_length
+    game.setup_stage = SETUP_STAGES[stage]
+    game.word_index = word_index
+    game.guessed_mask = guessed_mask
+    game.keyboard_mask = keyboard_mask
+    game.attempts = attempts
+    game.score = score
+    game.is_daily_challenge = bool(flags & DAILY_FLAG)
+    game.hints = hints
+    game.started_at = started_at
+    if flags & PLAYERS_FLAG:
+        count, = PLAYER_COUNT.unpack_from(data, offset)
+        offset += PLAYER_COUNT.size
+        for _ in range(count):
+            player_id, guessed_mask, player_hints, name_length = PLAYER_RECORD.unpack_from(data, offset)
+            offset += PLAYER_RECORD.size
+            game.players[str(player_id)] = (data[offset:offset + name_length].decode(), guessed_mask, player_hints)
+            offset += name_length
+    return str(user_id), game, deadline, offset
+
+
+class GameJournal:
+    def __init__(self, path):
+        self.snapshot_path = path
+        self.journal_path = path + ".journal"
+        self.generation = 0
+        self.pending = bytearray()
+        self.journal_size = 0
+
+    def _read_snapshot(self):
+        with open(self.snapshot_path, "rb") as f:
+            data = f.read()
+        body, (checksum,) = data[:-CHECKSUM.size], CHECKSUM.unpack_from(data, len(data) - CHECKSUM.size)
+        magic, generation = FILE_HEADER.unpack_from(body)
+        if magic != SNAPSHOT_MAGIC or zlib.crc32(body) != checksum:
+            raise ValueError("bad magic or checksum")
+
+        games = {}
+        offset = FILE_HEADER.size
+        count, = COUNT.unpack_from(body, offset)
+        offset += COUNT.size
+        for _ in range(count):
+            user_id, game, deadline, offset = decode_game(body, offset)
+            games[user_id] = (game, deadline)
+        return generation, games
+
+    def _replay_journal(self, games):
+        # Returns where the valid part of the journal ends, 0 if none of it
+        # can be used.
+        with open(self.journal_path, "rb") as f:
+            data = f.read()
+        if len(data) < FILE_HEADER.size:
+            return 0
+        magic, generation = FILE_HEADER.unpack_from(data)
+        if magic != JOURNAL_MAGIC or generation != self.generation:
+            # Left over from before the latest snapshot, which already has
+            # these changes (or written by an older version).
+            return 0
+
+        offset = FILE_HEADER.size
+        while offset + ENTRY_HEADER.size <= len(data):
+            checksum, op, length = ENTRY_HEADER.unpack_from(data, offset)
+            start = offset + ENTRY_HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload, op) != checksum:
+                break
+            if op == SAVE:
+                user_id, game, deadline, _ = decode_game(payload)
+                games[user_id] = (game, deadline)
+            elif op == DELETE:
+                games.pop(str(USER_ID.unpack(payload)[0]), None)
+            elif op == TOUCH:
+                user_id, deadline = TOUCH_RECORD.unpack(payload)
+                entry = games.get(str(user_id))
+                if entry is not None:
+                    games[str(user_id)] = (entry[0], deadline)
+            offset = start + length
+        return offset
+
+    def load(self):
+        # Returns {user_id: (game, deadline)}.
+        games = {}
+        try:
+            self.generation, games = self._read_snapshot()
+        except FileNotFoundError:
+            pass
+        except (ValueError, struct.error, UnicodeDecodeError, IndexError) as e:
+            print(f"Ignoring unreadable game snapshot {self.snapshot_path}: {e}")
+
+        valid_size = 0
+        try:
+            valid_size = self._replay_journal(games)
+        except FileNotFoundError:
+            pass
+        except (ValueError, struct.error, UnicodeDecodeError, IndexError) as e:
+            print(f"Stopped replaying game journal {self.journal_path}: {e}")
+
+        # New entries are appended, so they must not land behind a torn entry
+        # or in a journal that the next start would ignore.
+        if valid_size:
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(valid_size)
+            self.journal_size = valid_size
+        else:
+            write_atomically(self.journal_path, FILE_HEADER.pack(JOURNAL_MAGIC, self.generation))
+            self.journal_size = FILE_HEADER.size
+        return games
+
+    def _append(self, op, payload):
+        self.pending += ENTRY_HEADER.pack(zlib.crc32(payload, op), op, len(payload))
+        self.pending += payload
+
+    def record_save(self, user_id, game, deadline):
+        self._append(SAVE, encode_game(user_id, game, deadline))
+
+    def record_delete(self, user_id):
+        self._append(DELETE, USER_ID.pack(int(user_id)))
+
+    def record_touch(self, user_id, deadline):
+        self._append(TOUCH, TOUCH_RECORD.pack(int(user_id), deadline))
+
+    def take_pending(self):
+        data, self.pending = bytes(self.pending), bytearray()
+        return data
+
+    def write_journal(self, data):
+        # Runs on the I/O thread.
+        with open(self.journal_path, "ab") as f:
+            if f.tell() == 0:
+                f.write(FILE_HEADER.pack(JOURNAL_MAGIC, self.generation))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            self.journal_size = f.tell()
+
+    def build_snapshot(self, games):
+        # Called on the event loop, so the snapshot is a consistent view; the
+        # changes still pending are part of it and are dropped.
+        self.pending = bytearray()
+        self.generation += 1
+        parts = [FILE_HEADER.pack(SNAPSHOT_MAGIC, self.generation), COUNT.pack(len(games))]
+        parts.extend(encode_game(user_id, game, deadline) for user_id, game, deadline in games)
+        body = b"".join(parts)
+        return self.generation, body + CHECKSUM.pack(zlib.crc32(body))
+
+    def write_snapshot(self, generation, data):
+        # Runs on the I/O thread. The journal is only reset once the snapshot
+        # is in place; a crash in between leaves a journal of the previous
+        # generation, which load() ignores.
+        write_atomically(self.snapshot_path, data)
+        write_atomically(self.journal_path, FILE_HEADER.pack(JOURNAL_MAGIC, generation))
+        self.journal_size = FILE_HEADER.size
@@ -0,0 +1,295 @@
+import json
+import os
+import sqlite3
+import sys
+from datetime import date
+
+from codec import codec
+from persistence import JsonDocumentFile
+
+
+PLAYER_FIELDS = (
+    "name", "games_played", "games_won", "total_score", "guessed_letters",
+    "solved_words", "streak", "last_played", "achievements", "scores"
+)
+DAILY_FIELDS = ("last_played", "score", "total_score", "streak")
+
+PLAYERS_FILE = 'player_stats.json'
+DAILY_FILE = 'daily_challenges.json'
+CONFIGS_FILE = 'users_config.json'
+
+
+def best_score(record):
+    scores = record.get("scores") or [0]
+    return max(scores)
+
+
+class JsonStorage:
+    def __init__(self, players_path=PLAYERS_FILE, daily_path=DAILY_FILE, configs_path=CONFIGS_FILE):
+        self.players = JsonDocumentFile(players_path)
+        self.daily = JsonDocumentFile(daily_path)
+        self.configs = JsonDocumentFile(configs_path)
+        self.players_loaded = False
+
+    def _player_document(self):
+        # The file has no index to look players up by, so it is read once and
+        # kept whole.
+        if not self.players_loaded:
+            self.players.load()
+            self.players_loaded = True
+        return self.players.document
+
+    def load_players(self, user_ids=None):
+        players = self._player_document()
+        if user_ids is None:
+            user_ids = list(players)
+        return {user_id: self.players.copy_of(user_id) for user_id in user_ids if user_id in players}
+
+    def encode_player(self, record):
+        return codec.dumps(record)
+
+    def write_players(self, batch):
+        self._player_document()
+        self.players.write_batch(batch)
+
+    def load_daily(self):
+        self.daily.load()
+        return self.daily.copy()
+
+    def write_daily(self, batch):
+        self.daily.write_batch(batch)
+
+    def load_configs(self):
+        self.configs.load()
+        return self.configs.copy()
+
+    def write_configs(self, batch):
+        self.configs.write_batch(batch)
+
+    def top_players(self, order_by, limit):
+        if order_by == "best_score":
+            key = best_score
+        else:
+            key = lambda record: record.get(order_by, 0)
+        ranked = sorted(self._player_document().items(), key=lambda item: key(item[1]), reverse=True)
+        return [(user_id, key(record)) for user_id, record in ranked[:limit]]
+
+    def top_daily(self, day, limit):
+        ranked = sorted(
+            ((user_id, data.get('total_score', data['score']), data.get('streak', 1))
+             for user_id, data in self.daily.document.items() if data['last_played'] == day),
+            key=lambda x: (x[1], x[2]),
+            reverse=True
+        )
+        return ranked[:limit]
+
+    def close(self):
+        pass
+
+
+class SqliteStorage:
+    def __init__(self, path='hangman.db'):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS players (
+                    user_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL DEFAULT '',
+                    games_played INTEGER NOT NULL DEFAULT 0,
+                    games_won INTEGER NOT NULL DEFAULT 0,
+                    total_score INTEGER NOT NULL DEFAULT 0,
+                    guessed_letters INTEGER NOT NULL DEFAULT 0,
+                    solved_words INTEGER NOT NULL DEFAULT 0,
+                    streak INTEGER NOT NULL DEFAULT 0,
+                    last_played TEXT,
+                    achievements TEXT NOT NULL DEFAULT '[]',
+                    scores TEXT NOT NULL DEFAULT '[]',
+                    best_score INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS players_by_wins ON players (games_won DESC);
+                CREATE INDEX IF NOT EXISTS players_by_best_score ON players (best_score DESC);
+                CREATE INDEX IF NOT EXISTS players_by_total_score ON players (total_score DESC);
+
+                CREATE TABLE IF NOT EXISTS daily_challenges (
+                    user_id TEXT PRIMARY KEY,
+                    last_played TEXT NOT NULL,
+                    score INTEGER NOT NULL DEFAULT 0,
+                    total_score INTEGER NOT NULL DEFAULT 0,
+                    streak INTEGER NOT NULL DEFAULT 1
+                );
+                CREATE INDEX IF NOT EXISTS daily_by_date ON daily_challenges (last_played, total_score DESC, streak DESC);
+
+                CREATE TABLE IF NOT EXISTS user_configs (
+                    user_id TEXT PRIMARY KEY,
+                    config TEXT NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+            """)
+
+    def get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def encode_player(self, record):
+        # Takes the live record (achievements as a set, last_played as a
+        # date) or one loaded from JSON, and returns the column values.
+        last_played = record.get("last_played")
+        if isinstance(last_played, date):
+            last_played = last_played.isoformat()
+        return (
+            record.get("name", ""),
+            record.get("games_played", 0),
+            record.get("games_won", 0),
+            record.get("total_score", 0),
+            record.get("guessed_letters", 0),
+            record.get("solved_words", 0),
+            record.get("streak", 0),
+            last_played,
+            codec.dumps(record.get("achievements", [])).decode(),
+            codec.dumps(record.get("scores", [])).decode(),
+            best_score(record),
+        )
+
+    def _player_record(self, row):
+        record = dict(zip(PLAYER_FIELDS, row[1:11]))
+        record["achievements"] = codec.loads(record["achievements"])
+        record["scores"] = codec.loads(record["scores"])
+        return row[0], record
+
+    def load_players(self, user_ids=None):
+        query = f"SELECT user_id, {', '.join(PLAYER_FIELDS)} FROM players"
+        if user_ids is None:
+            return dict(self._player_record(row) for row in self.db.execute(query))
+        user_ids = list(user_ids)
+        players = {}
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i+500]
+            rows = self.db.execute(f"{query} WHERE user_id IN ({', '.join('?' * len(chunk))})", chunk)
+            players.update(self._player_record(row) for row in rows)
+        return players
+
+    def write_players(self, batch):
+        # Values come from encode_player().
+        upserts = [(user_id, *values) for user_id, values in batch.items() if values is not None]
+        deletes = [(user_id,) for user_id, values in batch.items() if values is None]
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO players (user_id, name, games_played, games_won, total_score, "
+                "guessed_letters, solved_words, streak, last_played, achievements, scores, best_score) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                upserts
+            )
+            if deletes:
+                self.db.executemany("DELETE FROM players WHERE user_id = ?", deletes)
+
+    def load_daily(self):
+        rows = self.db.execute(f"SELECT user_id, {', '.join(DAILY_FIELDS)} FROM daily_challenges")
+        return {row[0]: dict(zip(DAILY_FIELDS, row[1:])) for row in rows}
+
+    def write_daily(self, batch):
+        upserts = [
+            (user_id, data['last_played'], data.get('score', 0), data.get('total_score', data.get('score', 0)), data.get('streak', 1))
+            for user_id, data in batch.items() if data is not None
+        ]
+        deletes = [(user_id,) for user_id, data in batch.items() if data is None]
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO daily_challenges (user_id, last_played, score, total_score, streak) "
+                "VALUES (?, ?, ?, ?, ?)",
+                upserts
+            )
+            if deletes:
+                self.db.executemany("DELETE FROM daily_challenges WHERE user_id = ?", deletes)
+
+    def load_configs(self):
+        rows = self.db.execute("SELECT user_id, config FROM user_configs")
+        return {user_id: json.loads(config) for user_id, config in rows}
+
+    def write_configs(self, batch):
+        upserts = [(user_id, json.dumps(config)) for user_id, config in batch.items() if config is not None]
+        deletes = [(user_id,) for user_id, config in batch.items() if config is None]
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO user_configs (user_id, config) VALUES (?, ?)", upserts)
+            if deletes:
+                self.db.executemany("DELETE FROM user_configs WHERE user_id = ?", deletes)
+
+    def top_players(self, order_by, limit):
+        if order_by not in ("games_won", "best_score", "total_score"):
+            raise ValueError(f"Unsupported leaderboard column: {order_by}")
+        rows = self.db.execute(
+            f"SELECT user_id, {order_by} FROM players ORDER BY {order_by} DESC LIMIT ?", (limit,)
+        )
+        return rows.fetchall()
+
+    def top_daily(self, day, limit):
+        rows = self.db.execute(
+            "SELECT user_id, total_score, streak FROM daily_challenges WHERE last_played = ? "
+            "ORDER BY total_score DESC, streak DESC LIMIT ?",
+            (day, limit)
+        )
+        return rows.fetchall()
+
+    def close(self):
+        self.db.close()
+
+
+def migrate_json_to_sqlite(storage, players_path=PLAYERS_FILE, daily_path=DAILY_FILE, configs_path=CONFIGS_FILE):
+    if storage.get_meta("json_migrated"):
+        return False
+
+    migrated = {}
+    write_players = lambda document: storage.write_players(
+        {user_id: storage.encode_player(record) for user_id, record in document.items()}
+    )
+    for path, write in ((players_path, write_players),
+                        (daily_path, storage.write_daily),
+                        (configs_path, storage.write_configs)):
+        if not os.path.exists(path):
+            continue
+        document = JsonDocumentFile(path).load()
+        if not os.path.exists(path):
+            # Unreadable, and moved aside by load().
+            continue
+        write(document)
+        migrated[path] = len(document)
+
+    storage.set_meta("json_migrated", json.dumps(migrated))
+    for path in migrated:
+        os.replace(path, path + ".migrated")
+        print(f"Migrated {migrated[path]} records from {path} into {storage.path}")
+    return True
+
+
+def open_storage(backend=None, db_path=None):
+    backend = backend or os.getenv("HANGMAN_STORAGE", "sqlite")
+    if backend == "json":
+        return JsonStorage()
+    if backend == "sqlite":
+        storage = SqliteStorage(db_path or os.getenv("HANGMAN_DB", "hangman.db"))
+        migrate_json_to_sqlite(storage)
+        return storage
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["migrate"]:
+        print("Usage: python storage.py migrate [database path]")
+        sys.exit(1)
+    storage = SqliteStorage(sys.argv[2] if len(sys.argv) > 2 else os.getenv("HANGMAN_DB", "hangman.db"))
+    if not migrate_json_to_sqlite(storage):
+        print(f"{storage.path} has already been migrated.")
+    storage.close()
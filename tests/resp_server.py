@@ -0,0 +1,361 @@
+import asyncio
+import fnmatch
+import sys
+import time
+
+
+# A small in-process stand-in for a Redis server, covering the commands the
+# RedisGameStore uses (hashes, sorted sets, key expiry and WATCH/MULTI/EXEC).
+# Run it with `python tests/resp_server.py [port]` and point HANGMAN_REDIS_URL at it
+# to try the shared game store without installing Redis.
+class Status(str):
+    pass
+
+
+class ReplyError(Exception):
+    pass
+
+
+OK = Status("OK")
+QUEUED = Status("QUEUED")
+
+
+def encode_reply(reply):
+    if isinstance(reply, Status):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, ReplyError):
+        return b"-%s\r\n" % str(reply).encode()
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, bool):
+        reply = int(reply)
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, (bytes, str, float)):
+        if not isinstance(reply, bytes):
+            reply = (repr(reply) if isinstance(reply, float) else reply).encode()
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    if isinstance(reply, list):
+        return b"*%d\r\n" % len(reply) + b"".join(encode_reply(item) for item in reply)
+    raise TypeError(f"Cannot encode {reply!r}")
+
+
+def parse_score(value):
+    value = value.decode().lower()
+    if value in ("-inf", "+inf", "inf"):
+        return float(value)
+    exclusive = value.startswith("(")
+    return float(value[1:] if exclusive else value), exclusive
+
+
+class Session:
+    def __init__(self):
+        self.watched = {}
+        self.queue = None
+
+
+class RespServer:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.versions = {}
+        self.server = None
+        self.clients = {}
+
+    # Keyspace
+
+    def _changed(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _lookup(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            del self.expires[key]
+            del self.data[key]
+            self._changed(key)
+        return self.data.get(key)
+
+    def _typed(self, key, kind, create=False):
+        value = self._lookup(key)
+        if value is None:
+            if not create:
+                return None
+            value = self.data[key] = kind()
+        elif not isinstance(value, kind):
+            raise ReplyError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _delete(self, key):
+        if self._lookup(key) is None:
+            return 0
+        del self.data[key]
+        self.expires.pop(key, None)
+        self._changed(key)
+        return 1
+
+    def _drop_if_empty(self, key):
+        if not self.data[key]:
+            self._delete(key)
+
+    # Commands
+
+    def cmd_ping(self, session, *args):
+        return args[0] if args else Status("PONG")
+
+    def cmd_select(self, session, db):
+        return OK
+
+    def cmd_auth(self, session, *args):
+        return OK
+
+    def cmd_flushall(self, session, *args):
+        for key in list(self.data):
+            self._delete(key)
+        return OK
+
+    def cmd_keys(self, session, pattern):
+        return [key for key in list(self.data) if self._lookup(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern.decode())]
+
+    def cmd_get(self, session, key):
+        return self._typed(key, bytes)
+
+    def cmd_set(self, session, key, value):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        self._changed(key)
+        return OK
+
+    def cmd_del(self, session, *keys):
+        return sum(self._delete(key) for key in keys)
+
+    def cmd_exists(self, session, *keys):
+        return sum(self._lookup(key) is not None for key in keys)
+
+    def cmd_pexpire(self, session, key, milliseconds):
+        if self._lookup(key) is None:
+            return 0
+        self.expires[key] = time.monotonic() + int(milliseconds) / 1000
+        self._changed(key)
+        return 1
+
+    def cmd_expire(self, session, key, seconds):
+        return self.cmd_pexpire(session, key, int(seconds) * 1000)
+
+    def cmd_pttl(self, session, key):
+        if self._lookup(key) is None:
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else int((deadline - time.monotonic()) * 1000)
+
+    def cmd_hset(self, session, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise ReplyError("ERR wrong number of arguments for 'hset' command")
+        fields = self._typed(key, dict, create=True)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in fields
+            fields[field] = value
+        self._changed(key)
+        return added
+
+    def cmd_hget(self, session, key, field):
+        fields = self._typed(key, dict)
+        return fields.get(field) if fields else None
+
+    def cmd_hgetall(self, session, key):
+        fields = self._typed(key, dict) or {}
+        return [item for pair in fields.items() for item in pair]
+
+    def cmd_hdel(self, session, key, *names):
+        fields = self._typed(key, dict)
+        if not fields:
+            return 0
+        removed = sum(fields.pop(name, None) is not None for name in names)
+        if removed:
+            self._changed(key)
+            self._drop_if_empty(key)
+        return removed
+
+    def cmd_zadd(self, session, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise ReplyError("ERR syntax error")
+        members = self._typed(key, Zset, create=True)
+        added = 0
+        for score, member in zip(pairs[::2], pairs[1::2]):
+            added += member not in members
+            members[member] = float(score)
+        self._changed(key)
+        return added
+
+    def cmd_zrem(self, session, key, *names):
+        members = self._typed(key, Zset)
+        if not members:
+            return 0
+        removed = sum(members.pop(name, None) is not None for name in names)
+        if removed:
+            self._changed(key)
+            self._drop_if_empty(key)
+        return removed
+
+    def cmd_zcard(self, session, key):
+        return len(self._typed(key, Zset) or ())
+
+    def cmd_zscore(self, session, key, member):
+        score = (self._typed(key, Zset) or {}).get(member)
+        return None if score is None else score
+
+    def _zrange(self, key, low, high):
+        members = self._typed(key, Zset) or {}
+        low, high = parse_score(low), parse_score(high)
+
+        def within(score):
+            for bound, above in ((low, True), (high, False)):
+                if isinstance(bound, tuple):
+                    value, exclusive = bound
+                    if above and (score < value or exclusive and score == value):
+                        return False
+                    if not above and (score > value or exclusive and score == value):
+                        return False
+                elif above and score < bound or not above and score > bound:
+                    return False
+            return True
+
+        return sorted(((score, member) for member, score in members.items() if within(score)))
+
+    def cmd_zrangebyscore(self, session, key, low, high, *options):
+        entries = self._zrange(key, low, high)
+        options = [option.upper() for option in options]
+        if b"LIMIT" in options:
+            position = options.index(b"LIMIT")
+            offset, count = int(options[position + 1]), int(options[position + 2])
+            entries = entries[offset:] if count < 0 else entries[offset:offset + count]
+        if b"WITHSCORES" in options:
+            return [item for score, member in entries for item in (member, score)]
+        return [member for _, member in entries]
+
+    def cmd_zremrangebyscore(self, session, key, low, high):
+        entries = self._zrange(key, low, high)
+        if entries:
+            members = self.data[key]
+            for _, member in entries:
+                del members[member]
+            self._changed(key)
+            self._drop_if_empty(key)
+        return len(entries)
+
+    # Transactions
+
+    def cmd_watch(self, session, *keys):
+        if session.queue is not None:
+            raise ReplyError("ERR WATCH inside MULTI is not allowed")
+        for key in keys:
+            self._lookup(key)
+            session.watched.setdefault(key, self.versions.get(key, 0))
+        return OK
+
+    def cmd_unwatch(self, session):
+        session.watched = {}
+        return OK
+
+    def cmd_multi(self, session):
+        if session.queue is not None:
+            raise ReplyError("ERR MULTI calls can not be nested")
+        session.queue = []
+        return OK
+
+    def cmd_discard(self, session):
+        if session.queue is None:
+            raise ReplyError("ERR DISCARD without MULTI")
+        session.queue = None
+        session.watched = {}
+        return OK
+
+    def cmd_exec(self, session):
+        if session.queue is None:
+            raise ReplyError("ERR EXEC without MULTI")
+        queue, session.queue = session.queue, None
+        watched, session.watched = session.watched, {}
+        for key, version in watched.items():
+            self._lookup(key)
+            if self.versions.get(key, 0) != version:
+                return None
+        return [self.call(session, command) for command in queue]
+
+    # Dispatch
+
+    def call(self, session, command):
+        handler = getattr(self, "cmd_" + command[0].decode().lower(), None)
+        if handler is None:
+            return ReplyError(f"ERR unknown command '{command[0].decode()}'")
+        try:
+            return handler(session, *command[1:])
+        except TypeError:
+            return ReplyError(f"ERR wrong number of arguments for '{command[0].decode().lower()}' command")
+        except (ReplyError, ValueError) as e:
+            return e if isinstance(e, ReplyError) else ReplyError("ERR value is not a valid number")
+
+    def handle(self, session, command):
+        name = command[0].upper()
+        if session.queue is not None and name not in (b"EXEC", b"DISCARD", b"MULTI", b"WATCH"):
+            if not hasattr(self, "cmd_" + name.decode().lower()):
+                return ReplyError(f"ERR unknown command '{command[0].decode()}'")
+            session.queue.append(command)
+            return QUEUED
+        return self.call(session, command)
+
+    async def serve_client(self, reader, writer):
+        session = Session()
+        self.clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                command = await read_command(reader)
+                if command is None:
+                    break
+                writer.write(encode_reply(self.handle(session, command)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=6379):
+        self.server = await asyncio.start_server(self.serve_client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        tasks = list(self.clients.values())
+        for writer in list(self.clients):
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+
+class Zset(dict):
+    pass
+
+
+async def read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split() or [b"PING"]
+    command = []
+    for _ in range(int(line[1:])):
+        header = await reader.readline()
+        length = int(header[1:])
+        command.append((await reader.readexactly(length + 2))[:-2])
+    return command
+
+
+async def main(port):
+    server = RespServer()
+    port = await server.start(port=port)
+    print(f"RESP stand-in server listening on 127.0.0.1:{port}")
+    await server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 6379))
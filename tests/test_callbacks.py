@@ -0,0 +1,110 @@
+import base64
+import random
+
+import pytest
+
+from callbacks import (
+    CALLBACK_DATA_LIMIT, CALLBACK_FIELDS, CALLBACK_VERSION, CATEGORY, CONFIG, DAILY, DIFFICULTY, FIELD_TABLES, GUESS,
+    LEADERBOARD, SET_EMOJI, SET_EMOJI_LEGACY, decode_callback, encode_callback,
+)
+
+USER_IDS = ["0", "1", "777000", "6123456789", "-1", "-100123", "-1001234567890", str(2 ** 63 - 1), str(-2 ** 63)]
+
+
+def sample_args(opcode, rng):
+    args = []
+    for kind in CALLBACK_FIELDS[opcode]:
+        if kind == "user":
+            args.append(rng.choice(USER_IDS))
+        elif kind == "index":
+            args.append(rng.randrange(256))
+        else:
+            args.append(rng.choice(FIELD_TABLES[kind]))
+    return tuple(args)
+
+
+def test_every_opcode_round_trips():
+    rng = random.Random(1)
+    for opcode in CALLBACK_FIELDS:
+        for _ in range(50):
+            args = sample_args(opcode, rng)
+            data = encode_callback(opcode, *args)
+            assert data[0] == CALLBACK_VERSION
+            assert decode_callback(data) == (opcode, args)
+
+
+def test_group_ids_round_trip():
+    for chat_id in (-1, -100123, -1001234567890, -2 ** 63):
+        assert decode_callback(encode_callback(CATEGORY, "animals", chat_id)) == (CATEGORY, ("animals", str(chat_id)))
+        assert decode_callback(encode_callback(GUESS, "Q", str(chat_id))) == (GUESS, ("Q", str(chat_id)))
+
+
+def test_largest_callbacks_fit_telegram_limit():
+    for opcode, fields in CALLBACK_FIELDS.items():
+        args = []
+        for kind in fields:
+            if kind == "user":
+                args.append(-2 ** 63)
+            elif kind == "index":
+                args.append(255)
+            else:
+                args.append(FIELD_TABLES[kind][-1])
+        assert len(encode_callback(opcode, *args).encode()) <= CALLBACK_DATA_LIMIT
+
+
+def test_oversized_callback_is_refused():
+    with pytest.raises(ValueError):
+        encode_callback(DAILY, 2 ** 400)
+
+
+def test_wrong_argument_count_is_refused():
+    with pytest.raises(ValueError):
+        encode_callback(DIFFICULTY, "animals", "easy")
+
+
+def test_legacy_callbacks():
+    assert decode_callback("guess_Q_-100123") == (GUESS, ("Q", "-100123"))
+    assert decode_callback("difficulty_animals_hard_42") == (DIFFICULTY, ("animals", "hard", "42"))
+    assert decode_callback("config_emoji_42") == (CONFIG, ("emoji", "42"))
+    assert decode_callback("config_close") == (CONFIG, ("close", None))
+    assert decode_callback("leaderboard_wins") == (LEADERBOARD, ("wins",))
+    # Old emoji buttons carry the emoji itself rather than its option row.
+    assert decode_callback("set_lives_0_❤️_42") == (SET_EMOJI_LEGACY, ("lives", 0, "❤️", "42"))
+    assert decode_callback("set_lives_x_❤️_42") is None
+    assert decode_callback("set_lives_0") is None
+
+
+@pytest.mark.parametrize("data", [
+    "",
+    "1",
+    "1=",
+    "1!!!!",
+    "1é",
+    "garbage",
+    "guess",
+    "difficulty_animals",
+    # Opcode of the legacy emoji buttons, never encoded in this format.
+    CALLBACK_VERSION + base64.urlsafe_b64encode(bytes((SET_EMOJI_LEGACY, 2))).decode().rstrip("="),
+    # Unknown opcode, field index past its table, varint cut short.
+    CALLBACK_VERSION + base64.urlsafe_b64encode(bytes((200, 2))).decode().rstrip("="),
+    CALLBACK_VERSION + base64.urlsafe_b64encode(bytes((CATEGORY, 250, 2))).decode().rstrip("="),
+    CALLBACK_VERSION + base64.urlsafe_b64encode(bytes((DAILY, 0x80, 0x80))).decode().rstrip("="),
+])
+def test_malformed_callbacks_decode_to_none(data):
+    assert decode_callback(data) is None
+
+
+def test_random_garbage_never_raises():
+    rng = random.Random(2)
+    for _ in range(5000):
+        payload = bytes(rng.randrange(256) for _ in range(rng.randrange(40)))
+        decode_callback(CALLBACK_VERSION + base64.urlsafe_b64encode(payload).decode().rstrip("="))
+        decode_callback("".join(rng.choice("1_abcdefghijklmnopqrstuvwxyz0123456789-=é") for _ in range(rng.randrange(64))))
+
+
+def test_truncated_callbacks_decode_to_none():
+    data = encode_callback(SET_EMOJI, "keyboard", 3, 1, "-1001234567890")
+    payload = base64.urlsafe_b64decode(data[1:] + "=" * (-len(data[1:]) % 4))
+    for end in range(len(payload)):
+        truncated = CALLBACK_VERSION + base64.urlsafe_b64encode(payload[:end]).decode().rstrip("=")
+        assert decode_callback(truncated) is None
@@ -0,0 +1,64 @@
+import os
+from datetime import date
+
+from daily import DailyChallengeState
+from persistence import io_executor
+from storage import JsonStorage
+
+
+
+def wait_for_writes():
+    # Group commits run on the I/O thread, in order.
+    io_executor.submit(lambda: None).result()
+
+def json_storage(directory):
+    return JsonStorage(
+        os.path.join(directory, "players.json"), os.path.join(directory, "daily.json"), os.path.join(directory, "configs.json")
+    )
+
+
+def flush(state):
+    # What WriteBehindStore.flush() does, one step at a time.
+    keys, state.store.dirty = state.store.dirty, set()
+    return {key: state._serialize(key) for key in keys}
+
+
+def test_score_set_while_a_flush_is_writing_is_kept(tmp_path):
+    storage = json_storage(str(tmp_path))
+    state = DailyChallengeState(storage)
+    assert state.can_play("7")
+    batch = flush(state)
+    state.update_score("7", 42)
+    # The I/O thread writes the older batch after the handler has moved on.
+    storage.write_daily(batch)
+    wait_for_writes()
+
+    assert state.entries["7"]["score"] == 42
+    assert state.entries["7"]["total_score"] == 42
+    assert "7" in state.store.dirty
+    storage.write_daily(flush(state))
+    wait_for_writes()
+    assert json_storage(str(tmp_path)).load_daily()["7"]["score"] == 42
+
+
+def test_new_players_do_not_touch_the_written_document(tmp_path):
+    storage = json_storage(str(tmp_path))
+    storage.write_daily({"1": {"last_played": "2024-01-01", "score": 5, "total_score": 5, "streak": 1}})
+    wait_for_writes()
+    state = DailyChallengeState(json_storage(str(tmp_path)))
+    document = state.storage.daily.document
+    assert state.entries is not document
+
+    for user_id in range(2, 50):
+        state.can_play(str(user_id))
+    assert list(document) == ["1"]
+
+
+def test_update_score_keeps_best_score_and_streak(tmp_path):
+    state = DailyChallengeState(json_storage(str(tmp_path)))
+    today = date.today().isoformat()
+    state.entries["1"] = {"last_played": "2000-01-01", "score": 3, "total_score": 3, "streak": 4}
+    assert state.update_score("1", 10) == (10, 1)
+    assert state.update_score("1", 5) == (10, 1)
+    assert state.entries["1"] == {"last_played": today, "score": 10, "total_score": 13, "streak": 1}
+    assert state.leaderboard() == [("1", 13, 1)]
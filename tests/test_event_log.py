@@ -0,0 +1,123 @@
+import asyncio
+import glob
+import os
+
+from event_log import RECORD_SIZE, SEGMENT_MAGIC, Aggregator, EventLog, GameOutcome, decode_outcome, encode_outcome, read_outcomes
+
+
+def outcome(i, **fields):
+    values = dict(
+        finished_at=1700000000.0 + i, user_id=6123456789 + i, chat_id=-1001234567890, message_id=i,
+        word_index=i % 50, guessed_mask=0b1011 << (i % 10), guesses=i % 30, hints=i % 3, attempts_left=i % 7,
+        score=i * 10 - 50, duration=12.5, won=i % 2 == 0, is_daily_challenge=i % 5 == 0, is_group_game=i % 3 == 0,
+    )
+    values.update(fields)
+    return GameOutcome(**values)
+
+
+def segments(directory):
+    return sorted(glob.glob(os.path.join(directory, "**", "events-*.log"), recursive=True))
+
+
+def test_outcome_record_round_trips():
+    for i in range(40):
+        assert decode_outcome(encode_outcome(outcome(i))) == outcome(i)
+    # Counts past a byte are capped rather than wrapped.
+    assert decode_outcome(encode_outcome(outcome(1, guesses=300, hints=256))).guesses == 255
+
+
+def test_segments_rotate_past_their_size(tmp_path):
+    directory = str(tmp_path)
+    log = EventLog(directory, segment_size=10 * RECORD_SIZE)
+    for i in range(95):
+        log.append(outcome(i))
+        if i % 4 == 3:
+            log.flush_sync()
+    log.flush_sync()
+
+    paths = segments(directory)
+    assert [os.path.basename(path) for path in paths] == [f"events-{i:06d}.log" for i in range(1, len(paths) + 1)]
+    assert len(paths) > 5
+    for path in paths[:-1]:
+        assert os.path.getsize(path) >= 10 * RECORD_SIZE
+    for path in paths:
+        with open(path, "rb") as f:
+            assert f.read(len(SEGMENT_MAGIC)) == SEGMENT_MAGIC
+    assert list(read_outcomes(directory)) == [outcome(i) for i in range(95)]
+
+
+def test_restart_starts_a_new_segment(tmp_path):
+    directory = str(tmp_path)
+    log = EventLog(directory)
+    log.append(outcome(0))
+    log.flush_sync()
+    # The process dies halfway through writing a record.
+    with open(segments(directory)[0], "ab") as f:
+        f.write(encode_outcome(outcome(1))[:RECORD_SIZE // 2])
+
+    log = EventLog(directory)
+    log.append(outcome(2))
+    log.flush_sync()
+    assert [os.path.basename(path) for path in segments(directory)] == ["events-000001.log", "events-000002.log"]
+    assert list(read_outcomes(directory)) == [outcome(0), outcome(2)]
+
+
+def test_corrupted_record_ends_its_segment_only(tmp_path):
+    directory = str(tmp_path)
+    log = EventLog(directory, segment_size=3 * RECORD_SIZE)
+    for i in range(6):
+        log.append(outcome(i))
+        log.flush_sync()
+    first = segments(directory)[0]
+    with open(first, "r+b") as f:
+        f.seek(len(SEGMENT_MAGIC) + RECORD_SIZE + 5)
+        f.write(b"\xff\xff")
+    assert list(read_outcomes(directory)) == [outcome(0)] + [outcome(i) for i in range(3, 6)]
+
+
+def test_worker_subdirectories_are_read_too(tmp_path):
+    for shard in range(2):
+        log = EventLog(str(tmp_path / f"shard{shard}"))
+        log.append(outcome(shard))
+        log.flush_sync()
+    assert sorted(read_outcomes(str(tmp_path))) == [outcome(0), outcome(1)]
+
+
+def test_background_flush_and_close(tmp_path):
+    async def test():
+        log = EventLog(str(tmp_path), interval=60, max_buffer=4 * RECORD_SIZE)
+        log.start()
+        for i in range(4):
+            log.append(outcome(i))
+        # A full buffer is written without waiting for the interval.
+        await asyncio.sleep(0.05)
+        assert len(list(read_outcomes(str(tmp_path)))) == 4
+        log.append(outcome(4))
+        await log.close()
+        assert list(read_outcomes(str(tmp_path))) == [outcome(i) for i in range(5)]
+
+    asyncio.run(test())
+
+
+def test_aggregator_folds_in_order_and_survives_errors():
+    async def test():
+        folded = []
+
+        async def fold(item):
+            if item == 3:
+                raise ValueError(item)
+            await asyncio.sleep(0)
+            folded.append(item)
+
+        aggregator = Aggregator(fold)
+        aggregator.submit(0)
+        aggregator.start()
+        for item in range(1, 6):
+            aggregator.submit(item)
+        await asyncio.sleep(0.01)
+        aggregator.submit(6)
+        await aggregator.close()
+        assert folded == [0, 1, 2, 4, 5, 6]
+        assert not aggregator.pending
+
+    asyncio.run(test())
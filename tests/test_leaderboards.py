@@ -0,0 +1,61 @@
+import itertools
+import random
+
+from leaderboards import TopK
+
+
+def test_keeps_the_highest_values_in_order():
+    board = TopK(limit=3)
+    for user_id, value in (("a", 1), ("b", 5), ("c", 3), ("d", 4)):
+        board.update(user_id, value)
+    assert board.items() == [("b", 5), ("d", 4), ("c", 3)]
+    assert "a" not in board
+    # A player already on the board moves up instead of being added twice.
+    assert board.update("c", 6)
+    assert board.items() == [("c", 6), ("b", 5), ("d", 4)]
+
+
+def test_unchanged_or_too_low_updates_are_refused():
+    board = TopK(limit=2)
+    assert board.update("a", 5)
+    assert not board.update("a", 5)
+    assert board.update("b", 3)
+    assert not board.update("c", 3)
+    assert not board.update("c", 1)
+    assert board.items() == [("a", 5), ("b", 3)]
+
+
+def test_ties_rank_whoever_got_there_first_higher():
+    board = TopK(limit=3)
+    board.update("a", 2)
+    board.update("b", 2)
+    board.update("c", 1)
+    board.update("c", 2)
+    assert board.items() == [("a", 2), ("b", 2), ("c", 2)]
+
+
+def test_seed_and_clear():
+    board = TopK(limit=2)
+    board.seed([("a", 1), ("b", 3), ("c", 2)])
+    assert board.items() == [("b", 3), ("c", 2)]
+    board.clear()
+    assert board.items() == []
+    assert "b" not in board
+
+
+def test_matches_sorting_every_player():
+    # Values only ever grow, the way wins, best scores and daily totals do.
+    rng = random.Random(3)
+    board = TopK(limit=10)
+    values = {}
+    reached = {}
+    order = itertools.count()
+    for _ in range(3000):
+        user_id = str(rng.randrange(100))
+        value = values.get(user_id, 0) + rng.choice((0, 0, 1, 1, 2, 5))
+        if value != values.get(user_id):
+            reached[user_id] = next(order)
+        values[user_id] = value
+        board.update(user_id, value)
+        expected = sorted(values, key=lambda user_id: (-values[user_id], reached[user_id]))[:10]
+        assert board.items() == [(user_id, values[user_id]) for user_id in expected]
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+
+from game_state import GameState
+from game_store import MemoryGameStore
+from snapshot import FILE_HEADER, GameJournal
+
+
+def new_game(chat_id=1):
+    game = GameState(chat_id)
+    game.add_message(10)
+    return game
+
+
+def add_point(game):
+    game.score += 1
+    return True
+
+
+def test_restore_after_a_crash_mid_journal(tmp_path):
+    path = str(tmp_path / "games.snapshot")
+
+    async def crash():
+        store = MemoryGameStore(60, path)
+        for user_id in ("1", "2", "3"):
+            await store.save(user_id, new_game(int(user_id)))
+        await store._write_journal()
+        await store.update("2", add_point)
+        await store._write_journal()
+        await store.delete("3")
+        await store._write_journal()
+        # No close(): the process dies while the last entry is being written.
+        with open(store.journal.journal_path, "r+b") as f:
+            f.truncate(os.path.getsize(store.journal.journal_path) - 3)
+
+    asyncio.run(crash())
+
+    async def restart():
+        store = MemoryGameStore(60, path)
+        assert sorted(store.games) == ["1", "2", "3"]
+        assert store.games["2"].score == 1
+        assert not store.overdue
+        await store.save("4", new_game(4))
+        await store._write_journal()
+
+    asyncio.run(restart())
+    assert sorted(MemoryGameStore(60, path).games) == ["1", "2", "3", "4"]
+
+
+def test_refresh_without_change_is_journaled(tmp_path):
+    path = str(tmp_path / "games.snapshot")
+
+    async def test():
+        store = MemoryGameStore(60, path)
+        await store.save("1", new_game())
+        await asyncio.sleep(0.05)
+        refreshed_at = time.time()
+        game, result = await store.update("1", lambda game: False)
+        assert result is False
+        await store._write_journal()
+        return refreshed_at
+
+    refreshed_at = asyncio.run(test())
+    _, deadline = GameJournal(path).load()["1"]
+    assert deadline >= refreshed_at + 60
+
+
+def test_overdue_games_are_expired_after_restore(tmp_path):
+    path = str(tmp_path / "games.snapshot")
+    journal = GameJournal(path)
+    journal.load()
+    journal.record_save("1", new_game(), time.time() - 5)
+    journal.record_save("2", new_game(2), time.time() + 600)
+    journal.write_journal(journal.take_pending())
+
+    async def test():
+        store = MemoryGameStore(60, path)
+        assert store.overdue == ["1"]
+        expired = []
+
+        async def on_expired(games):
+            expired.extend(games)
+
+        expiry = asyncio.create_task(store.run_expiry(on_expired))
+        await asyncio.sleep(0.01)
+        expiry.cancel()
+        assert [game.chat_id for game in expired] == [1]
+        assert sorted(store.games) == ["2"]
+
+    asyncio.run(test())
+
+
+def test_close_stops_the_journal_before_the_final_snapshot(tmp_path):
+    path = str(tmp_path / "games.snapshot")
+
+    async def test():
+        store = MemoryGameStore(60, path, journal_interval=0.001, snapshot_interval=0.005)
+        store.start()
+        task = store._task
+        for i in range(50):
+            await store.save(str(i), new_game(i))
+            await asyncio.sleep(0.001)
+        await store.close()
+        assert task.done()
+        # Nothing is written behind the final snapshot.
+        await asyncio.sleep(0.02)
+        assert os.path.getsize(store.journal.journal_path) == FILE_HEADER.size
+
+    asyncio.run(test())
+    assert len(MemoryGameStore(60, path).games) == 50
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("hydrogram")
+
+from hydrogram.errors import FloodWait, MessageNotModified
+
+from outbox import EditScheduler
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+        self.errors = {}
+        self.gate = None
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.calls.append((chat_id, message_id, text, time.monotonic()))
+        if self.gate is not None:
+            await self.gate.wait()
+        errors = self.errors.get((chat_id, message_id))
+        if errors:
+            raise errors.pop(0)
+        return f"{chat_id}/{message_id}: {text}"
+
+    def texts(self, chat_id=None):
+        return [text for chat, _, text, _ in self.calls if chat_id is None or chat == chat_id]
+
+
+def test_edits_queued_behind_one_in_flight_are_coalesced():
+    async def test():
+        outbox = EditScheduler()
+        outbox.start()
+        client = FakeClient()
+        client.gate = asyncio.Event()
+        first = asyncio.create_task(outbox.edit_and_wait(client, 1, 10, text="1"))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(outbox.edit_and_wait(client, 1, 10, text=text)) for text in "234"]
+        await asyncio.sleep(0.01)
+        client.gate.set()
+        assert await first == "1/10: 1"
+        # Every edit that was replaced gets the result of the one sent.
+        assert await asyncio.gather(*waiters) == ["1/10: 4"] * 3
+        assert client.texts() == ["1", "4"]
+        assert outbox.coalesced == 2
+        await outbox.close()
+
+    asyncio.run(test())
+
+
+def test_flood_wait_pauses_only_that_chat():
+    async def test():
+        outbox = EditScheduler()
+        outbox.start()
+        client = FakeClient()
+        client.errors[(1, 10)] = [FloodWait(value=1)]
+        started = time.monotonic()
+        flooded = asyncio.create_task(outbox.edit_and_wait(client, 1, 10, text="a"))
+        await asyncio.sleep(0.05)
+        assert await outbox.edit_and_wait(client, 2, 20, text="b") == "2/20: b"
+        assert not flooded.done()
+        assert await flooded == "1/10: a"
+        retried_at = [at for chat, _, _, at in client.calls if chat == 1][-1]
+        assert retried_at - started >= 1
+        assert outbox.flood_waits == 1
+        await outbox.close()
+
+    asyncio.run(test())
+
+
+def test_edit_superseding_a_flood_waited_one_is_sent_once():
+    async def test():
+        outbox = EditScheduler()
+        outbox.start()
+        client = FakeClient()
+        client.errors[(1, 10)] = [FloodWait(value=1)]
+        old = asyncio.create_task(outbox.edit_and_wait(client, 1, 10, text="old"))
+        await asyncio.sleep(0.05)
+        new = asyncio.create_task(outbox.edit_and_wait(client, 1, 10, text="new"))
+        assert await asyncio.gather(old, new) == ["1/10: new"] * 2
+        assert client.texts() == ["old", "new"]
+        await outbox.close()
+
+    asyncio.run(test())
+
+
+def test_failed_edits_reach_the_waiter():
+    async def test():
+        outbox = EditScheduler(max_retries=2, base_backoff=0.01)
+        outbox.start()
+        client = FakeClient()
+        client.errors[(1, 10)] = [OSError("reset")] * 3
+        client.errors[(2, 11)] = [ValueError("bad request")]
+        client.errors[(3, 12)] = [MessageNotModified()]
+        with pytest.raises(OSError):
+            await outbox.edit_and_wait(client, 1, 10, text="a")
+        with pytest.raises(ValueError):
+            await outbox.edit_and_wait(client, 2, 11, text="b")
+        assert await outbox.edit_and_wait(client, 3, 12, text="c") is None
+        assert client.texts() == ["a", "a", "a", "b", "c"]
+        await outbox.close()
+
+    asyncio.run(test())
+
+
+def test_edits_before_start_and_after_close():
+    async def test():
+        outbox = EditScheduler()
+        client = FakeClient()
+        # Nothing runs the queue yet: waiting for an edit sends it directly.
+        queued = outbox.edit(client, 1, 10, text="queued")
+        assert await outbox.edit_and_wait(client, 1, 11, text="direct") == "1/11: direct"
+        assert client.texts() == ["direct"]
+
+        outbox.start()
+        await asyncio.sleep(0.05)
+        assert client.texts() == ["direct", "queued"]
+        assert not queued.waiters
+
+        outbox.edit(client, 2, 20, text="flushed")
+        await outbox.close()
+        assert client.texts()[-1] == "flushed"
+
+        # An edit still queued when close() gave up is replaced by a direct one.
+        outbox.edit(client, 1, 10, text="stale")
+        assert await outbox.edit_and_wait(client, 1, 10, text="fresh") == "1/10: fresh"
+        assert client.texts()[-1] == "fresh"
+        assert not outbox.pending
+
+    asyncio.run(test())
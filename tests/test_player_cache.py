@@ -0,0 +1,122 @@
+import asyncio
+
+from player_cache import PlayerCache
+
+
+class Storage:
+    def __init__(self, records=None):
+        self.records = records or {}
+        self.loads = 0
+
+    def load(self, keys):
+        self.loads += 1
+        return {key: dict(self.records[key]) for key in keys if key in self.records}
+
+
+def test_evicts_coldest_players_over_capacity():
+    async def test():
+        cache = PlayerCache(Storage({str(i): {"games_played": i} for i in range(5)}).load, capacity=2)
+        for i in range(5):
+            await cache.prefetch([str(i)])
+        assert list(cache.entries) == ["3", "4"]
+        assert cache.evictions == 3
+
+    asyncio.run(test())
+
+
+def test_new_player_is_kept_while_everything_else_is_pinned():
+    dirty = set()
+    cache = PlayerCache(Storage().load, capacity=2, pinned=lambda key: key in dirty)
+    for i in range(5):
+        key = str(i)
+        cache[key] = {"games_played": 0}
+        # Changed right after being added, the way update_player_stats() does.
+        cache[key]["games_played"] += 1
+        dirty.add(key)
+    assert len(cache) == 5
+    assert all(cache[str(i)]["games_played"] == 1 for i in range(5))
+
+
+def test_prefetched_players_survive_a_larger_load_finishing_first():
+    async def test():
+        storage = Storage({str(i): {"games_played": i} for i in range(20)})
+        cache = PlayerCache(storage.load, capacity=3)
+        seen = {}
+
+        async def use(keys):
+            await cache.prefetch(keys)
+            # No await between the prefetch and the reads.
+            seen.update({key: cache[key]["games_played"] for key in keys})
+
+        await asyncio.gather(*(use([str(i), str(i + 10)]) for i in range(10)))
+        assert seen == {str(i): i for i in range(20)}
+
+    asyncio.run(test())
+
+
+def test_small_cache_keeps_every_update():
+    # Many players changing through a cache far smaller than the number of
+    # players; every change has to reach storage.
+    async def test():
+        storage = Storage()
+        dirty = set()
+        cache = PlayerCache(storage.load, capacity=4, pinned=lambda key: key in dirty)
+
+        async def play(key):
+            stats = await cache.fetch(key)
+            if stats is None:
+                stats = cache[key] = {"games_played": 0}
+            dirty.add(key)
+            stats["games_played"] += 1
+
+        async def flush():
+            for key in list(dirty):
+                storage.records[key] = dict(cache[key])
+                dirty.discard(key)
+
+        for _ in range(3):
+            await asyncio.gather(*(play(str(i)) for i in range(50)))
+            await flush()
+        assert {key: record["games_played"] for key, record in storage.records.items()} == {str(i): 3 for i in range(50)}
+
+    asyncio.run(test())
+
+
+def test_fetch_loads_on_a_miss():
+    async def test():
+        storage = Storage({"1": {"games_played": 3}})
+        cache = PlayerCache(storage.load, capacity=10)
+        assert (await cache.fetch("1"))["games_played"] == 3
+        assert await cache.fetch("2") is None
+        # Both are cached now, the unknown player included.
+        assert (await cache.fetch("1"))["games_played"] == 3
+        assert await cache.fetch("2") is None
+        assert storage.loads == 2
+        assert cache.peek("1") == {"games_played": 3}
+        assert cache.peek("2") is None
+
+    asyncio.run(test())
+
+
+def test_concurrent_fetches_share_loads():
+    async def test():
+        storage = Storage({str(i): {"games_played": i} for i in range(30)})
+        cache = PlayerCache(storage.load, capacity=100)
+        records = await asyncio.gather(*(cache.fetch(str(i)) for i in range(30)))
+        assert [record["games_played"] for record in records] == list(range(30))
+        assert storage.loads <= 2
+
+    asyncio.run(test())
+
+
+def test_fetch_many_returns_more_players_than_fit():
+    async def test():
+        storage = Storage({str(i): {"games_played": i} for i in range(10)})
+        cache = PlayerCache(storage.load, capacity=3)
+        players = await cache.fetch_many(str(i) for i in range(12))
+        assert players == {str(i): {"games_played": i} for i in range(10)}
+        # Trimmed back to capacity by the next player added.
+        cache["new"] = {"games_played": 0}
+        assert len(cache.entries) == 3
+
+    asyncio.run(test())
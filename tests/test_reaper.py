@@ -0,0 +1,92 @@
+import asyncio
+import random
+import time
+
+from reaper import TimerWheel, gather_bounded
+
+
+def test_keys_expire_once_their_timeout_passed():
+    now = time.monotonic()
+    wheel = TimerWheel(10, resolution=1.0)
+    wheel.touch("a", now=now)
+    wheel.touch("b", now=now + 3)
+    assert wheel.expire(now + 5) == []
+    assert wheel.expire(now + 11.5) == ["a"]
+    assert wheel.expire(now + 14.5) == ["b"]
+    assert len(wheel) == 0
+
+
+def test_touch_pushes_the_deadline_back():
+    now = time.monotonic()
+    wheel = TimerWheel(10)
+    wheel.touch("a", now=now)
+    wheel.touch("a", now=now + 8)
+    assert wheel.expire(now + 12) == []
+    assert "a" in wheel
+    assert wheel.expire(now + 19.5) == ["a"]
+
+
+def test_discarded_keys_never_expire():
+    now = time.monotonic()
+    wheel = TimerWheel(10)
+    wheel.touch("a", now=now)
+    wheel.discard("a")
+    wheel.discard("missing")
+    assert wheel.expire(now + 30) == []
+    assert wheel.deadline("a") is None
+
+
+def test_nothing_is_lost_after_a_long_stall():
+    now = time.monotonic()
+    wheel = TimerWheel(5, resolution=0.5)
+    keys = [str(i) for i in range(100)]
+    for i, key in enumerate(keys):
+        wheel.touch(key, now=now + i * 0.1)
+    # Far more than one revolution of the wheel later.
+    assert sorted(wheel.expire(now + 1000)) == sorted(keys)
+    assert len(wheel) == 0
+
+
+def test_matches_a_plain_deadline_dict():
+    rng = random.Random(4)
+    start = time.monotonic()
+    wheel = TimerWheel(3, resolution=0.25)
+    deadlines = {}
+    now = start
+    for _ in range(5000):
+        now += rng.random() * 0.3
+        key = rng.randrange(50)
+        if rng.random() < 0.1:
+            wheel.discard(key)
+            deadlines.pop(key, None)
+        else:
+            wheel.touch(key, now=now)
+            deadlines[key] = now + 3
+        expired = wheel.expire(now)
+        for key in expired:
+            assert deadlines.pop(key) <= now
+        # Never later than one tick after the deadline.
+        assert all(deadline > now - 0.25 for deadline in deadlines.values())
+
+
+def test_gather_bounded_limits_concurrency():
+    async def test():
+        running = 0
+        peak = 0
+
+        async def job(i):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.001)
+            running -= 1
+            if i == 3:
+                raise ValueError(i)
+            return i
+
+        results = await gather_bounded([job(i) for i in range(20)], 4)
+        assert peak == 4
+        assert isinstance(results[3], ValueError)
+        assert [result for i, result in enumerate(results) if i != 3] == [i for i in range(20) if i != 3]
+
+    asyncio.run(test())
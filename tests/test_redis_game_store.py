@@ -0,0 +1,176 @@
+import asyncio
+import time
+
+import pytest
+
+from game_state import GameState
+from game_store import GameStoreConflict, RedisGameStore
+from resp_server import RespServer
+
+
+def run_with_server(test):
+    async def main():
+        server = RespServer()
+        port = await server.start(port=0)
+        stores = []
+
+        def open_store(timeout=60):
+            store = RedisGameStore(f"redis://127.0.0.1:{port}/0", timeout)
+            stores.append(store)
+            return store
+
+        try:
+            await test(server, open_store)
+        finally:
+            for store in stores:
+                await store.close()
+            await server.close()
+
+    asyncio.run(main())
+
+
+def new_game(chat_id=1):
+    game = GameState(chat_id)
+    game.add_message(10)
+    return game
+
+
+def add_point(game):
+    game.score += 1
+    return True
+
+
+def test_concurrent_updates_from_two_instances_all_apply():
+    async def test(server, open_store):
+        first, second = open_store(), open_store()
+        await first.save("1", new_game())
+        await asyncio.gather(*(store.update("1", add_point) for store in (first, second) for _ in range(50)))
+        game = await first.get("1")
+        assert game.score == 100
+
+    run_with_server(test)
+
+
+def test_update_of_missing_game():
+    async def test(server, open_store):
+        store = open_store()
+        assert await store.update("1", add_point) == (None, None)
+
+    run_with_server(test)
+
+
+def test_update_retries_after_a_conflict():
+    async def test(server, open_store):
+        store = open_store()
+        await store.save("1", new_game())
+        key = store._key("1").encode()
+        calls = []
+
+        def add_point_once_raced(game):
+            calls.append(game.score)
+            if len(calls) == 1:
+                # Another instance writes the game between WATCH and EXEC.
+                server._changed(key)
+            return add_point(game)
+
+        await store.update("1", add_point_once_raced)
+        assert calls == [0, 0]
+        assert (await store.get("1")).score == 1
+
+    run_with_server(test)
+
+
+def test_update_gives_up_after_max_retries():
+    async def test(server, open_store):
+        store = open_store()
+        store.max_retries = 3
+        await store.save("1", new_game())
+        key = store._key("1").encode()
+        calls = []
+
+        def always_raced(game):
+            calls.append(game.score)
+            server._changed(key)
+            return add_point(game)
+
+        with pytest.raises(GameStoreConflict):
+            await store.update("1", always_raced)
+        assert len(calls) == 3
+        assert (await store.get("1")).score == 0
+
+    run_with_server(test)
+
+
+def test_active_count_follows_saves_and_deletes():
+    async def test(server, open_store):
+        store = open_store()
+        await store.save("1", new_game())
+        await store.save("2", new_game())
+        assert store.active_count() == 2
+        await store.delete("1")
+        await store.delete("2")
+        assert store.active_count() == 0
+
+    run_with_server(test)
+
+
+def test_expired_game_is_claimed_once():
+    async def test(server, open_store):
+        first, second = open_store(timeout=0.05), open_store(timeout=0.05)
+        await first.save("1", new_game(chat_id=7))
+        await first.save("2", new_game(chat_id=8))
+        await asyncio.sleep(0.1)
+        claimed = await asyncio.gather(first._claim_expired(), second._claim_expired())
+        assert sorted(game.chat_id for games in claimed for game in games) == [7, 8]
+        assert await first.get("1") is None
+        assert first.active_count() == 0
+
+    run_with_server(test)
+
+
+def test_refreshed_game_is_not_claimed():
+    async def test(server, open_store):
+        store = open_store(timeout=0.05)
+        await store.save("1", new_game())
+        await asyncio.sleep(0.1)
+        store.timeout = 60
+        await store.update("1", add_point)
+        assert await store._claim_expired() == []
+        assert (await store.get("1")).score == 1
+
+    run_with_server(test)
+
+
+def test_game_refreshed_while_being_claimed_survives():
+    async def test(server, open_store):
+        store, other = open_store(timeout=0.05), open_store(timeout=60)
+        await store.save("1", new_game())
+        await asyncio.sleep(0.1)
+
+        # Another instance's guess lands right after the claim has read the
+        # game and found its deadline due.
+        claim = store._claim
+
+        async def claim_with_guess(connection, user_id, now):
+            execute = connection.execute
+
+            async def execute_then_guess(*commands):
+                replies = await execute(*commands)
+                if commands[0][0] == "WATCH":
+                    await other.update(user_id, add_point)
+                return replies
+
+            connection.execute = execute_then_guess
+            try:
+                return await claim(connection, user_id, now)
+            finally:
+                connection.execute = execute
+
+        store._claim = claim_with_guess
+        assert await store._claim_expired() == []
+        game = await store.get("1")
+        assert game is not None and game.score == 1
+        deadline, = await store.pool.execute(["ZSCORE", store.deadlines, "1"])
+        assert float(deadline) > time.time()
+
+    run_with_server(test)
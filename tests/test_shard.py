@@ -0,0 +1,74 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("hydrogram")
+pytest.importorskip("config")
+
+from callbacks import CATEGORY, CONFIG, DIFFICULTY, GUESS, LEADERBOARD, encode_callback
+from shard import FRAME_HEADER, callback_game_id, pack_frame, read_frame, shard_for
+
+
+def test_users_always_go_to_the_same_worker():
+    # Fixed by crc32, so they hold across processes and restarts.
+    assert [shard_for(user_id, 4) for user_id in ("1", "42", "-1001234567890", "6123456789")] == [3, 0, 1, 1]
+    assert [shard_for(user_id, 7) for user_id in ("1", "42", "-1001234567890", "6123456789")] == [2, 3, 4, 3]
+    assert shard_for(42, 4) == shard_for("42", 4)
+    assert shard_for(-1001234567890, 4) == shard_for("-1001234567890", 4)
+
+
+def test_users_are_spread_evenly():
+    counts = Counter(shard_for(user_id, 4) for user_id in range(100000, 140000))
+    assert sorted(counts) == [0, 1, 2, 3]
+    assert max(counts.values()) - min(counts.values()) < 1000
+
+
+def test_game_id_of_a_button():
+    assert callback_game_id(encode_callback(GUESS, "E", "6123456789")) == 6123456789
+    assert callback_game_id(encode_callback(DIFFICULTY, "animals", "hard", -1001234567890)) == -1001234567890
+    assert callback_game_id(encode_callback(CATEGORY, "animals", "-100123")) == -100123
+    assert callback_game_id("guess_E_-100123") == -100123
+    # Buttons that belong to no game.
+    assert callback_game_id(encode_callback(LEADERBOARD, "wins")) is None
+    assert callback_game_id("config_close") is None
+    assert callback_game_id("garbage") is None
+    assert callback_game_id("") is None
+    assert callback_game_id(encode_callback(CONFIG, "emoji", 42)) == 42
+
+
+def test_frames_round_trip_however_they_arrive():
+    frames = [
+        ["m", "42", "Zoë", -100123, 7, None, "groupplay", []],
+        ["c", "q1", "42", "Ann", 42, 8, encode_callback(GUESS, "E", "42")],
+        [3],
+        ["o", [1.5, 42], "Бо", True],
+    ]
+    data = b"".join(pack_frame(frame) for frame in frames)
+
+    async def read_all(chunk_size):
+        reader = asyncio.StreamReader()
+        for start in range(0, len(data), chunk_size):
+            reader.feed_data(data[start:start + chunk_size])
+        reader.feed_eof()
+        received = []
+        while (frame := await read_frame(reader)) is not None:
+            received.append(frame)
+        return received
+
+    for chunk_size in (1, 3, len(data)):
+        assert asyncio.run(read_all(chunk_size)) == frames
+
+
+def test_frame_cut_short_reads_as_closed():
+    async def read(data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_frame(reader)
+
+    frame = pack_frame(["c", "q1", "42", "Ann", 42, 8, "x"])
+    assert asyncio.run(read(frame[:2])) is None
+    assert asyncio.run(read(frame[:-1])) is None
+    assert asyncio.run(read(b"")) is None
+    assert FRAME_HEADER.unpack(frame[:FRAME_HEADER.size])[0] == len(frame) - FRAME_HEADER.size
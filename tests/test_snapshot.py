@@ -0,0 +1,155 @@
+import os
+
+from game_state import GameState
+from snapshot import FILE_HEADER, GameJournal, decode_game, encode_game
+
+GAME_FIELDS = GameState.__slots__
+
+
+def solo_game():
+    game = GameState(42)
+    game.add_message(100)
+    game.add_message(101)
+    game.setup_stage = "game_started"
+    game.word_index = 7
+    game.guessed_mask = 0b1011
+    game.keyboard_mask = 0b1111
+    game.attempts = 4
+    game.score = -3
+    game.user_name = "Zoë"
+    game.is_daily_challenge = True
+    game.started_at = 1700000000.5
+    game.hints = 2
+    return game
+
+
+def group_game():
+    game = GameState(-1001234567890)
+    game.add_message(5)
+    game.setup_stage = "difficulty_selection"
+    game.players = {"11": ("Ann", 0b10, 1), "12": ("", 0, 0), "-13": ("Бо", 0b110, 0)}
+    return game
+
+
+def fields(game):
+    return {name: getattr(game, name) for name in GAME_FIELDS}
+
+
+def test_game_record_round_trips():
+    for user_id, game in (("42", solo_game()), ("-1001234567890", group_game()), ("1", GameState(1))):
+        data = encode_game(user_id, game, 1700000060.25)
+        decoded_id, decoded, deadline, offset = decode_game(b"xx" + data, 2)
+        assert (decoded_id, deadline, offset) == (user_id, 1700000060.25, len(data) + 2)
+        assert fields(decoded) == fields(game)
+
+
+def test_journal_replays_saves_touches_and_deletes(tmp_path):
+    path = str(tmp_path / "games.snapshot")
+    journal = GameJournal(path)
+    assert journal.load() == {}
+    journal.record_save("42", solo_game(), 100.0)
+    journal.record_save("-1001234567890", group_game(), 200.0)
+    journal.record_touch("42", 150.0)
+    journal.record_delete("-1001234567890")
+    # Touching a game that is gone changes nothing.
+    journal.record_touch("-1001234567890", 300.0)
+    journal.write_journal(journal.take_pending())
+
+    games = GameJournal(path).load()
+    assert list(games) == ["42"]
+    game, deadline = games["42"]
+    assert deadline == 150.0
+    assert fields(game) == fields(solo_game())
+
+
+def test_snapshot_then_journal(tmp_path):
+    path = str(tmp_path / "games.snapshot")
+    journal = GameJournal(path)
+    journal.load()
+    journal.record_save("1", GameState(1), 10.0)
+    generation, data = journal.build_snapshot([("42", solo_game(), 100.0), ("2", GameState(2), 20.0)])
+    # Pending changes are part of the snapshot and dropped.
+    assert journal.take_pending() == b""
+    journal.write_snapshot(generation, data)
+    journal.record_delete("2")
+    journal.write_journal(journal.take_pending())
+
+    restored = GameJournal(path)
+    games = restored.load()
+    assert restored.generation == generation
+    assert sorted(games) == ["42"]
+    assert fields(games["42"][0]) == fields(solo_game())
+
+
+def test_journal_of_an_older_generation_is_ignored(tmp_path):
+    # A crash between writing a snapshot and resetting the journal.
+    path = str(tmp_path / "games.snapshot")
+    journal = GameJournal(path)
+    journal.load()
+    journal.record_save("1", GameState(1), 10.0)
+    journal.write_journal(journal.take_pending())
+    with open(journal.journal_path, "rb") as f:
+        old_journal = f.read()
+    generation, data = journal.build_snapshot([("2", GameState(2), 20.0)])
+    journal.write_snapshot(generation, data)
+    with open(journal.journal_path, "wb") as f:
+        f.write(old_journal)
+
+    assert list(GameJournal(path).load()) == ["2"]
+
+
+def test_torn_journal_tail_is_dropped_and_appended_after(tmp_path):
+    path = str(tmp_path / "games.snapshot")
+    journal = GameJournal(path)
+    journal.load()
+    journal.record_save("1", GameState(1), 10.0)
+    journal.record_save("2", GameState(2), 20.0)
+    journal.write_journal(journal.take_pending())
+    valid_size = os.path.getsize(journal.journal_path)
+    journal.record_save("3", solo_game(), 30.0)
+    journal.write_journal(journal.take_pending())
+    full = open(journal.journal_path, "rb").read()
+
+    for end in range(valid_size, len(full)):
+        with open(journal.journal_path, "wb") as f:
+            f.write(full[:end])
+        restored = GameJournal(path)
+        assert sorted(restored.load()) == ["1", "2"]
+        assert os.path.getsize(journal.journal_path) == restored.journal_size == valid_size
+
+    # What is written after the restart lands right behind the last good entry.
+    restored.record_delete("1")
+    restored.write_journal(restored.take_pending())
+    assert sorted(GameJournal(path).load()) == ["2"]
+
+
+def test_corrupted_entry_stops_replay(tmp_path):
+    path = str(tmp_path / "games.snapshot")
+    journal = GameJournal(path)
+    journal.load()
+    journal.record_save("1", GameState(1), 10.0)
+    journal.write_journal(journal.take_pending())
+    corrupt_at = os.path.getsize(journal.journal_path) + 12
+    journal.record_save("2", GameState(2), 20.0)
+    journal.record_save("3", GameState(3), 30.0)
+    journal.write_journal(journal.take_pending())
+    with open(journal.journal_path, "r+b") as f:
+        f.seek(corrupt_at)
+        byte = f.read(1)
+        f.seek(corrupt_at)
+        f.write(bytes((byte[0] ^ 0xFF,)))
+
+    assert list(GameJournal(path).load()) == ["1"]
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path):
+    path = str(tmp_path / "games.snapshot")
+    journal = GameJournal(path)
+    journal.load()
+    generation, data = journal.build_snapshot([("2", GameState(2), 20.0)])
+    journal.write_snapshot(generation, data[:-1] + bytes((data[-1] ^ 1,)))
+
+    restored = GameJournal(path)
+    assert restored.load() == {}
+    with open(restored.journal_path, "rb") as f:
+        assert len(f.read()) == FILE_HEADER.size
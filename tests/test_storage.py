@@ -0,0 +1,68 @@
+import os
+
+from persistence import io_executor
+from storage import JsonStorage, SqliteStorage
+
+
+
+def wait_for_writes():
+    # Group commits run on the I/O thread, in order.
+    io_executor.submit(lambda: None).result()
+
+def json_storage(directory):
+    return JsonStorage(
+        os.path.join(directory, "players.json"), os.path.join(directory, "daily.json"), os.path.join(directory, "configs.json")
+    )
+
+
+def write_all(storage):
+    storage.write_players({"1": {"name": "Ann", "games_played": 3, "scores": [10, 5], "achievements": ["first_win"]}})
+    storage.write_daily({"1": {"last_played": "2024-01-01", "score": 10, "total_score": 30, "streak": 2}})
+    storage.write_configs({"1": {"lives": ["a", "b", "c"]}})
+    wait_for_writes()
+
+
+def test_json_loaders_hand_out_copies(tmp_path):
+    storage = json_storage(str(tmp_path))
+    write_all(storage)
+
+    players = storage.load_players(["1"])
+    daily = storage.load_daily()
+    configs = storage.load_configs()
+    assert players["1"] is not storage.players.document["1"]
+    assert daily is not storage.daily.document and daily["1"] is not storage.daily.document["1"]
+    assert configs is not storage.configs.document and configs["1"] is not storage.configs.document["1"]
+
+    players["1"]["scores"].append(99)
+    daily["1"]["score"] = 99
+    daily["2"] = {"last_played": "2024-01-01", "score": 1, "total_score": 1, "streak": 1}
+    configs["1"]["lives"][0] = "x"
+    assert storage.load_players(["1"])["1"]["scores"] == [10, 5]
+    assert storage.daily.document == {"1": {"last_played": "2024-01-01", "score": 10, "total_score": 30, "streak": 2}}
+    assert storage.configs.document == {"1": {"lives": ["a", "b", "c"]}}
+
+
+def test_json_records_survive_a_reload(tmp_path):
+    write_all(json_storage(str(tmp_path)))
+    storage = json_storage(str(tmp_path))
+    assert storage.load_players(["1", "2"]) == {
+        "1": {"name": "Ann", "games_played": 3, "scores": [10, 5], "achievements": ["first_win"]}
+    }
+    assert storage.load_daily()["1"]["total_score"] == 30
+    assert storage.load_configs() == {"1": {"lives": ["a", "b", "c"]}}
+
+
+def test_sqlite_loaders_return_what_was_written(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "hangman.db"))
+    try:
+        storage.write_players({"1": storage.encode_player({
+            "name": "Ann", "games_played": 3, "games_won": 1, "total_score": 15, "guessed_letters": 4,
+            "solved_words": 1, "streak": 1, "last_played": None, "achievements": ["first_win"], "scores": [10, 5],
+        })})
+        storage.write_daily({"1": {"last_played": "2024-01-01", "score": 10, "total_score": 30, "streak": 2}})
+        storage.write_configs({"1": {"lives": ["a", "b", "c"]}})
+        assert storage.load_players(["1"])["1"]["scores"] == [10, 5]
+        assert storage.load_daily() == {"1": {"last_played": "2024-01-01", "score": 10, "total_score": 30, "streak": 2}}
+        assert storage.load_configs() == {"1": {"lives": ["a", "b", "c"]}}
+    finally:
+        storage.close()
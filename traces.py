@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import gzip
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter, defaultdict
+
+from callbacks import (
+    CALLBACK_FIELDS, CATEGORY, CONFIG, CONFIRM_RESET, DAILY, DIFFICULTY, GUESS, HINT, LEADERBOARD, PLAY_AGAIN,
+    SET_EMOJI, SET_EMOJI_LEGACY, STATS, USED, decode_callback, encode_callback
+)
+from codec import codec
+from metrics import REGISTRY, Gauge
+from persistence import run_io
+
+
+# An update trace is a gzip file of compact JSON lines. A header line
+#   {"version": 1, "started_at": <unix time>}
+# starts each recording session, and every update that follows is
+#   [milliseconds since the previous update (or the header), *shard frame]
+# with the frames shard.py forwards to its workers, less command arguments.
+# Sessions appended to the same file are replayed one after the other,
+# keeping the gap between them.
+#
+# Users are anonymized while recording: ids are replaced by sequential ones
+# (negative for group chats), names by "Player <id>" and callback query ids by
+# a counter, and the user ids inside callback data are rewritten to match.
+TRACE_VERSION = 1
+FIRST_USER_ID = 1_000_000
+
+BUTTON_NAMES = {
+    DAILY: "daily", GUESS: "guess", HINT: "hint", USED: "used", CATEGORY: "category", DIFFICULTY: "difficulty",
+    STATS: "stats", CONFIG: "config", CONFIRM_RESET: "confirm_reset", SET_EMOJI: "set_emoji",
+    SET_EMOJI_LEGACY: "set_emoji", LEADERBOARD: "leaderboard", PLAY_AGAIN: "play_again",
+}
+
+
+class TraceRecorder:
+    def __init__(self, path, interval=1.0, max_buffer=1000):
+        self.path = path
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.aliases = {}
+        self._users = itertools.count(FIRST_USER_ID)
+        self._groups = itertools.count(FIRST_USER_ID)
+        self._queries = itertools.count(1)
+        self.lines = [codec.dumps({"version": TRACE_VERSION, "started_at": time.time()})]
+        self.recorded = 0
+        self._started = time.monotonic()
+        self._elapsed = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    def alias(self, real_id):
+        real_id = int(real_id)
+        alias = self.aliases.get(real_id)
+        if alias is None:
+            alias = self.aliases[real_id] = next(self._users) if real_id > 0 else -next(self._groups)
+        return alias
+
+    def anonymize_callback(self, data):
+        decoded = decode_callback(data)
+        if decoded is None:
+            return ""
+        opcode, args = decoded
+        fields = CALLBACK_FIELDS.get(opcode)
+        if fields is None:
+            # Legacy buttons that the current format has no opcode for.
+            return ""
+        try:
+            return encode_callback(opcode, *(
+                self.alias(value) if kind == "user" else value for kind, value in zip(fields, args)
+            ))
+        except (TypeError, ValueError):
+            return ""
+
+    def anonymize(self, frame):
+        if frame[0] == "m":
+            # Command arguments are left out: they are whatever users typed.
+            _, user_id, _, chat_id, message_id, quote, command = frame[:7]
+            user_id = self.alias(user_id)
+            return ["m", user_id, f"Player {user_id}", self.alias(chat_id), message_id, quote, command]
+        _, _, user_id, _, chat_id, message_id, data = frame
+        user_id = self.alias(user_id)
+        return [
+            "c", str(next(self._queries)), user_id, f"Player {user_id}",
+            self.alias(chat_id) if chat_id is not None else None, message_id, self.anonymize_callback(data)
+        ]
+
+    def record(self, frame):
+        # Rounded against the session start rather than the previous update,
+        # so that rounding errors do not add up over a burst.
+        elapsed = round((time.monotonic() - self._started) * 1000)
+        delay, self._elapsed = elapsed - self._elapsed, elapsed
+        self.lines.append(codec.dumps([delay, *self.anonymize(frame)]))
+        self.recorded += 1
+        if len(self.lines) >= self.max_buffer:
+            self._wakeup.set()
+
+    def _write(self, lines):
+        # Runs on the I/O thread. Every flush appends a gzip member of its own,
+        # so a crash loses at most the last one.
+        with gzip.open(self.path, "ab") as f:
+            f.write(b"\n".join(lines) + b"\n")
+
+    async def flush(self):
+        if self.lines:
+            lines, self.lines = self.lines, []
+            try:
+                await run_io(self._write, lines)
+            except OSError as e:
+                print(f"Error writing update trace: {e}")
+                self.lines[:0] = lines
+
+    def flush_sync(self):
+        if self.lines:
+            lines, self.lines = self.lines, []
+            self._write(lines)
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+def read_trace(path):
+    # Yields (seconds since the start of the first session, frame). A member
+    # torn by a crash ends the trace.
+    first_start = None
+    offset = 0.0
+    with gzip.open(path, "rb") as f:
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = codec.loads(line)
+                if isinstance(record, dict):
+                    if record.get("version") != TRACE_VERSION:
+                        raise ValueError(f"Unsupported trace version {record.get('version')}")
+                    if first_start is None:
+                        first_start = record["started_at"]
+                    offset = max(offset, record["started_at"] - first_start)
+                    continue
+                offset += record[0] / 1000
+                yield offset, record[1:]
+        except (EOFError, zlib.error, gzip.BadGzipFile, codec.DecodeError):
+            print(f"Trace {path} ends with a damaged record, stopping there")
+
+
+def update_kind(frame):
+    if frame[0] == "m":
+        return f"/{frame[6]}"
+    decoded = decode_callback(frame[6])
+    return f"button {BUTTON_NAMES[decoded[0]] if decoded else 'expired'}"
+
+
+def describe(path):
+    kinds = Counter()
+    users = set()
+    per_second = Counter()
+    duration = 0.0
+    for offset, frame in read_trace(path):
+        kinds[update_kind(frame)] += 1
+        users.add(frame[1] if frame[0] == "m" else frame[2])
+        per_second[int(offset)] += 1
+        duration = offset
+    total = sum(kinds.values())
+    print(f"{total} updates from {len(users)} users over {duration:.1f}s")
+    if per_second:
+        peak_second, peak = per_second.most_common(1)[0]
+        print(f"busiest second: {peak} updates at {peak_second}s")
+    for kind, count in kinds.most_common():
+        print(f"  {kind:<28} {count:>8}")
+
+
+class GaugeSampler:
+    # Keeps the highest value every gauge reached while the replay ran.
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peaks = {}
+
+    def sample(self):
+        for gauge in REGISTRY:
+            if isinstance(gauge, Gauge):
+                for label_value, value in gauge.values().items():
+                    key = gauge.name if label_value is None else f"{gauge.name}[{label_value}]"
+                    self.peaks[key] = max(self.peaks.get(key, value), value)
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+
+async def replay(args):
+    # Imported here: bench.prepare_environment() has to run before Hangman
+    # reads its settings.
+    import Hangman as hangman
+    from bench import FakeClient, lift_telegram_limits, percentile
+    from metrics import summary
+    from shard import dispatch
+
+    client = FakeClient(args.latency)
+    # dispatch() hands the handlers hangman.app as their client.
+    hangman.app = client
+    if not args.telegram_limits:
+        lift_telegram_limits(hangman.outbox)
+    await hangman.on_startup()
+
+    latencies = defaultdict(list)
+    late = []
+    in_flight = set()
+    peak_in_flight = 0
+    sampler = GaugeSampler()
+    sampling = asyncio.create_task(sampler.run())
+
+    async def handle(frame, kind):
+        start = time.perf_counter()
+        await dispatch(hangman, frame)
+        latencies[kind].append(time.perf_counter() - start)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for offset, frame in read_trace(args.trace):
+        due = start + offset / args.speed
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        late.append(max(0.0, loop.time() - due))
+        task = asyncio.create_task(handle(frame, update_kind(frame)))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        peak_in_flight = max(peak_in_flight, len(in_flight))
+    if in_flight:
+        await asyncio.wait(in_flight)
+    elapsed = loop.time() - start
+
+    start = time.perf_counter()
+    await hangman.on_shutdown()
+    drain = time.perf_counter() - start
+    sampling.cancel()
+    sampler.sample()
+
+    updates = sum(len(values) for values in latencies.values())
+    print(f"{updates} updates replayed at {args.speed:g}x in {elapsed:.2f}s ({updates / max(elapsed, 1e-9):.0f} updates/s)")
+    print(f"dispatched late: p50 {percentile(late, 0.5) * 1000 if late else 0:.1f}ms, max {max(late, default=0) * 1000:.1f}ms; "
+          f"{peak_in_flight} updates in flight at most; final flush {drain:.2f}s")
+    print(f"{'update':<28} {'count':>8} {'p50':>9} {'p99':>9} {'max':>9}")
+    for kind, values in sorted(latencies.items(), key=lambda item: -len(item[1])):
+        print(
+            f"{kind:<28} {len(values):>8} {percentile(values, 0.5) * 1000:>7.2f}ms "
+            f"{percentile(values, 0.99) * 1000:>7.2f}ms {max(values) * 1000:>7.2f}ms"
+        )
+    print("\npeaks during the replay")
+    for name, value in sorted(sampler.peaks.items()):
+        print(f"  {name} {value}")
+    print(f"\n{summary()}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and replay recorded update traces.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="summarize a trace")
+    info.add_argument("trace")
+    play = commands.add_parser("replay", help="feed a trace to the handlers with a fake client")
+    play.add_argument("trace")
+    play.add_argument("--speed", type=float, default=1.0, help="1 replays in real time, 10 ten times faster")
+    play.add_argument("--latency", type=float, default=0.0, help="seconds each fake API call takes")
+    play.add_argument("--storage", choices=("sqlite", "json"), default="sqlite")
+    play.add_argument("--game-store", choices=("memory", "redis"), default="memory")
+    play.add_argument("--telegram-limits", action="store_true", help="keep the outbox's Telegram rate limits")
+    play.add_argument("--keep", action="store_true", help="keep the data directory")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.trace = os.path.abspath(args.trace)
+    if args.command == "info":
+        describe(args.trace)
+        return
+    if args.speed <= 0:
+        print("Error: --speed must be positive")
+        sys.exit(1)
+
+    from bench import prepare_environment
+
+    directory = tempfile.mkdtemp(prefix="hangman-replay-")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    prepare_environment(directory, args.storage, args.game_store)
+    try:
+        asyncio.run(replay(args))
+    finally:
+        if args.keep:
+            print(f"Data left in {directory}")
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import random
+from collections import namedtuple
+
+from word_list import WORDS
+
+
+# Keyboard order: the space sorts before the letters, as sorted() did before.
+ALPHABET = " ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+LETTER_BITS = {letter: 1 << i for i, letter in enumerate(ALPHABET)}
+BIT_LETTERS = {bit: letter for letter, bit in LETTER_BITS.items()}
+ALL_LETTERS_MASK = (1 << len(ALPHABET)) - 1
+DIFFICULTIES = ("easy", "medium", "hard")
+
+WordEntry = namedtuple("WordEntry", "index word category difficulty mask unique_letters length")
+
+
+def letters_mask(letters):
+    mask = 0
+    for letter in letters:
+        mask |= LETTER_BITS[letter]
+    return mask
+
+
+def letters_in(mask):
+    letters = []
+    while mask:
+        bit = mask & -mask
+        letters.append(BIT_LETTERS[bit])
+        mask ^= bit
+    return letters
+
+
+def count_letters(mask):
+    return bin(mask).count("1")
+
+
+def build_word_index(words):
+    table = []
+    index = {}
+    for category, by_difficulty in words.items():
+        index[category] = {}
+        for difficulty, category_words in by_difficulty.items():
+            entries = []
+            for word in category_words:
+                mask = letters_mask(word)
+                entry = WordEntry(len(table), word, category, difficulty, mask, count_letters(mask), len(word))
+                table.append(entry)
+                entries.append(entry)
+            index[category][difficulty] = tuple(entries)
+    return tuple(table), index
+
+
+WORD_TABLE, WORD_INDEX = build_word_index(WORDS)
+CATEGORIES = tuple(WORD_INDEX)
+
+
+def random_entry(category, difficulty, rng=random):
+    return rng.choice(WORD_INDEX[category][difficulty])